@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_credentials.py
+#
+# 凭据库启动耗时：在本地 Mock ThingsBoard 上创建 N 台设备，比较
+#   逐台顺序取 Token (旧方式) -> 凭据库为空 (并发取回) -> 有效期内 (0 请求) -> 全部过期 (并发验证)
+#   -> 部分 Token 在服务端被重置 (只重新取回无效的)
+# 并统计多个线程同时读取凭据库的速度。
+#
+#   python benchmarks/bench_credentials.py --devices 1000 --workers 32 --latency 20
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_tb import start_mock  # noqa: E402
+from tb_client import TBClient  # noqa: E402
+from tb_credentials import CredentialRefresher, CredentialStore  # noqa: E402
+
+parser = argparse.ArgumentParser(description='凭据库启动耗时')
+parser.add_argument('--devices', type=int, default=1000)
+parser.add_argument('--workers', type=int, default=32)
+parser.add_argument('--reset', type=int, default=50, help='服务端被重置 Token 的设备数')
+parser.add_argument('--readers', type=int, default=8, help='并发读取线程数')
+parser.add_argument('--latency', type=float, default=20, help='模拟的服务器往返时间 (毫秒)')
+args = parser.parse_args()
+
+server, state = start_mock()
+host = f'http://127.0.0.1:{server.server_address[1]}'
+workdir = tempfile.mkdtemp()
+client = TBClient(host, 'tenant@thingsboard.org', 'tenant', pool_size=args.workers,
+                  token_cache=os.path.join(workdir, 'token.json'))
+client.login()
+
+names = [f"AM308-{i:06d}" for i in range(args.devices)]
+device_ids = {name: client.create_device(name, None)['id']['id'] for name in names}
+store = CredentialStore(os.path.join(workdir, 'credentials.db'))
+# 设备创建完成后再加上往返延迟
+state.latency = args.latency / 1000
+
+
+def calls():
+    return state.credential_calls + state.token_checks
+
+
+started = time.perf_counter()
+before = calls()
+for name in names:
+    client.get_access_token(device_ids[name])
+print(f"[INFO] 逐台顺序获取: {calls() - before} 次请求, {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def run(title, max_age=3600):
+    refresher = CredentialRefresher(client, store, workers=args.workers, max_age=max_age)
+    before = calls()
+    started = time.perf_counter()
+    tokens = refresher.refresh(names, device_ids=device_ids)
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] {title}: {len(tokens)} 个 Token, {calls() - before} 次请求, {elapsed * 1000:.0f} ms, "
+          f"{refresher.stats}")
+
+
+run("凭据库为空")
+run("有效期内")
+run("全部过期", max_age=0)
+
+# 模拟在界面上重置了部分设备的 Token
+with state.lock:
+    for name in names[:args.reset]:
+        device = state.devices[device_ids[name]]
+        del state.tokens[device['_token']]
+        device['_token'] = uuid.uuid4().hex[:20]
+        state.tokens[device['_token']] = device['id']['id']
+run(f"{args.reset} 个 Token 被重置", max_age=0)
+
+
+# 多线程同时按名字读取
+def reader(count):
+    for i in range(count):
+        store.get(names[i % len(names)])
+
+
+per_thread = 20000
+threads = [threading.Thread(target=reader, args=(per_thread,)) for _ in range(args.readers)]
+started = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.perf_counter() - started
+print(f"[INFO] {args.readers} 线程并发读取: {args.readers * per_thread / elapsed:,.0f} 次/秒")
+server.shutdown()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_encode.py
+#
+# 遥测编码对比：原来的 json.dumps 嵌套字典、紧凑 JSON (标准库 / orjson)、预渲染模板、protobuf，
+# 分别统计单个子设备消息、500 条合并消息和网关 HTTP 遥测的 bytes/msg 和 us/msg。
+#
+#   python benchmarks/bench_encode.py --messages 50000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tb_encode import JsonEncoder, ProtobufEncoder, TemplateEncoder, orjson  # noqa: E402
+
+# 与 create-gateway.py 相同的网关遥测键
+GATEWAY_VALUES = {
+    "LocalTime": "2025-04-29 15:17:00 Tuesday", "CPULoad": 7.25, "RAM_Capacity_MB": 512.0,
+    "RAM_Available_MB": 301.4, "RAM_Usage_Percent": 41.13, "eMMC_Capacity_GB": 7.28,
+    "eMMC_Available_GB": 5.9, "eMMC_Usage_Percent": 18.96, "Uptime_s": 86400, "storage.messageCount": 0,
+}
+
+
+def sensor_values(i):
+    return {"temperature": round(20 + (i % 60) / 10, 2), "humidity": round(50 + (i % 100) / 10, 2)}
+
+
+# 原 gw_sim/run.py 的做法：每条读数构造嵌套字典再 json.dumps
+def baseline_single(encoder, i):
+    return json.dumps({f"Sensor{i % 1000}": [{"ts": 1700000000000 + i, "values": sensor_values(i)}]}).encode()
+
+
+def encoder_single(encoder, i):
+    reading = encoder.reading(1700000000000 + i, sensor_values(i))
+    return encoder.gateway([encoder.device(f"Sensor{i % 1000}", [reading])])
+
+
+def baseline_batch(encoder, i):
+    return json.dumps({f"Sensor{j}": [{"ts": 1700000000000 + i, "values": sensor_values(j)}]
+                       for j in range(500)}).encode()
+
+
+def encoder_batch(encoder, i):
+    return encoder.gateway([encoder.device(f"Sensor{j}", [encoder.reading(1700000000000 + i, sensor_values(j))])
+                            for j in range(500)])
+
+
+def baseline_gateway(encoder, i):
+    return json.dumps(dict(GATEWAY_VALUES, Uptime_s=i)).encode()
+
+
+def encoder_gateway(encoder, i):
+    return encoder.telemetry(dict(GATEWAY_VALUES, Uptime_s=i))
+
+
+def measure(encode, encoder, count):
+    size = 0
+    started = time.perf_counter()
+    for i in range(count):
+        size += len(encode(encoder, i))
+    elapsed = time.perf_counter() - started
+    return size / count, elapsed / count * 1e6
+
+
+parser = argparse.ArgumentParser(description='遥测编码对比')
+parser.add_argument('--messages', type=int, default=50000)
+args = parser.parse_args()
+
+encoders = [("json.dumps (原)", None), ("json", JsonEncoder(fast=False))]
+if orjson:
+    encoders.append(("orjson", JsonEncoder()))
+encoders += [("template", TemplateEncoder(fast=False)), ("protobuf", ProtobufEncoder())]
+
+scenarios = [
+    ("单个子设备消息", baseline_single, encoder_single, args.messages),
+    ("500 条合并消息", baseline_batch, encoder_batch, max(1, args.messages // 500)),
+    ("网关 HTTP 遥测", baseline_gateway, encoder_gateway, args.messages),
+]
+for title, baseline, encode, count in scenarios:
+    print(f"[INFO] {title} ({count} 条):")
+    for name, encoder in encoders:
+        if encoder is None:
+            size, cost = measure(baseline, encoder, count)
+        else:
+            size, cost = measure(encode, encoder, count)
+        print(f"    {name:<16} {size:10.1f} bytes/msg {cost:10.2f} us/msg")
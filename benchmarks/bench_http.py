@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_http.py
+#
+# HTTP 遥测单次 POST 延迟对比：每次 requests.post (每次新建连接) 与 TBClient 连接池 (keep-alive)。
+# 默认对本地 Mock ThingsBoard 压测，也可用 --host 指向其它 HTTP 服务。
+#
+#   python benchmarks/bench_http.py --posts 2000
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_tb import start_mock  # noqa: E402
+from tb_client import TBClient  # noqa: E402
+
+TELEMETRY = {
+    "LocalTime": "2025-04-30 10:00:00 Wednesday",
+    "CPULoad": 7.0,
+    "RAM_Usage_Percent": 23.63,
+    "eMMC_Usage_Percent": 80.88
+}
+
+
+def measure(post, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        post()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {"mean_us": round(statistics.mean(samples)),
+            "p50_us": round(samples[len(samples) // 2]),
+            "p99_us": round(samples[int(len(samples) * 0.99) - 1])}
+
+
+parser = argparse.ArgumentParser(description='HTTP 连接池延迟对比')
+parser.add_argument('--host', help='已运行的 HTTP 服务地址，不指定时启动本地 Mock')
+parser.add_argument('--posts', type=int, default=1000)
+args = parser.parse_args()
+
+host = args.host
+if not host:
+    server, _ = start_mock()
+    host = f'http://127.0.0.1:{server.server_address[1]}'
+
+client = TBClient(host, 'tenant@thingsboard.org', 'tenant')
+client.login()
+device = client.create_device('bench-http-gateway', 'profile', gateway=True)
+token = client.get_access_token(device['id']['id'])
+url = f'{host}/api/v1/{token}/telemetry'
+
+
+def post_plain():
+    requests.post(url, json=TELEMETRY, headers={'Content-Type': 'application/json'}).raise_for_status()
+
+
+def post_pooled():
+    client.post_telemetry(token, TELEMETRY)
+
+
+for name, post in (("requests.post (无连接复用)", post_plain), ("TBClient 连接池", post_pooled)):
+    post()  # 预热
+    print(f"[INFO] {name}: {measure(post, args.posts)}")
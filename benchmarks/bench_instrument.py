@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_instrument.py
+#
+# 观测手段本身的开销 (每次调用的纳秒数)：
+#   每条消息 print 一次 (旧方式，输出到 /dev/null，不含终端渲染)
+#   tb_log 未开启级别的 debug、被限流丢弃的 warning
+#   tb_metrics 直方图 observe、计数器 inc，以及按 1/64 抽样计时的编码与不计时编码的差
+#   /metrics 输出一次的耗时
+#
+#   python benchmarks/bench_instrument.py --calls 200000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tb_encode import JsonEncoder  # noqa: E402
+from tb_log import get_logger, setup_logging  # noqa: E402
+from tb_metrics import ENCODE_BUCKETS, REGISTRY, SAMPLE_MASK  # noqa: E402
+
+parser = argparse.ArgumentParser(description='日志和指标的开销')
+parser.add_argument('--calls', type=int, default=200000)
+parser.add_argument('--repeat', type=int, default=5)
+args = parser.parse_args()
+
+devnull = open(os.devnull, 'w')
+setup_logging("INFO", rate=10, per=60, stream=devnull)
+log = get_logger("bench")
+histogram = REGISTRY.histogram("bench_seconds", "bench", ENCODE_BUCKETS)
+counter = REGISTRY.counter("bench_total", "bench")
+encoder = JsonEncoder()
+data = {"temperature": 21.5, "humidity": 48.2, "co2": 612, "tvoc": 120, "pm2_5": 8}
+
+
+# 重复 --repeat 次取最快的一次，减少机器噪声
+def bench(name, fn):
+    n = args.calls
+    best = float('inf')
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        fn(n)
+        best = min(best, time.perf_counter() - started)
+    print(f"[INFO] {name:<24} {best / n * 1e9:8.0f} ns/次")
+    return best / n
+
+
+def printing(n):
+    for i in range(n):
+        print(f"[INFO] 网关 telemetry: {data}", file=devnull)
+
+
+def debug_disabled(n):
+    for i in range(n):
+        log.debug("网关遥测已发送", **data)
+
+
+def suppressed(n):
+    for i in range(n):
+        log.warning("网关遥测已缓存", pending=i)
+
+
+def observe(n):
+    for i in range(n):
+        histogram.observe(3e-6)
+
+
+def inc(n):
+    for i in range(n):
+        counter.inc()
+
+
+def encode_plain(n):
+    for i in range(n):
+        encoder.reading(1700000000000 + i, data)
+
+
+def encode_sampled(n):
+    for i in range(n):
+        if i & SAMPLE_MASK:
+            encoder.reading(1700000000000 + i, data)
+        else:
+            started = time.perf_counter()
+            encoder.reading(1700000000000 + i, data)
+            histogram.observe(time.perf_counter() - started)
+
+
+bench("print (旧方式)", printing)
+bench("log.debug (未开启)", debug_disabled)
+bench("log.warning (被限流)", suppressed)
+bench("Histogram.observe", observe)
+bench("Counter.inc", inc)
+plain = bench("编码 (不计时)", encode_plain)
+sampled = bench("编码 (1/64 抽样计时)", encode_sampled)
+print(f"[INFO] 抽样计时的额外开销: {(sampled - plain) * 1e9:.0f} ns/条 ({(sampled / plain - 1) * 100:.1f}%)")
+
+started = time.perf_counter()
+text = REGISTRY.render()
+print(f"[INFO] /metrics 输出: {len(text)} 字节, {(time.perf_counter() - started) * 1000:.2f} ms")
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_metrics.py
+#
+# 系统指标采集耗时：连续采样 N 次，统计单次 sample() 的平均和 p99 耗时 (目标 < 1 ms)。
+#
+#   python benchmarks/bench_metrics.py --samples 10000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gw_metrics import SystemMetrics  # noqa: E402
+
+parser = argparse.ArgumentParser(description='系统指标采集耗时')
+parser.add_argument('--samples', type=int, default=10000)
+parser.add_argument('--disk-path', default='/')
+args = parser.parse_args()
+
+metrics = SystemMetrics(disk_path=args.disk_path)
+print(f"[INFO] 采样示例: {metrics.sample()}")
+
+samples = []
+for _ in range(args.samples):
+    started = time.perf_counter()
+    metrics.sample()
+    samples.append((time.perf_counter() - started) * 1e6)
+samples.sort()
+print(f"[INFO] {args.samples} 次采样: 平均 {sum(samples) / len(samples):.1f} us, "
+      f"p50 {samples[len(samples) // 2]:.1f} us, p99 {samples[int(len(samples) * 0.99)]:.1f} us")
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_profiles.py
+#
+# Device Profile 同步：对本地 Mock ThingsBoard 同步 N 个声明式 Profile，统计每轮的 API 请求数和耗时：
+#   首次 (全部创建) -> 重复运行 (内容哈希命中，0 请求) -> 服务端被手工修改后 verify (只更新被改的)
+#   -> 修改声明 (全部更新)
+#
+#   python benchmarks/bench_profiles.py --profiles 300
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_tb import start_mock  # noqa: E402
+from tb_client import TBClient  # noqa: E402
+from tb_profile import ProfileReconciler, build_profile, load_specs  # noqa: E402
+
+parser = argparse.ArgumentParser(description='Device Profile 同步')
+parser.add_argument('--profiles', type=int, default=300)
+parser.add_argument('--workers', type=int, default=8)
+parser.add_argument('--drift', type=int, default=10, help='服务端被手工修改的 Profile 数')
+args = parser.parse_args()
+
+server, state = start_mock()
+host = f'http://127.0.0.1:{server.server_address[1]}'
+workdir = tempfile.mkdtemp()
+cache_path = os.path.join(workdir, 'profiles-cache.json')
+client = TBClient(host, 'tenant@thingsboard.org', 'tenant', pool_size=args.workers,
+                  token_cache=os.path.join(workdir, 'token.json'))
+client.login()
+
+specs = load_specs(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'profiles.json'))
+profiles = [build_profile(specs, 'gateway' if i % 2 else 'sensor', f"Profile-{i:04d}") for i in range(args.profiles)]
+
+
+def run(title, profiles, verify=False):
+    calls = state.profile_calls
+    reconciler = ProfileReconciler(client, cache_path=cache_path, workers=args.workers)
+    started = time.perf_counter()
+    ids = reconciler.reconcile_all(profiles, verify=verify)
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] {title}: {len(ids)} 个, API 请求 {state.profile_calls - calls} 次, "
+          f"{elapsed * 1000:.1f} ms, {reconciler.stats}")
+
+
+run("首次同步", profiles)
+run("重复运行", profiles)
+
+# 模拟在界面上修改了部分 Profile 的告警严重级别
+with state.lock:
+    for profile in list(state.profiles.values())[:args.drift]:
+        rules = profile['profileData']['alarms'][0]['createRules']
+        rules["MAJOR"] = rules.pop(next(iter(rules)))
+run("verify 检查漂移", profiles, verify=True)
+
+changed = copy.deepcopy(profiles)
+for profile in changed:
+    profile["description"] += " (v2)"
+run("声明修改后同步", changed)
+server.shutdown()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_reconnect.py
+#
+# 重连风暴故障注入：启动本地 Broker，M 个进程共建立 N 条 MQTT 连接 (每条由 ConnectionSupervisor 管理)，
+# 全部连接后杀掉 Broker (SIGKILL)，停机 --outage 秒后重新启动，统计从 Broker 恢复到全部连接重新建立的时间、
+# 重连尝试次数、每秒 CONNECT 峰值和同时进行中的重连数峰值。对比三种方式:
+#   exponential:  不加随机的指数退避 (paho 默认行为)，所有连接在同一时刻重连
+#   jitter:       decorrelated jitter 退避
+#   jitter+gate:  decorrelated jitter 退避加重连并发上限 (ReconnectGate，按进程数平分)
+#
+#   python benchmarks/bench_reconnect.py --clients 10000 --processes 4 --outage 5
+#   python benchmarks/bench_reconnect.py --broker "mosquitto -p {port}"
+
+import argparse
+import asyncio
+import collections
+import multiprocessing
+import os
+import queue
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tb_flow import percentiles  # noqa: E402
+
+AMQTT_CONFIG = """listeners:
+  default:
+    type: tcp
+    bind: 127.0.0.1:{port}
+plugins:
+  amqtt.plugins.authentication.AnonymousAuthPlugin:
+    allow_anonymous: true
+"""
+
+
+def broker_command(args):
+    if args.broker:
+        return shlex.split(args.broker.format(port=args.port))
+    if shutil.which('mosquitto'):
+        return ['mosquitto', '-p', str(args.port)]
+    path = os.path.join(tempfile.mkdtemp(), 'amqtt.yaml')
+    with open(path, 'w') as f:
+        f.write(AMQTT_CONFIG.format(port=args.port))
+    return ['amqtt', '-c', path]
+
+
+def listening(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def start_broker(command, port, timeout=10):
+    if listening(port):
+        raise RuntimeError(f"端口 {port} 已被占用")
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if listening(port):
+            return proc
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"Broker 未能启动: {' '.join(command)}")
+
+
+def clients(worker_id, count, mode, args, results, stop):
+    from gw_sim import AsyncioMqttBridge
+    from tb_reconnect import Backoff, ConnectionSupervisor, ReconnectGate, mqtt_client
+
+    attempts, recovered = [], []
+
+    # 记录每次 CONNECT 和恢复的时间 (墙上时钟，便于与其他进程合并)
+    class Supervisor(ConnectionSupervisor):
+        async def _try_connect(self, loop):
+            attempts.append(time.time())
+            return await super()._try_connect(loop)
+
+        async def _reconnect(self):
+            await super()._reconnect()
+            recovered.append(time.time())
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        # 不限制时 ReconnectGate 只统计同时进行中的重连数
+        gate = ReconnectGate(args.max_connecting if mode == 'jitter+gate' else None, share=1 / args.processes)
+        supervisors = []
+        for i in range(count):
+            client = mqtt_client(f"bench-reconnect-{worker_id}-{i}")
+            AsyncioMqttBridge(loop, client)
+            connected = loop.create_future()
+            client.on_connect = lambda c, u, f, rc, fut=connected: fut.done() or fut.set_result(rc)
+            client.connect('127.0.0.1', args.port, args.keepalive)
+            await connected
+            supervisor = Supervisor(client, gate, Backoff(args.base, args.cap, jitter=mode != 'exponential'),
+                                    connect_timeout=args.connect_timeout)
+            client.on_connect = None
+            supervisor.attach()
+            supervisors.append(supervisor)
+        tasks = [asyncio.create_task(s.run()) for s in supervisors]
+        results.put(("ready", worker_id, count))
+        reported = 0
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+            if len(recovered) != reported:
+                reported = len(recovered)
+                results.put(("recovered", worker_id, reported))
+        for task in tasks:
+            task.cancel()
+        stats = collections.Counter()
+        for s in supervisors:
+            stats.update(s.stats)
+            s.client.disconnect()
+        await asyncio.sleep(0.5)
+        results.put(("done", worker_id, {"attempts": attempts, "recovered": recovered, "peak": gate.peak,
+                                         "stats": dict(stats)}))
+
+    asyncio.run(main())
+
+
+def bench(args, mode):
+    command = broker_command(args)
+    broker = start_broker(command, args.port)
+    results, stop = multiprocessing.Queue(), multiprocessing.Event()
+    share = [args.clients // args.processes + (i < args.clients % args.processes) for i in range(args.processes)]
+    workers = [multiprocessing.Process(target=clients, args=(i, share[i], mode, args, results, stop), daemon=True)
+               for i in range(args.processes)]
+    for w in workers:
+        w.start()
+    ready = 0
+    for _ in workers:
+        ready += results.get(timeout=args.clients / 50 + 60)[2]
+    print(f"[INFO] {mode}: {ready} 条连接已建立, 杀掉 Broker {args.outage:.0f} 秒")
+
+    broker.kill()
+    broker.wait()
+    time.sleep(args.outage)
+    broker = start_broker(command, args.port)
+    restarted = time.time()
+
+    # 等到全部恢复，最多 --wait 秒
+    progress = {}
+    deadline = time.monotonic() + args.wait
+    while sum(progress.values()) < ready and time.monotonic() < deadline:
+        try:
+            _, worker_id, count = results.get(timeout=0.5)
+            progress[worker_id] = count
+        except queue.Empty:
+            pass
+    stop.set()
+    done = []
+    while len(done) < len(workers):
+        kind, _, data = results.get(timeout=60)
+        if kind == "done":
+            done.append(data)
+    for w in workers:
+        w.join(timeout=10)
+    broker.kill()
+    broker.wait()
+
+    recovered = sorted(t - restarted for d in done for t in d["recovered"])
+    attempts = [t for d in done for t in d["attempts"]]
+    per_second = collections.Counter(int(t - restarted) for t in attempts if t >= restarted)
+    stats = collections.Counter()
+    for d in done:
+        stats.update(d["stats"])
+    if not recovered:
+        print(f"[ERROR] {mode}: 没有连接恢复 (重连尝试 {stats['attempts']} 次)")
+        return
+    latency = percentiles(recovered, (50, 99))
+    print(f"[INFO] {mode:<12}: 恢复 {len(recovered)}/{args.clients}, Broker 启动后 p50 {latency['p50_ms'] / 1000:.2f} s"
+          f" / p99 {latency['p99_ms'] / 1000:.2f} s / 全部 {recovered[-1]:.2f} s, "
+          f"重连尝试 {stats['attempts']} 次 (失败 {stats['failures']}), "
+          f"CONNECT 峰值 {max(per_second.values(), default=0)}/s, "
+          f"同时重连峰值 {sum(d['peak'] for d in done)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='重连风暴故障注入')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--port', type=int, default=18830)
+    parser.add_argument('--broker', help='Broker 启动命令，{port} 替换为端口；默认 mosquitto，没有时使用 amqtt')
+    parser.add_argument('--outage', type=float, default=5.0, help='Broker 停机秒数')
+    parser.add_argument('--wait', type=float, default=60.0, help='Broker 恢复后等待重连的秒数')
+    parser.add_argument('--base', type=float, default=1.0, help='退避初始秒数')
+    parser.add_argument('--cap', type=float, default=30.0, help='退避上限秒数')
+    parser.add_argument('--max-connecting', type=int, default=100, help='所有进程合计的重连并发上限')
+    parser.add_argument('--connect-timeout', type=float, default=10.0)
+    parser.add_argument('--keepalive', type=int, default=60)
+    parser.add_argument('--modes', nargs='+', default=['exponential', 'jitter', 'jitter+gate'],
+                        choices=['exponential', 'jitter', 'jitter+gate'])
+    args = parser.parse_args()
+    for mode in args.modes:
+        bench(args, mode)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_replay.py
+#
+# 历史回放：生成 N 条记录的历史文件 (CSV、JSONL，再转换为列式 .tbr)，每种格式在独立子进程中
+#   1. 一次性读入全部记录 (旧做法) 与 mmap 流式读取的速度和进程 RSS
+#   2. 指定 --host 时以最快速度回放到本地 MQTT Broker，统计记录/秒和消息数
+#
+#   python benchmarks/bench_replay.py --records 2000000 --devices 1000
+#   mosquitto -p 1883 &
+#   python benchmarks/bench_replay.py --records 500000 --host 127.0.0.1 --batch-size 500
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# 读取当前进程 RSS (MB)
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+# 生成按时间排序的历史数据：每台设备每 interval 秒一条，温度、湿度和电量
+def generate(workdir, records, devices, interval=60):
+    csv_path = os.path.join(workdir, 'history.csv')
+    jsonl_path = os.path.join(workdir, 'history.jsonl')
+    rng = random.Random(1)
+    start_ms = 1_700_000_000_000
+    with open(csv_path, 'w', newline='', encoding='utf-8') as fc, open(jsonl_path, 'w', encoding='utf-8') as fj:
+        writer = csv.writer(fc)
+        writer.writerow(['ts', 'device', 'temperature', 'humidity', 'battery'])
+        for i in range(records):
+            ts = start_ms + (i // devices) * interval * 1000 + (i % devices) * interval * 1000 // devices
+            device = f"AM308-{i % devices:06d}"
+            values = {"temperature": round(rng.uniform(18, 28), 2), "humidity": round(rng.uniform(30, 70), 1),
+                      "battery": rng.randint(80, 100)}
+            writer.writerow([ts, device, values["temperature"], values["humidity"], values["battery"]])
+            fj.write(json.dumps({"ts": ts, "device": device, "values": values}, separators=(',', ':')) + '\n')
+    return csv_path, jsonl_path
+
+
+def bench_read(path, mode, results):
+    from tb_replay import _loads, open_source
+
+    base = rss_mb()
+    started = time.perf_counter()
+    if mode == 'load':
+        # 旧做法：整个文件读入后再逐行解析，全部记录留在内存中
+        if path.endswith('.csv'):
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        else:
+            with open(path, encoding='utf-8') as f:
+                rows = [_loads(line) for line in f.read().splitlines()]
+        count = len(rows)
+    else:
+        count = 0
+        for _ in open_source(path):
+            count += 1
+    elapsed = time.perf_counter() - started
+    results.put({"records": count, "rate": count / elapsed, "rss_mb": rss_mb() - base})
+
+
+def bench_replay(path, args, results):
+    import paho.mqtt.client as mqtt
+    from tb_replay import TelemetryReplayer, open_source
+
+    replayer = TelemetryReplayer(mqtt.Client("bench-replay"), open_source(path), speed=None,
+                                 batch_size=args.batch_size, progress_every=0, qos=args.qos,
+                                 max_inflight=args.max_inflight)
+    asyncio.run(replayer.run(args.host, args.port))
+    stats = replayer.stats
+    results.put({"records": stats["records"], "rate": stats["records"] / stats["elapsed_s"],
+                 "payloads": replayer.batcher.stats["payloads"], "devices": stats["devices"],
+                 "errors": stats["errors"], "rss_mb": rss_mb()})
+
+
+def run(target, *params):
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=target, args=params + (results,))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        print(f"[ERROR] 子进程失败，退出码 {proc.exitcode}")
+        return None
+    return results.get()
+
+
+if __name__ == '__main__':
+    from tb_replay import convert, open_source
+
+    parser = argparse.ArgumentParser(description='历史回放读取和发送速度')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--host', help='本地 MQTT Broker 地址，不指定时只测读取')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--qos', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-inflight', type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    csv_path, jsonl_path = generate(workdir, args.records, args.devices)
+    tbr_path = os.path.join(workdir, 'history.tbr')
+    started = time.perf_counter()
+    convert(open_source(csv_path), tbr_path)
+    print(f"[INFO] CSV 转换为列式文件: {time.perf_counter() - started:.1f} s")
+
+    for path in (csv_path, jsonl_path, tbr_path):
+        name = os.path.basename(path)
+        size = os.path.getsize(path) / 1024 / 1024
+        modes = ('load', 'stream') if not path.endswith('.tbr') else ('stream',)
+        for mode in modes:
+            r = run(bench_read, path, mode)
+            if r:
+                print(f"[INFO] {name:<14} {size:>7.1f} MB {'一次读入' if mode == 'load' else 'mmap 流式'}: "
+                      f"{r['rate']:>10,.0f} 条/秒, RSS 增加 {r['rss_mb']:>7.1f} MB")
+        if args.host:
+            r = run(bench_replay, path, args)
+            if r:
+                print(f"[INFO] {name:<14} 最快速度回放: {r['rate']:>10,.0f} 条/秒, {r['payloads']:,} 条消息, "
+                      f"{r['devices']} 个子设备, 失败 {r['errors']}, RSS {r['rss_mb']:.1f} MB")
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_rpc.py
+#
+# 下行 RPC 往返延迟：网关子进程运行 GatewaySimulator (持续发送子设备遥测) 并通过 GatewayDispatcher 处理 RPC，
+# 主进程模拟 ThingsBoard 向随机子设备并发发送 RPC，统计从发出请求到收到回复的延迟。
+# 一部分请求的处理函数较慢 (模拟访问设备)，对比在网络回调中直接处理 (workers=0) 与线程池处理的延迟分位数。
+# 最后用共享属性修改一个子设备的发送间隔，再用 getInterval 读回确认。
+#
+#   mosquitto -p 1883 &
+#   python benchmarks/bench_rpc.py --sensors 2000 --rpc-rate 200 --slow-ratio 0.05 --slow-ms 50 --workers 0 16
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+from tb_flow import percentiles  # noqa: E402
+
+
+def gateway(args, workers, ready, done):
+    from gw_sim import GatewaySimulator
+    from tb_batch import BatchPublisher
+    from tb_dispatch import GatewayDispatcher
+
+    def echo(device, method, params):
+        return {"echo": params}
+
+    def slow(device, method, params):
+        time.sleep(args.slow_ms / 1000)
+        return {"success": True}
+
+    async def main():
+        dispatcher = GatewayDispatcher(workers=workers)
+        sim = GatewaySimulator(mqtt.Client(f"bench-rpc-gw-{workers}"), [f"Sensor{i:06d}" for i in range(args.sensors)],
+                               interval=args.interval, registration="lazy", dispatcher=dispatcher)
+        sim.batcher = BatchPublisher(sim.publish_payload, batch_size=500, encoder=sim.encoder)
+        dispatcher.on_rpc("echo", echo)
+        dispatcher.on_rpc("slow", slow)
+        dispatcher.on_rpc("getInterval", sim.on_interval_rpc)
+        dispatcher.on_attributes(sim.on_shared_attributes)
+        await sim.connect(args.host, args.port)
+        # 等 SUBACK 到达
+        await asyncio.sleep(0.5)
+        ready.set()
+        task = asyncio.create_task(sim.schedule())
+        while not done.is_set():
+            await asyncio.sleep(0.1)
+        task.cancel()
+        print(f"[INFO] 网关 (workers={workers}): 遥测 {sim.stats['published']} 条, RPC {dispatcher.stats}")
+        dispatcher.close()
+        sim.client.disconnect()
+
+    asyncio.run(main())
+
+
+class RpcServer:
+    # 模拟 ThingsBoard 一侧：发送 RPC 请求，按 id 匹配回复
+    def __init__(self, args):
+        self.sent = {}
+        self.rtts = []
+        self.replies = {}
+        self.lock = threading.Lock()
+        self.client = mqtt.Client("bench-rpc-server")
+        self.client.on_message = self.on_message
+        self.client.connect(args.host, args.port)
+        self.client.subscribe("v1/gateway/rpc", qos=1)
+        self.client.loop_start()
+        self.next_id = 0
+
+    def on_message(self, client, userdata, msg):
+        message = json.loads(msg.payload)
+        if "id" not in message:
+            return  # 自己发出的请求
+        with self.lock:
+            started = self.sent.pop(message["id"], None)
+        if started is not None:
+            self.rtts.append(time.perf_counter() - started)
+            self.replies[message["id"]] = message["data"]
+
+    def call(self, device, method, params=None):
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            self.sent[request_id] = time.perf_counter()
+        self.client.publish("v1/gateway/rpc", json.dumps(
+            {"device": device, "data": {"id": request_id, "method": method, "params": params}}), qos=1)
+        return request_id
+
+    def wait(self, request_id, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while request_id not in self.replies and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.replies.get(request_id)
+
+
+def bench(args, workers):
+    ready, done = multiprocessing.Event(), multiprocessing.Event()
+    proc = multiprocessing.Process(target=gateway, args=(args, workers, ready, done))
+    proc.start()
+    if not ready.wait(30):
+        print("[ERROR] 网关未能连接")
+        proc.terminate()
+        return
+    server = RpcServer(args)
+    rng = random.Random(1)
+    sensors = [f"Sensor{i:06d}" for i in range(args.sensors)]
+    total = int(args.rpc_rate * args.duration)
+    started = time.perf_counter()
+    for i in range(total):
+        # 按绝对时间匀速发送
+        delay = started + i / args.rpc_rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        method = "slow" if rng.random() < args.slow_ratio else "echo"
+        server.call(rng.choice(sensors), method, {"n": i})
+    time.sleep(2)
+    lost, replied = len(server.sent), len(server.rtts)
+    latency = percentiles(server.rtts, (50, 99, 99.9))
+
+    # 共享属性修改发送间隔后读回
+    server.client.publish("v1/gateway/attributes", json.dumps({"device": sensors[0], "data": {"interval": 42}}),
+                          qos=1)
+    time.sleep(0.5)
+    reply = server.wait(server.call(sensors[0], "getInterval"))
+    done.set()
+    proc.join()
+    server.client.loop_stop()
+    server.client.disconnect()
+    print(f"[INFO] workers={workers:<3}: {replied}/{total} 个回复, 超时 {lost}, "
+          f"往返 p50 {latency['p50_ms']} ms / p99 {latency['p99_ms']} ms / p99.9 {latency['p99.9_ms']} ms, "
+          f"共享属性后 getInterval = {reply}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='下行 RPC 往返延迟')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--sensors', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=10.0, help='子设备遥测间隔 (并发负载)')
+    parser.add_argument('--rpc-rate', type=float, default=200, help='每秒 RPC 请求数')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--slow-ratio', type=float, default=0.05, help='慢处理函数的请求比例')
+    parser.add_argument('--slow-ms', type=float, default=50, help='慢处理函数的耗时 (毫秒)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 16], help='处理线程数，0 表示在网络回调中处理')
+    args = parser.parse_args()
+    for workers in args.workers:
+        bench(args, workers)
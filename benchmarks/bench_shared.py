@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_shared.py
+#
+# 共享属性读取：在本地 Mock ThingsBoard 上为 N 台设备设置共享属性，比较
+#   每台设备用设备接口 GET /api/v1/{token}/attributes 轮询一次 (旧方式) 的请求数和耗时
+#   与 SharedAttributeCache 批量取回 (entitiesQuery) 后本地读取的耗时；
+# 再模拟 MQTT 推送 (经 GatewayDispatcher) 更新属性并确认版本号变化，
+# 最后模拟推送断开且条目过期，统计一次读取触发的批量刷新请求数。
+#
+#   python benchmarks/bench_shared.py --devices 2000 --latency 20
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_tb import start_mock  # noqa: E402
+from tb_client import TBClient  # noqa: E402
+from tb_dispatch import GatewayDispatcher  # noqa: E402
+from tb_shared import SharedAttributeCache  # noqa: E402
+
+parser = argparse.ArgumentParser(description='共享属性本地缓存')
+parser.add_argument('--devices', type=int, default=2000)
+parser.add_argument('--workers', type=int, default=32, help='轮询的并发线程数')
+parser.add_argument('--reads', type=int, default=1000000, help='本地读取次数')
+parser.add_argument('--latency', type=float, default=20, help='模拟的服务器往返时间 (毫秒)')
+args = parser.parse_args()
+
+KEYS = ["interval", "threshold", "enabled"]
+
+server, state = start_mock()
+host = f'http://127.0.0.1:{server.server_address[1]}'
+client = TBClient(host, 'tenant@thingsboard.org', 'tenant', pool_size=args.workers,
+                  token_cache=os.path.join(tempfile.mkdtemp(), 'token.json'))
+client.login()
+names = [f"AM308-{i:06d}" for i in range(args.devices)]
+device_ids = {}
+tokens = {}
+for name in names:
+    device_id = client.create_device(name, None)['id']['id']
+    device_ids[name] = device_id
+    tokens[name] = client.get_access_token(device_id)
+    client.post(f'/api/plugins/telemetry/DEVICE/{device_id}/attributes/SHARED_SCOPE',
+                {"interval": 10, "threshold": 25.5, "enabled": True})
+state.latency = args.latency / 1000
+
+
+def poll(name):
+    resp = client.device_request('GET', tokens[name], f'attributes?sharedKeys={",".join(KEYS)}')
+    resp.raise_for_status()
+    return resp.json()['shared']['interval']
+
+
+# 旧方式：每台设备一次 HTTP GET
+before = state.token_checks
+started = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.workers) as pool:
+    values = list(pool.map(poll, names))
+elapsed = time.perf_counter() - started
+print(f"[INFO] HTTP 轮询一轮: {state.token_checks - before} 次请求, {elapsed * 1000:.0f} ms, "
+      f"单次读取 {args.latency:.0f} ms 以上")
+
+# 本地缓存：批量取回后本地读取
+dispatcher = GatewayDispatcher(workers=4)
+# 模拟 MQTT 已连接并订阅
+dispatcher.subscribed_at = time.monotonic() - 1
+cache = SharedAttributeCache(client, dispatcher=dispatcher)
+started = time.perf_counter()
+loaded = cache.load(device_ids, KEYS)
+elapsed = time.perf_counter() - started
+print(f"[INFO] 批量取回: {loaded} 台设备, {cache.stats['queries']} 次请求, {elapsed * 1000:.0f} ms")
+
+get = cache.get
+started = time.perf_counter()
+for i in range(args.reads):
+    get(names[i % len(names)], "interval")
+elapsed = time.perf_counter() - started
+print(f"[INFO] 本地读取: {args.reads:,} 次, 平均 {elapsed / args.reads * 1e6:.3f} µs")
+
+
+# 模拟 MQTT 推送：与 paho 的消息对象相同，只需要 payload
+class Message:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+# 在服务端修改属性 (直接写 Mock 的内存状态)，再推送给网关
+now = int(time.time() * 1000)
+with state.lock:
+    for name in names:
+        state.attributes[(device_ids[name], 'SHARED_SCOPE')]["interval"] = (30, now)
+before = {name: cache.version(name) for name in names}
+started = time.perf_counter()
+for name in names:
+    dispatcher._on_attributes(None, None, Message(json.dumps({"device": name, "data": {"interval": 30}}).encode()))
+while dispatcher._pending:
+    time.sleep(0.001)
+elapsed = time.perf_counter() - started
+changed = sum(1 for name in names if cache.version(name) > before[name] and cache.get(name, "interval") == 30)
+print(f"[INFO] 推送更新: {changed}/{len(names)} 台设备版本号增加, {elapsed * 1000:.0f} ms, 0 次 HTTP 请求")
+
+# 推送断开且条目过期：下一次读取把所有过期条目合并为批量查询
+dispatcher.disconnected()
+cache.ttl = 0
+queries = cache.stats["queries"]
+started = time.perf_counter()
+cache.get(names[0], "interval")
+elapsed = time.perf_counter() - started
+print(f"[INFO] 推送断开后过期刷新: {cache.stats['queries'] - queries} 次请求, {elapsed * 1000:.0f} ms, "
+      f"interval = {cache.get(names[0], 'interval')}")
+dispatcher.close()
+server.shutdown()
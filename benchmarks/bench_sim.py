@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_sim.py
+#
+# asyncio 模拟器压测：对本地 MQTT Broker (如 mosquitto) 分别模拟 1 万、10 万个子设备，
+# 统计持续发送速率 (msg/s) 和进程 RSS。每个规模在独立子进程中运行，互不影响 RSS 统计。
+#
+#   mosquitto -p 1883 &
+#   python benchmarks/bench_sim.py --sensors 10000 100000 --interval 10 --duration 60
+#   python benchmarks/bench_sim.py --sensors 100000 --batch-size 500     # 合并发送
+#   python benchmarks/bench_sim.py --sensors 10000 --max-inflight 20 --rate-limit 500:1   # 流控
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# 读取当前进程 RSS (MB)
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def bench_one(sensors, args, results):
+    import paho.mqtt.client as mqtt
+    from gw_sim import GatewaySimulator
+    from tb_batch import BatchPublisher
+
+    client = mqtt.Client(f"bench-gw-{sensors}")
+    sim = GatewaySimulator(client, [f"Sensor{i:06d}" for i in range(sensors)],
+                           interval=args.interval, qos=args.qos, max_inflight=args.max_inflight,
+                           rate_limit=args.rate_limit, registration=args.registration)
+    if args.batch_size:
+        sim.batcher = BatchPublisher(sim.publish_payload, batch_size=args.batch_size,
+                                     linger=args.linger, max_payload_bytes=args.max_payload_bytes)
+    asyncio.run(sim.run(args.host, args.port, 60, duration=args.duration))
+    packets = sim.batcher.stats["payloads"] if sim.batcher else sim.stats["published"]
+    flow = sim.flow.metrics()
+    results.put({"sensors": sensors, "published": sim.stats["published"], "errors": sim.stats["errors"],
+                 "packets": packets, "msg_per_s": round(sim.rate(), 1), "rss_mb": round(rss_mb(), 1),
+                 "puback_p50_ms": flow["mqtt.pubackP50Ms"], "puback_p99_ms": flow["mqtt.pubackP99Ms"],
+                 "throttled": flow["mqtt.throttled"],
+                 "first_telemetry_ms": round(sim.stats["first_telemetry_s"] * 1000, 1),
+                 "peak_to_mean": sim.spread.report()["peak_to_mean"]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='asyncio 网关模拟器压测')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--sensors', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--interval', type=float, default=10.0)
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--qos', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=0, help='合并发送的读数条数，0 表示逐条发送')
+    parser.add_argument('--linger', type=float, default=0.2)
+    parser.add_argument('--max-payload-bytes', type=int, default=64 * 1024)
+    parser.add_argument('--max-inflight', type=int, default=1000, help='未确认消息数上限')
+    parser.add_argument('--rate-limit', help='速率限制，格式 容量:秒[,容量:秒]')
+    parser.add_argument('--registration', choices=['eager', 'lazy'], default='eager', help='子设备注册方式')
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    for sensors in args.sensors:
+        proc = multiprocessing.Process(target=bench_one, args=(sensors, args, results))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print(f"[ERROR] {sensors} 个子设备压测失败，退出码 {proc.exitcode}")
+            continue
+        r = results.get()
+        print(f"[INFO] {r['sensors']:>7} 个子设备: {r['msg_per_s']:>9} msg/s, "
+              f"RSS {r['rss_mb']} MB, 读数 {r['published']}, MQTT 报文 {r['packets']}, 失败 {r['errors']}, "
+              f"PUBACK p50 {r['puback_p50_ms']} ms / p99 {r['puback_p99_ms']} ms, 限流等待 {r['throttled']} 次, "
+              f"首条遥测 {r['first_telemetry_ms']} ms, 发送峰值/均值 {r['peak_to_mean']}")
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_synth.py
+#
+# 合成 AM308 数据生成器 (tb_synth) 的速度和数据形态：
+#   向量化 step: N 个传感器一次推进一步，每秒生成的读数条数 (每条 5 个键)
+#   按传感器取值 (GatewaySimulator 的 make_values 路径) 与原锯齿波 default_values 的每条耗时
+#   模拟一天 (每 --day-step 秒一步) 凌晨 3 点与下午 1 点各键的 p5 / p50 / p95，以及突变和丢包次数
+#   相同 seed 的两次运行是否完全相同
+#
+#   python benchmarks/bench_synth.py --sensors 1000 10000 100000 1000000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np  # noqa: E402
+
+from gw_sim import default_values  # noqa: E402
+from tb_synth import SyntheticGenerator  # noqa: E402
+
+parser = argparse.ArgumentParser(description='合成传感器数据生成速度')
+parser.add_argument('--sensors', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+parser.add_argument('--steps', type=int, default=20)
+parser.add_argument('--per-sensor', type=int, default=100000, help='按传感器取值测试的传感器数')
+parser.add_argument('--day-sensors', type=int, default=1000)
+parser.add_argument('--day-step', type=float, default=60.0)
+parser.add_argument('--dropout', type=float, default=0.01)
+parser.add_argument('--seed', type=int, default=1)
+args = parser.parse_args()
+
+# 2025-05-01 00:00 UTC，日变化按 UTC 计算
+T0 = 1746057600.0
+
+for n in args.sensors:
+    generator = SyntheticGenerator(n, seed=args.seed, dropout=args.dropout, utc_offset=0)
+    generator.step(T0)
+    started = time.perf_counter()
+    for i in range(args.steps):
+        generator.step(T0 + i + 1)
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] step {n:>8} 个传感器: {elapsed / args.steps * 1000:8.2f} ms/步, "
+          f"{n * args.steps / elapsed / 1e6:6.2f} M 条/s")
+
+# GatewaySimulator 每个间隔按传感器逐个取值：第一次调用触发一步，之后只查表
+n = args.per_sensor
+generator = SyntheticGenerator(n, seed=args.seed, dropout=args.dropout, utc_offset=0)
+names = generator.names
+for sweep, fn in (("合成 values()", generator.values), ("锯齿波 default_values", default_values)):
+    best = float('inf')
+    for k in range(3):
+        now = T0 + 10 * (k + 1)
+        started = time.perf_counter()
+        for name in names:
+            fn(name, now)
+        best = min(best, time.perf_counter() - started)
+    print(f"[INFO] {sweep:<22} {best / n * 1e9:6.0f} ns/条 ({n} 个传感器)")
+
+# 一天的数据形态
+generator = SyntheticGenerator(args.day_sensors, seed=args.seed, dropout=args.dropout, utc_offset=0)
+snapshots = {}
+for i in range(int(86400 / args.day_step) + 1):
+    now = T0 + i * args.day_step
+    columns = generator.step(now)
+    hour = (now - T0) / 3600
+    if hour in (3, 13):
+        snapshots[hour] = {key: column.copy() for key, column in columns.items()}
+for hour, columns in snapshots.items():
+    text = ', '.join(f"{key} {' / '.join(f'{v:g}' for v in np.nanpercentile(column, (5, 50, 95)))}"
+                     for key, column in columns.items())
+    print(f"[INFO] {hour:02.0f}:00 p5/p50/p95: {text}")
+print(f"[INFO] 一天 {generator.stats['readings']} 条: 突变 {generator.stats['spikes']} 次, "
+      f"丢包 {generator.stats['dropped']} 条 ({generator.stats['dropped'] / generator.stats['readings']:.2%})")
+
+a, b = (SyntheticGenerator(1000, seed=args.seed, dropout=args.dropout) for _ in range(2))
+same = True
+for i in range(10):
+    x, y = a.step(T0 + i), b.step(T0 + i)
+    same = same and all(np.array_equal(x[key], y[key], equal_nan=True) for key in a.keys)
+print(f"[INFO] 相同 seed 可复现: {same}")
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# benchmarks/mock_tb.py
+#
+# 本地 ThingsBoard REST 模拟服务，仅实现脚本用到的接口，数据保存在内存中。
+# 支持 HTTP/1.1 keep-alive，用于压测批量开通和 HTTP 遥测。
+#
+# 单独运行:  python benchmarks/mock_tb.py --port 18080
+
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class MockState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = {}      # id -> profile
+        self.devices = {}       # id -> device
+        self.names = {}         # device name -> id
+        self.tokens = {}        # access token -> device id
+        self.attributes = {}    # (device id, scope) -> dict
+        self.telemetry_count = 0
+        self.profile_calls = 0      # /api/deviceProfile* 请求数
+        self.attribute_writes = 0   # 属性写入请求数
+        self.credential_calls = 0   # /api/device/{id}/credentials 请求数
+        self.token_checks = 0       # 设备接口 GET 请求数 (Token 验证)
+        self.token_ttl = 9000       # JWT 有效期 (秒)，与 ThingsBoard 默认值一致
+        self.jwt = {}               # 已签发的 JWT -> 过期时间
+        self.auth_count = {"login": 0, "refresh": 0}
+        self.latency = 0            # 每个请求附加的延迟 (秒)，模拟到云端服务器的往返时间
+
+    # 签发一对 JWT / refresh token (签名部分为占位)
+    def issue_tokens(self):
+        now = int(time.time())
+
+        def make(kind, ttl):
+            body = json.dumps({"sub": "tenant@thingsboard.org", "kind": kind, "jti": uuid.uuid4().hex,
+                               "iat": now, "exp": now + ttl}).encode()
+            return 'eyJhbGciOiJIUzUxMiJ9.' + base64.urlsafe_b64encode(body).decode().rstrip('=') + '.mock'
+
+        token, refresh = make('access', self.token_ttl), make('refresh', self.token_ttl * 4)
+        with self.lock:
+            self.jwt[token] = now + self.token_ttl
+            self.jwt[refresh] = now + self.token_ttl * 4
+        return {"token": token, "refreshToken": refresh}
+
+    def valid(self, token):
+        return self.jwt.get(token, 0) > time.time()
+
+
+def _page(items, query):
+    size = int(query.get('pageSize', ['100'])[0])
+    page = int(query.get('page', ['0'])[0])
+    text = query.get('textSearch', [''])[0].lower()
+    if text:
+        items = [i for i in items if text in i['name'].lower()]
+    items = sorted(items, key=lambda i: i['name'])
+    chunk = items[page * size:(page + 1) * size]
+    total_pages = (len(items) + size - 1) // size
+    return {"data": chunk, "totalPages": total_pages, "totalElements": len(items),
+            "hasNext": page + 1 < total_pages}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出，不关闭 Nagle 时 keep-alive 上的顺序请求每次多等一个 delayed ACK (约 40 ms)
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code, body=None):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null') if length else None
+
+    # 租户接口需要有效的 JWT
+    def _authorized(self, path):
+        if path.startswith('/api/auth/') or path.startswith('/api/v1/'):
+            return True
+        header = self.headers.get('X-Authorization', '')
+        if header.startswith('Bearer ') and self.state.valid(header[7:]):
+            return True
+        self._send(401, {"message": "Token has expired", "errorCode": 11})
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        st = self.state
+        if st.latency:
+            time.sleep(st.latency)
+        if not self._authorized(url.path):
+            return
+        if url.path.startswith('/api/deviceProfile'):
+            with st.lock:
+                st.profile_calls += 1
+        if url.path == '/api/deviceProfiles':
+            with st.lock:
+                return self._send(200, _page(list(st.profiles.values()), query))
+        m = re.fullmatch(r'/api/deviceProfile/([^/]+)', url.path)
+        if m:
+            with st.lock:
+                profile = st.profiles.get(m.group(1))
+            return self._send(200, profile) if profile else self._send(404)
+        if url.path == '/api/tenant/devices':
+            with st.lock:
+                if 'deviceName' in query:
+                    device_id = st.names.get(query['deviceName'][0])
+                    return self._send(200, st.devices[device_id]) if device_id else self._send(404)
+                return self._send(200, _page(list(st.devices.values()), query))
+        m = re.fullmatch(r'/api/device/([^/]+)/credentials', url.path)
+        if m:
+            with st.lock:
+                st.credential_calls += 1
+                device = st.devices.get(m.group(1))
+            if not device:
+                return self._send(404)
+            return self._send(200, {"credentialsType": "ACCESS_TOKEN", "credentialsId": device['_token']})
+        m = re.fullmatch(r'/api/plugins/telemetry/DEVICE/([^/]+)/values/attributes/(\w+)', url.path)
+        if m:
+            keys = query.get('keys', [''])[0].split(',')
+            with st.lock:
+                values = st.attributes.get((m.group(1), m.group(2)), {})
+                return self._send(200, [{"key": k, "value": values[k][0], "lastUpdateTs": values[k][1]}
+                                        for k in keys if k in values])
+        m = re.fullmatch(r'/api/v1/([^/]+)/attributes', url.path)
+        if m:
+            with st.lock:
+                st.token_checks += 1
+            device_id = st.tokens.get(m.group(1))
+            if not device_id:
+                return self._send(401)
+            result = {}
+            with st.lock:
+                for param, scope, name in (('clientKeys', 'CLIENT_SCOPE', 'client'),
+                                           ('sharedKeys', 'SHARED_SCOPE', 'shared')):
+                    if param in query:
+                        values = st.attributes.get((device_id, scope), {})
+                        result[name] = {k: values[k][0] for k in query[param][0].split(',') if k in values}
+            return self._send(200, result)
+        return self._send(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        st = self.state
+        body = self._body()
+        if st.latency:
+            time.sleep(st.latency)
+        if not self._authorized(url.path):
+            return
+        if url.path == '/api/auth/login':
+            st.auth_count["login"] += 1
+            return self._send(200, st.issue_tokens())
+        if url.path == '/api/auth/token':
+            if not st.valid((body or {}).get('refreshToken')):
+                return self._send(401, {"message": "Invalid refresh token"})
+            st.auth_count["refresh"] += 1
+            return self._send(200, st.issue_tokens())
+        if url.path == '/api/deviceProfile':
+            # 带 id 为更新；服务端补充 createdTime、tenantId、version 等字段
+            with st.lock:
+                st.profile_calls += 1
+                existing = st.profiles.get((body.get('id') or {}).get('id'))
+                if existing:
+                    profile = dict(body, version=existing['version'] + 1)
+                else:
+                    profile = dict(body, id={"id": str(uuid.uuid4()), "entityType": "DEVICE_PROFILE"},
+                                   createdTime=int(time.time() * 1000),
+                                   tenantId={"id": "tenant", "entityType": "TENANT"}, version=1)
+                st.profiles[profile['id']['id']] = profile
+            return self._send(200, profile)
+        if url.path == '/api/device':
+            with st.lock:
+                if body['name'] in st.names:
+                    return self._send(400, {"message": "Device with such name already exists!"})
+                device_id = str(uuid.uuid4())
+                token = uuid.uuid4().hex[:20]
+                device = dict(body, id={"id": device_id, "entityType": "DEVICE"}, _token=token)
+                st.devices[device_id] = device
+                st.names[body['name']] = device_id
+                st.tokens[token] = device_id
+            return self._send(200, device)
+        # 属性保存为 {键: (值, 更新时间)}
+        m = re.fullmatch(r'/api/plugins/telemetry/DEVICE/([^/]+)/attributes/(\w+)', url.path)
+        if m:
+            now = int(time.time() * 1000)
+            with st.lock:
+                st.attribute_writes += 1
+                st.attributes.setdefault((m.group(1), m.group(2)), {}).update(
+                    (k, (v, now)) for k, v in (body or {}).items())
+            return self._send(200)
+        if url.path == '/api/entitiesQuery/find':
+            return self._send(200, self._entities_query(body))
+        m = re.fullmatch(r'/api/v1/([^/]+)/(telemetry|attributes)', url.path)
+        if m:
+            device_id = st.tokens.get(m.group(1))
+            if not device_id:
+                return self._send(401)
+            with st.lock:
+                if m.group(2) == 'attributes':
+                    st.attribute_writes += 1
+                    now = int(time.time() * 1000)
+                    st.attributes.setdefault((device_id, 'CLIENT_SCOPE'), {}).update(
+                        (k, (v, now)) for k, v in (body or {}).items())
+                else:
+                    st.telemetry_count += 1
+            return self._send(200)
+        return self._send(404)
+
+
+    # 实体查询 (仅支持 entityList 过滤和属性 latestValues)，属性值按 ThingsBoard 的方式转为字符串
+    def _entities_query(self, body):
+        scopes = {"SERVER_ATTRIBUTE": "SERVER_SCOPE", "SHARED_ATTRIBUTE": "SHARED_SCOPE",
+                  "CLIENT_ATTRIBUTE": "CLIENT_SCOPE"}
+        data = []
+        with self.state.lock:
+            for device_id in body['entityFilter']['entityList']:
+                if device_id not in self.state.devices:
+                    continue
+                latest = {}
+                for item in body.get('latestValues', []):
+                    values = self.state.attributes.get((device_id, scopes[item['type']]), {})
+                    value, ts = values.get(item['key'], ('', 0))
+                    if isinstance(value, bool):
+                        value = 'true' if value else 'false'
+                    elif isinstance(value, (dict, list)):
+                        value = json.dumps(value, separators=(',', ':'), sort_keys=True)
+                    latest.setdefault(item['type'], {})[item['key']] = {"ts": ts, "value": str(value)}
+                data.append({"entityId": {"entityType": "DEVICE", "id": device_id}, "latest": latest})
+        return {"data": data, "totalPages": 1, "totalElements": len(data), "hasNext": False}
+
+
+# 在后台线程启动模拟服务，返回 (server, state)
+def start_mock(host='127.0.0.1', port=0, latency=0):
+    state = MockState()
+    state.latency = latency
+    handler = type('BoundMockHandler', (MockHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地 ThingsBoard REST 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0, help='每个请求附加的延迟 (毫秒)')
+    args = parser.parse_args()
+    server, _ = start_mock(args.host, args.port, args.latency / 1000)
+    print(f"[INFO] Mock ThingsBoard 已启动: http://{args.host}:{args.port}")
+    threading.Event().wait()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# benchmarks/suite.py
+#
+# 可复现的接入能力压测套件：依次运行一组固定场景 (load-test.py)，汇总结果到一个 JSON 文件。
+# MQTT 场景使用本地 mosquitto (已在运行或自动启动 mosquitto 可执行文件)，
+# HTTP 场景自动启动本地 Mock ThingsBoard。
+#
+#   python benchmarks/suite.py --output suite-results.json
+#   python benchmarks/suite.py --only mqtt-qos1-1k
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 场景: 名称 -> load-test.py 参数
+SCENARIOS = {
+    "mqtt-qos0-1k": ["--transport", "mqtt", "--sensors", "1000", "--rate", "1000", "--qos", "0"],
+    "mqtt-qos1-1k": ["--transport", "mqtt", "--sensors", "1000", "--rate", "1000", "--qos", "1"],
+    "mqtt-qos1-10k": ["--transport", "mqtt", "--sensors", "10000", "--rate", "5000", "--qos", "1",
+                      "--ramp-up", "10"],
+    "mqtt-qos1-10k-batch": ["--transport", "mqtt", "--sensors", "10000", "--rate", "5000", "--qos", "1",
+                            "--batch-size", "500"],
+    "mqtt-qos1-1k-1kb": ["--transport", "mqtt", "--sensors", "1000", "--rate", "1000", "--qos", "1",
+                         "--payload-bytes", "1024"],
+    "http-100": ["--transport", "http", "--sensors", "100", "--rate", "200", "--workers", "16"],
+    "http-500": ["--transport", "http", "--sensors", "500", "--rate", "500", "--workers", "32"],
+}
+
+
+def port_open(host, port):
+    with socket.socket() as sock:
+        sock.settimeout(0.5)
+        return sock.connect_ex((host, port)) == 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if port_open('127.0.0.1', port):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+parser = argparse.ArgumentParser(description='ThingsBoard 接入能力压测套件')
+parser.add_argument('--duration', type=float, default=30.0, help='每个场景的时长 (秒)')
+parser.add_argument('--mqtt-port', type=int, default=1883)
+parser.add_argument('--only', nargs='*', help='只运行指定场景')
+parser.add_argument('--output', default='suite-results.json')
+args = parser.parse_args()
+
+procs = []
+mock_port = free_port()
+procs.append(subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_tb.py'),
+                               '--port', str(mock_port)], stdout=subprocess.DEVNULL))
+if not port_open('127.0.0.1', args.mqtt_port):
+    if not shutil.which('mosquitto'):
+        print(f"[WARNING] 127.0.0.1:{args.mqtt_port} 没有 MQTT Broker，且未找到 mosquitto，跳过 MQTT 场景")
+    else:
+        procs.append(subprocess.Popen(['mosquitto', '-p', str(args.mqtt_port)], stderr=subprocess.DEVNULL))
+wait_port(mock_port)
+mqtt_ready = wait_port(args.mqtt_port, timeout=3)
+
+results = {}
+workdir = tempfile.mkdtemp(prefix='tb-suite-')
+try:
+    for name, scenario in SCENARIOS.items():
+        if args.only and name not in args.only:
+            continue
+        if scenario[1] == 'mqtt' and not mqtt_ready:
+            continue
+        output = os.path.join(workdir, f'{name}.json')
+        cmd = [sys.executable, os.path.join(ROOT, 'load-test.py'), *scenario, '--duration', str(args.duration),
+               '--mqtt-port', str(args.mqtt_port), '--tb-host', f'http://127.0.0.1:{mock_port}',
+               '--username', 'tenant@thingsboard.org', '--password', 'tenant',
+               '--prefix', f'{name}-', '--output', output]
+        print(f"[INFO] 运行场景: {name}")
+        # 在临时目录运行，使用 Mock 的账号且不影响仓库中的 config.ini / token 缓存
+        if subprocess.run(cmd, cwd=workdir).returncode != 0:
+            print(f"[ERROR] 场景 {name} 运行失败")
+            continue
+        with open(output, encoding='utf-8') as f:
+            results[name] = json.load(f)
+finally:
+    for proc in procs:
+        proc.terminate()
+
+with open(args.output, 'w', encoding='utf-8') as f:
+    json.dump(results, f, ensure_ascii=False, indent=2)
+print(f"{'场景':<22}{'msg/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p999 ms':>10}{'错误率':>10}{'CPU%':>8}")
+for name, r in results.items():
+    print(f"{name:<22}{r['throughput_msg_s']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['p99.9_ms']:>10}"
+          f"{r['error_rate']:>10}{r['client_cpu_percent']:>8}")
+print(f"[INFO] 结果已写入: {args.output}")
@@ -11,15 +11,31 @@
 # License: MIT
 # Repository: https://github.com/DarkHexBoy
 
-import requests
 import json  # 用于处理 JSON 数据
 import configparser
 import time  # 用于循环和时间处理
 
+from tb_attrs import attribute_sync_from_config
+from tb_client import TBClient, client_options
+from tb_credentials import CredentialStore, credential_options, device_token
+from tb_encode import encoder_from_config
+from tb_lookup import DeviceIndex
+from tb_profile import reconciler_options, sync_profile
+from tb_reconnect import backoff_from_config
+from tb_store import HttpTelemetrySender, store_from_config
+from tb_tick import ticker_from_config
+from gw_metrics import SystemMetrics
+from tb_log import get_logger, logging_from_config
+from tb_metrics import REGISTRY, metrics_server_from_config
+
 # 读取配置文件
 config = configparser.ConfigParser()
 config.read('config.ini')
 
+# 日志级别和限流 (config.ini [Logging])
+logging_from_config(config)
+log = get_logger("gateway")
+
 # 从配置文件中获取参数
 TB_HOST = config['ThingsBoard']['TB_HOST']
 USERNAME = config['ThingsBoard']['USERNAME']
@@ -38,199 +54,24 @@ attributes = {
 }
 
 # === 第一步：登录，获取 JWT token ===
-login_url = f'{TB_HOST}/api/auth/login'
-login_payload = {'username': USERNAME, 'password': PASSWORD}
-login_resp = requests.post(login_url, json=login_payload)
-login_resp.raise_for_status()
-jwt_token = login_resp.json()['token']
-headers = {
-    'Content-Type': 'application/json',
-    'X-Authorization': f'Bearer {jwt_token}'
-}
+# 所有请求共用同一个带连接池的 Session，JWT 由 TBClient 缓存、刷新并自动加到请求头
+client = TBClient(TB_HOST, USERNAME, PASSWORD, **client_options(config))
+jwt_token = client.login()
+session = client.session
 print(f"[INFO] 登录成功，JWT token 获取完毕")
 
-# === 第二步：检查并跳过已存在的 Device Profile ===
-create_device_profile_url = f'{TB_HOST}/api/deviceProfile'
-
-# 检查是否存在同名 Device Profile
-get_device_profiles_url = f'{TB_HOST}/api/deviceProfiles?pageSize=100&page=0'
-profiles_resp = requests.get(get_device_profiles_url, headers=headers)
-profiles_resp.raise_for_status()
-profiles = profiles_resp.json().get('data', [])
-existing_profile = next((p for p in profiles if p['name'] == device_profile_name), None)
-
-if existing_profile:
-    print(f"[INFO] Device Profile 已存在，跳过创建: {device_profile_name}")
-    device_profile_id = existing_profile['id']['id']
-else:
-    device_profile_payload = {
-        "name": device_profile_name,
-        "description": "Device Profile for Gateway",
-        "type": "DEFAULT",
-        "transportType": "DEFAULT",
-        "provisionType": "DISABLED",
-        "default": False,
-        "profileData": {
-            "configuration": {
-                "type": "DEFAULT"
-            },
-            "transportConfiguration": {
-                "type": "DEFAULT"
-            },
-            "provisionConfiguration": {
-                "type": "DISABLED"
-            },
-            "alarms": [
-                {
-                    "id": "gatewayOnlineAlarmID",
-                    "alarmType": "Gateway Online Alarm",
-                    "createRules": {
-                        "MINOR": {
-                            "condition": {
-                                "condition": [
-                                    {
-                                        "key": {
-                                            "type": "ATTRIBUTE",
-                                            "key": "active"
-                                        },
-                                        "valueType": "BOOLEAN",
-                                        "predicate": {
-                                            "type": "BOOLEAN",
-                                            "operation": "EQUAL",
-                                            "value": {
-                                                "defaultValue": True
-                                            }
-                                        }
-                                    }
-                                ]
-                            }
-                        }
-                    },
-                    "clearRule": {
-                        "condition": {
-                            "condition": [
-                                {
-                                    "key": {
-                                        "type": "ATTRIBUTE",
-                                        "key": "active"
-                                    },
-                                    "valueType": "BOOLEAN",
-                                    "predicate": {
-                                        "type": "BOOLEAN",
-                                        "operation": "EQUAL",
-                                        "value": {
-                                            "defaultValue": False
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "detail": None
-                },
-                {
-                    "id": "gatewayOfflineAlarmID",
-                    "alarmType": "Gateway Offline Alarm",
-                    "createRules": {
-                        "CRITICAL": {
-                            "condition": {
-                                "condition": [
-                                    {
-                                        "key": {
-                                            "type": "ATTRIBUTE",
-                                            "key": "active"
-                                        },
-                                        "valueType": "BOOLEAN",
-                                        "predicate": {
-                                            "type": "BOOLEAN",
-                                            "operation": "EQUAL",
-                                            "value": {
-                                                "defaultValue": False
-                                            }
-                                        }
-                                    }
-                                ]
-                            }
-                        }
-                    },
-                    "clearRule": {
-                        "condition": {
-                            "condition": [
-                                {
-                                    "key": {
-                                        "type": "ATTRIBUTE",
-                                        "key": "active"
-                                    },
-                                    "valueType": "BOOLEAN",
-                                    "predicate": {
-                                        "type": "BOOLEAN",
-                                        "operation": "EQUAL",
-                                        "value": {
-                                            "defaultValue": True
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "detail": None
-                }
-            ]  # 移除 no data alarm
-        }
-    }
-    create_profile_resp = requests.post(create_device_profile_url, json=device_profile_payload, headers=headers)
-    try:
-        create_profile_resp.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        print(f"服务器返回错误: {create_profile_resp.status_code}, 响应内容: {create_profile_resp.text}")
-        raise e
-    device_profile_id = create_profile_resp.json()['id']['id']
-    print(f"[INFO] Device Profile 创建成功，名字: {device_profile_name}")
+# === 第二步：按 profiles.json 中的声明同步 Device Profile ===
+# 不存在则创建；已存在时只在与声明不一致时更新，声明未变化时由本地哈希缓存直接跳过
+profile_options = reconciler_options(config)
+device_profile_id = sync_profile(client, 'gateway', device_profile_name, **profile_options)
 
-# === 第三步：检查设备是否存在 ===
-get_devices_url = f'{TB_HOST}/api/tenant/devices?pageSize=100&page=0'
-get_devices_resp = requests.get(get_devices_url, headers=headers)
-get_devices_resp.raise_for_status()
-existing_devices = get_devices_resp.json().get('data', [])
-existing_device = next((d for d in existing_devices if d['name'] == device_name), None)
+# === 第三步：检查设备是否存在 (按名字精确查询) ===
+device_id = DeviceIndex(client).get(device_name)
 
-# 如果设备已存在，从配置文件中读取 Access Token
-if existing_device:
-    device_id = existing_device['id']['id']
+# 如果设备不存在，创建设备
+if device_id:
     print(f"[INFO] {device_name} 设备已存在，跳过创建")
-
-    # 从配置文件中读取 Access Token
-    access_token = config['Device'].get('access_token')
-
-    # 测试 Access Token 是否有效
-    if access_token:
-        test_url = f"{TB_HOST}/api/v1/{access_token}/attributes"
-        try:
-            test_resp = requests.get(test_url, headers={'Content-Type': 'application/json'})
-            if test_resp.status_code == 200:
-                print(f"[INFO] 配置文件中的 Access Token 有效，继续使用")
-            else:
-                print(f"[WARNING] Access Token 测试返回非 200 状态码: {test_resp.status_code}, 响应内容: {test_resp.text}")
-                raise Exception("Access Token 无效")
-        except Exception as e:
-            print(f"[WARNING] 当前 Access Token 无效，尝试从 ThingsBoard 重新获取: {e}")
-            access_token = None
-
-    if not access_token:
-        # 从 ThingsBoard 重新获取 Access Token
-        get_credentials_url = f"{TB_HOST}/api/device/{device_id}/credentials"
-        credentials_resp = requests.get(get_credentials_url, headers=headers)
-        credentials_resp.raise_for_status()
-        access_token = credentials_resp.json()['credentialsId']
-        print(f"[INFO] 重新获取的 Access Token: {access_token}")
-
-        # 更新配置文件
-        config.set('Device', 'access_token', access_token)
-        with open('config.ini', 'w') as configfile:
-            config.write(configfile)
-        print(f"[INFO] Access Token 已更新并保存到配置文件")
 else:
-    # 如果设备不存在，创建设备
     device_payload = {
         "name": device_name,
         "type": "DEFAULT",
@@ -240,81 +81,63 @@ else:
         }
     }
     create_device_url = f'{TB_HOST}/api/device'
-    create_device_resp = requests.post(create_device_url, json=device_payload, headers=headers)
+    create_device_resp = session.post(create_device_url, json=device_payload)
     create_device_resp.raise_for_status()
     device_id = create_device_resp.json()['id']['id']
     print(f"[INFO] 设备创建成功，设备 ID: {device_id}")
 
-    # 获取 Access Token
-    get_credentials_url = f"{TB_HOST}/api/device/{device_id}/credentials"
-    credentials_resp = requests.get(get_credentials_url, headers=headers)
-    credentials_resp.raise_for_status()
-    access_token = credentials_resp.json()['credentialsId']
-    print(f"[INFO] 设备的 Access Token 获取成功: {access_token}")
-
-    # 将 Access Token 写入配置文件
-    config.set('Device', 'access_token', access_token)
-    with open('config.ini', 'w') as configfile:
-        config.write(configfile)
-    print(f"[INFO] Access Token 已写入配置文件: {access_token}")
-
-# === 第四步：设置服务器端属性 ===
-server_attributes_url = f"{TB_HOST}/api/plugins/telemetry/DEVICE/{device_id}/attributes/SERVER_SCOPE"
-server_attributes_payload = attributes  # 从配置文件中读取的 attributes 替代硬编码
-server_attributes_resp = requests.post(server_attributes_url, json=server_attributes_payload, headers=headers)
-try:
-    server_attributes_resp.raise_for_status()
-except requests.exceptions.HTTPError as e:
-    print(f"设置服务器端属性时出错: {server_attributes_resp.status_code}, 响应内容: {server_attributes_resp.text}")
-    raise e
-print(f"[INFO] 服务器端属性设置成功: {server_attributes_payload}")
+# === 第四步：设置服务器端属性 (只发送与上次写入不同的键) ===
+attribute_sync = attribute_sync_from_config(client, config)
+changed_attributes = attribute_sync.sync_device(device_id, attributes)
+if changed_attributes:
+    print(f"[INFO] 服务器端属性设置成功: {changed_attributes}")
+else:
+    print("[INFO] 服务器端属性无变化，跳过")
 
 # === 第五步：获取设备的 Access Token ===
-get_credentials_url = f"{TB_HOST}/api/device/{device_id}/credentials"
-credentials_resp = requests.get(get_credentials_url, headers=headers)
-credentials_resp.raise_for_status()
-access_token = credentials_resp.json()['credentialsId']
-print(f"[INFO] 设备的 Access Token 获取成功: {access_token}")
-
-# 将 Access Token 写入配置文件
-config.set('Device', 'access_token', access_token)
-with open('config.ini', 'w') as configfile:
-    config.write(configfile)
-print(f"[INFO] Access Token 已写入配置文件: {access_token}")
+# Token 保存在本地凭据库 (config.ini [Credentials])，在有效期内直接使用，过期后验证一次，无效时才重新获取
+# 旧版写在 config.ini [Device] access_token 中的 Token 首次运行时导入凭据库
+credentials = credential_options(config)
+credential_store = CredentialStore(credentials['path'])
+access_token = device_token(client, credential_store, device_name, device_id, max_age=credentials['max_age'],
+                            legacy_token=config['Device'].get('access_token'))
+print(f"[INFO] 设备的 Access Token: {access_token}")
 
 # === 第六步：循环发送设备状态数据 ===
-telemetry_url = f"{TB_HOST}/api/v1/{access_token}/telemetry"
+# 发送失败的数据缓存到本地 SQLite 队列 (config.ini [Storage])，之后按退避暂停请求 (config.ini [Reconnect])
+store = store_from_config(config)
+# 设备 Token 被拒绝 (401 / 403) 时立即验证凭据库中的 Token，失效则重新获取；期间数据保留在队列中
+telemetry_sender = HttpTelemetrySender(client, access_token, store, encoder=encoder_from_config(config),
+                                       backoff=backoff_from_config(config),
+                                       renew=lambda: device_token(client, credential_store, device_name, device_id,
+                                                                  max_age=0))
+GB = 1024 ** 3
+# 系统指标采集 (config.ini [Metrics] disk_path 为 eMMC 挂载点)
+system_metrics = SystemMetrics(disk_path=config.get('Metrics', 'disk_path', fallback='/'))
+# 本地指标端点 (config.ini [Metrics] port)：HTTP 延迟直方图和缓存队列深度
+REGISTRY.collect(store.metrics)
+metrics_server_from_config(config)
+
+# 按绝对时间节拍发送 (config.ini [Schedule])，发送耗时不累积；相位按设备名分散，多个网关不会同时发送
+ticker = ticker_from_config(config, device_name)
 
 while True:
+    ticker.wait()
     # 构造数据
     telemetry_data = {
         "Local Time": time.strftime("%Y-%m-%d %H:%M:%S %A"),
-        "Uptime": "13days,03:26:19",
-        "CPU Load": "7%",
-        "RAM": {
-            "Capacity": "512MB",
-            "Available": "121MB",
-            "Usage": "23.63%"
-        },
-        "eMMC": {
-            "Capacity": "8.0GB",
-            "Available": "6.5GB",
-            "Usage": "80.88%"
-        },
-        "storageCapacity": 8.0,  # 存储总容量，单位：GB
-        "storageUsed": 1.5,      # 已用存储空间，单位：GB
-        "storageAvailable": 6.5, # 可用存储空间，单位：GB
-        "storage.messageCount": 1,  # 模拟存储消息计数
-        "storage.dataPoints": 10   # 模拟推送的数据点
+        # CPU、内存、运行时间和 eMMC 均为实际采集的数值 (CPULoad、RAM_*、eMMC_*、Uptime_s)
+        **system_metrics.sample(),
+        # 断网缓存队列的实际状态
+        "storageCapacity": round(store.max_bytes / GB, 3),  # 缓存队列容量，单位：GB
+        "storageUsed": round(store.bytes / GB, 6),          # 已缓存数据大小，单位：GB
+        "storageAvailable": round((store.max_bytes - store.bytes) / GB, 6),  # 剩余缓存空间，单位：GB
+        "storage.messageCount": store.depth(),             # 待补发的消息数
+        "storage.dataPoints": store.stats["sent"]          # 已补发的数据点
     }
 
-    # 发送数据
-    try:
-        telemetry_resp = requests.post(telemetry_url, json=telemetry_data, headers={'Content-Type': 'application/json'})
-        telemetry_resp.raise_for_status()
-        print(f"[INFO] 遥测数据发送成功: {telemetry_data}")
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] 遥测数据发送失败: {e}")
-
-    # 等待 10 秒后发送下一次数据
-    time.sleep(10)
+    # 发送数据，失败时写入本地缓存，恢复后批量补发
+    if telemetry_sender.send(telemetry_data):
+        log.debug("遥测数据发送成功", **telemetry_data)
+    else:
+        log.warning("遥测数据已缓存", pending=store.depth())
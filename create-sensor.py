@@ -12,10 +12,27 @@ import json
 import configparser
 import time
 
+from milesight_codec import get_codec
+from tb_attrs import attribute_sync_from_config
+from tb_client import TBClient, client_options
+from tb_credentials import CredentialStore, credential_options, device_token
+from tb_deadband import deadband_from_config
+from tb_encode import encoder_from_config
+from tb_profile import reconciler_options, sync_profile
+from tb_reconnect import backoff_from_config
+from tb_synth import np, synthetic_from_config
+from tb_tick import ticker_from_config
+from tb_log import get_logger, logging_from_config
+from tb_metrics import metrics_server_from_config
+
 # 读取配置文件
 config = configparser.ConfigParser()
 config.read('config.ini', encoding='utf-8')
 
+# 日志级别和限流 (config.ini [Logging])
+logging_from_config(config)
+log = get_logger("sensor")
+
 # 从配置文件中加载配置项
 THINGSBOARD_HOST = config.get('ThingsBoard', 'tb_host')
 USERNAME = config.get('ThingsBoard', 'username')
@@ -23,156 +40,33 @@ PASSWORD = config.get('ThingsBoard', 'password')
 DEVICE_NAME = "am308-lora"
 DEVICE_PROFILE_NAME = "AM08-Profile"
 
+# 所有请求共用同一个带连接池的 Session，JWT 由 TBClient 缓存、刷新并自动加到请求头
+client = TBClient(THINGSBOARD_HOST, USERNAME, PASSWORD, **client_options(config))
+session = client.session
+
 # 登录获取 JWT Token
 def get_jwt_token():
-    url = f"{THINGSBOARD_HOST}/api/auth/login"
-    payload = {
-        "username": USERNAME,
-        "password": PASSWORD
-    }
-    response = requests.post(url, json=payload)
-    response.raise_for_status()
-    return response.json()['token']
+    return client.login()
 
-# 创建设备配置文件
-def create_device_profile(jwt_token):
-    url = f"{THINGSBOARD_HOST}/api/deviceProfile"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Authorization": f"Bearer {jwt_token}"
-    }
-    payload = {
-        "name": DEVICE_PROFILE_NAME,
-        "type": "DEFAULT",
-        "transportType": "DEFAULT",
-        "profileData": {
-            "transportConfiguration": {
-                "type": "DEFAULT"
-            },
-            "alarms": [
-                {
-                    "id": "gatewayOnlineAlarmID",
-                    "alarmType": "Gateway Online Alarm",
-                    "createRules": {
-                        "MINOR": {
-                            "condition": {
-                                "condition": [
-                                    {
-                                        "key": {
-                                            "type": "ATTRIBUTE",
-                                            "key": "active"
-                                        },
-                                        "valueType": "BOOLEAN",
-                                        "predicate": {
-                                            "type": "BOOLEAN",
-                                            "operation": "EQUAL",
-                                            "value": {
-                                                "defaultValue": True
-                                            }
-                                        }
-                                    }
-                                ]
-                            }
-                        }
-                    },
-                    "clearRule": {
-                        "condition": {
-                            "condition": [
-                                {
-                                    "key": {
-                                        "type": "ATTRIBUTE",
-                                        "key": "active"
-                                    },
-                                    "valueType": "BOOLEAN",
-                                    "predicate": {
-                                        "type": "BOOLEAN",
-                                        "operation": "EQUAL",
-                                        "value": {
-                                            "defaultValue": False
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "detail": None
-                },
-                {
-                    "id": "gatewayOfflineAlarmID",
-                    "alarmType": "Gateway Offline Alarm",
-                    "createRules": {
-                        "CRITICAL": {
-                            "condition": {
-                                "condition": [
-                                    {
-                                        "key": {
-                                            "type": "ATTRIBUTE",
-                                            "key": "active"
-                                        },
-                                        "valueType": "BOOLEAN",
-                                        "predicate": {
-                                            "type": "BOOLEAN",
-                                            "operation": "EQUAL",
-                                            "value": {
-                                                "defaultValue": False
-                                            }
-                                        }
-                                    }
-                                ]
-                            }
-                        }
-                    },
-                    "clearRule": {
-                        "condition": {
-                            "condition": [
-                                {
-                                    "key": {
-                                        "type": "ATTRIBUTE",
-                                        "key": "active"
-                                    },
-                                    "valueType": "BOOLEAN",
-                                    "predicate": {
-                                        "type": "BOOLEAN",
-                                        "operation": "EQUAL",
-                                        "value": {
-                                            "defaultValue": True
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "detail": None
-                }
-            ]
-        }
-    }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 200:
-        print(f"设备配置文件 {DEVICE_PROFILE_NAME} 创建成功")
-    else:
-        print(f"设备配置文件创建失败: {response.text}")
+# 按 profiles.json 中的声明创建或更新设备配置文件
+def create_device_profile():
+    return sync_profile(client, 'sensor', DEVICE_PROFILE_NAME, **reconciler_options(config))
 
 # 创建设备
-def create_device(jwt_token):
+def create_device():
     url = f"{THINGSBOARD_HOST}/api/device"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Authorization": f"Bearer {jwt_token}"
-    }
     payload = {
         "name": DEVICE_NAME,
         "type": DEVICE_PROFILE_NAME
     }
-    response = requests.post(url, headers=headers, json=payload)
+    response = session.post(url, json=payload)
     if response.status_code == 200:
         print(f"设备 {DEVICE_NAME} 创建成功")
     else:
         print(f"设备创建失败: {response.text}")
 
 # 发送设备属性数据
-def send_device_attributes(jwt_token, device_id):
-    server_attributes_url = f"{THINGSBOARD_HOST}/api/plugins/telemetry/DEVICE/{device_id}/attributes/SERVER_SCOPE"
+def send_device_attributes(device_id):
     server_attributes_payload = {
         "Device Name": config.get('Device', 'device_name'),
         "Device EUI": "24E124710D371756",
@@ -180,40 +74,17 @@ def send_device_attributes(jwt_token, device_id):
         "Payload Codec": "AM319-Ecobook",
         "Application": "Ecobook-IAQ-24E124710D371756"
     }
-    headers = {
-        "Content-Type": "application/json",
-        "X-Authorization": f"Bearer {jwt_token}"
-    }
-    server_attributes_resp = requests.post(server_attributes_url, json=server_attributes_payload, headers=headers)
-    try:
-        server_attributes_resp.raise_for_status()
-        print(f"设备属性数据已发送成功: {server_attributes_payload}")
-    except requests.exceptions.HTTPError as e:
-        print(f"设备属性数据发送失败: {server_attributes_resp.status_code}, 响应内容: {server_attributes_resp.text}")
-        raise e
-
-# 检查设备配置文件是否已存在
-def check_device_profile_exists(jwt_token):
-    url = f"{THINGSBOARD_HOST}/api/deviceProfiles?limit=100"
-    headers = {
-        "X-Authorization": f"Bearer {jwt_token}"
-    }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        profiles = response.json().get('data', [])
-        for profile in profiles:
-            if profile['name'] == DEVICE_PROFILE_NAME:
-                print(f"设备配置文件 {DEVICE_PROFILE_NAME} 已存在，跳过创建")
-                return True
-    return False
+    # 只发送与上次写入不同的键
+    changes = attribute_sync_from_config(client, config).sync_device(device_id, server_attributes_payload)
+    if changes:
+        print(f"设备属性数据已发送成功: {changes}")
+    else:
+        print("设备属性数据无变化，跳过发送")
 
 # 检查设备是否已存在并返回设备 ID
-def check_device_exists(jwt_token):
+def check_device_exists():
     url = f"{THINGSBOARD_HOST}/api/tenant/devices?deviceName={DEVICE_NAME}"
-    headers = {
-        "X-Authorization": f"Bearer {jwt_token}"
-    }
-    response = requests.get(url, headers=headers)
+    response = session.get(url)
     if response.status_code == 200:
         device = response.json()
         if device:
@@ -222,35 +93,71 @@ def check_device_exists(jwt_token):
     return None
 
 # 发送遥测数据
-def send_telemetry(jwt_token, device_id):
-    access_token = config.get('Device', 'access_token')
+def send_telemetry(device_id):
+    # 传感器自己的 Access Token，保存在本地凭据库中，过期后才验证或重新获取
+    credentials = credential_options(config)
+    access_token = device_token(client, CredentialStore(credentials['path']), DEVICE_NAME, device_id,
+                                max_age=credentials['max_age'])
     telemetry_url = f"{THINGSBOARD_HOST}/api/v1/{access_token}/telemetry"
-    headers = {
-        "Content-Type": "application/json"
-    }
+    codec = get_codec("AM319")
+    encoder = encoder_from_config(config)
+    deadband = deadband_from_config(config)
+    # 按绝对时间节拍发送 (config.ini [Schedule])，相位按设备名分散
+    ticker = ticker_from_config(config, DEVICE_NAME)
+    # 本地指标端点 (config.ini [Metrics] port)：HTTP 延迟直方图
+    metrics_server_from_config(config)
+    # 发送失败后按退避暂停 (config.ini [Reconnect])，服务端故障期间不每一拍都请求
+    backoff = backoff_from_config(config)
+    retry_at = 0.0
+    # 合成 AM308 读数 (config.ini [Synthetic])；未安装 NumPy 时为锯齿波温湿度
+    synthetic = synthetic_from_config(config, [DEVICE_NAME]) if np is not None else None
     while True:
-        telemetry_payload = {
-            "temperature": 25 + int(time.time()) % 5,
-            "humidity": 50 + int(time.time()) % 10
-        }
-        resp = requests.post(telemetry_url, json=telemetry_payload, headers=headers)
-        if resp.status_code == 200:
-            print(f"遥测数据已发送: {telemetry_payload}")
+        ticker.wait()
+        if time.monotonic() < retry_at:
+            continue
+        # 按 AM319 上行格式编码模拟读数，再经解码器转换为遥测，与真实设备上报的字段一致 (湿度按 0.5% 分辨率)
+        if synthetic:
+            reading = synthetic.values(DEVICE_NAME, time.time())
+            if not reading:
+                # 模拟的上行丢失
+                continue
+        else:
+            reading = {
+                "temperature": 25 + int(time.time()) % 5,
+                "humidity": 50 + int(time.time()) % 10
+            }
+        uplink = codec.encode(reading)
+        telemetry_payload = codec.decode(uplink)
+        if deadband:
+            # 只发送超出死区或到心跳时间的键
+            telemetry_payload = deadband.filter(DEVICE_NAME, telemetry_payload)
+            if not telemetry_payload:
+                continue
+        try:
+            resp = session.post(telemetry_url, data=encoder.telemetry(telemetry_payload))
+            error = None if resp.status_code == 200 else f"{resp.status_code}, {resp.text}"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if error is None:
+            backoff.reset()
+            log.debug("遥测数据已发送", **telemetry_payload)
         else:
-            print(f"遥测数据发送失败: {resp.status_code}, {resp.text}")
-        time.sleep(10)
+            delay = backoff.next()
+            retry_at = time.monotonic() + delay
+            log.warning("遥测数据发送失败，暂停请求", retry_s=round(delay, 1), error=error)
+            if deadband:
+                deadband.reset(DEVICE_NAME)
 
 # 主流程
 if __name__ == "__main__":
     try:
-        jwt_token = get_jwt_token()
-        if not check_device_profile_exists(jwt_token):
-            create_device_profile(jwt_token)
-        device_id = check_device_exists(jwt_token)
+        get_jwt_token()
+        create_device_profile()
+        device_id = check_device_exists()
         if not device_id:
-            create_device(jwt_token)
-            device_id = check_device_exists(jwt_token)
-        send_device_attributes(jwt_token, device_id)
-        send_telemetry(jwt_token, device_id)
+            create_device()
+            device_id = check_device_exists()
+        send_device_attributes(device_id)
+        send_telemetry(device_id)
     except Exception as e:
         print(f"发生错误: {e}")
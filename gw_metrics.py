@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# gw_metrics.py
+#
+# 网关系统指标采集，代替写死的 "CPU Load": "7%" 等字符串。
+# 从 /proc/stat、/proc/meminfo、/proc/uptime 和 statvfs 读取，文件描述符只打开一次，
+# 每次采样用 pread 读取开头几百字节；CPU 占用按两次采样的差值计算。输出全部为数值类型。
+# 每个采集器是一个带 sample() 方法的对象，可按需增减或自行扩展。
+
+import os
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+# 打开后一直保留的 /proc 文件，不存在 (非 Linux) 时 read() 返回 None
+class _ProcFile:
+    def __init__(self, path, size=512):
+        self.size = size
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            self.fd = None
+
+    def read(self):
+        if self.fd is None:
+            return None
+        return os.pread(self.fd, self.size, 0)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class CpuCollector:
+    def __init__(self):
+        self.stat = _ProcFile('/proc/stat', 256)
+        self.last = self._read()
+
+    def _read(self):
+        data = self.stat.read()
+        if not data:
+            return None
+        # cpu  user nice system idle iowait irq softirq steal ...
+        fields = [int(x) for x in data.split(b'\n', 1)[0].split()[1:9]]
+        return sum(fields), fields[3] + fields[4]
+
+    def sample(self):
+        current = self._read()
+        if current is None:
+            return {}
+        total, idle = current[0] - self.last[0], current[1] - self.last[1]
+        self.last = current
+        return {"CPULoad": round(100.0 * (total - idle) / total, 2) if total else 0.0}
+
+
+class MemoryCollector:
+    def __init__(self):
+        self.meminfo = _ProcFile('/proc/meminfo', 256)
+
+    def sample(self):
+        data = self.meminfo.read()
+        if not data:
+            return {}
+        values = {}
+        for line in data.split(b'\n'):
+            key, _, rest = line.partition(b':')
+            if key in (b'MemTotal', b'MemAvailable'):
+                values[key] = int(rest.split()[0]) * 1024
+                if len(values) == 2:
+                    break
+        total, available = values.get(b'MemTotal', 0), values.get(b'MemAvailable', 0)
+        return {
+            "RAM_Capacity_MB": round(total / MB, 1),
+            "RAM_Available_MB": round(available / MB, 1),
+            "RAM_Usage_Percent": round(100.0 * (total - available) / total, 2) if total else 0.0,
+        }
+
+
+class UptimeCollector:
+    def __init__(self):
+        self.uptime = _ProcFile('/proc/uptime', 64)
+
+    def sample(self):
+        data = self.uptime.read()
+        if not data:
+            return {}
+        return {"Uptime_s": int(float(data.split()[0]))}
+
+
+# 存储空间，path 为 eMMC 挂载点
+class DiskCollector:
+    def __init__(self, path='/', prefix='eMMC'):
+        self.path = path
+        self.prefix = prefix
+
+    def sample(self):
+        try:
+            st = os.statvfs(self.path)
+        except OSError:
+            return {}
+        total = st.f_blocks * st.f_frsize
+        available = st.f_bavail * st.f_frsize
+        return {
+            f"{self.prefix}_Capacity_GB": round(total / GB, 2),
+            f"{self.prefix}_Available_GB": round(available / GB, 2),
+            f"{self.prefix}_Usage_Percent": round(100.0 * (total - available) / total, 2) if total else 0.0,
+        }
+
+
+class SystemMetrics:
+    def __init__(self, collectors=None, disk_path='/'):
+        if collectors is None:
+            collectors = [CpuCollector(), MemoryCollector(), UptimeCollector(), DiskCollector(disk_path)]
+        self.collectors = list(collectors)
+
+    def add(self, collector):
+        self.collectors.append(collector)
+
+    # 采集一次全部指标
+    def sample(self):
+        data = {}
+        for collector in self.collectors:
+            data.update(collector.sample())
+        return data
+
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+# gw_sim.py
+#
+# 基于 asyncio 的网关子设备模拟器：单线程事件循环 + 最小堆定时调度，
+# 代替 run.py 中每个传感器一个线程的做法，单进程可模拟数万个子设备。
+# paho 客户端不再启动自己的网络线程 (loop_start)，而是通过 socket 回调挂到 asyncio 事件循环上。
+
+import asyncio
+import heapq
+import time
+
+import paho.mqtt.client as mqtt
+
+from tb_batch import ENCODE_READING
+from tb_encode import JsonEncoder
+from tb_flow import FlowControl
+from tb_log import get_logger
+from tb_metrics import SAMPLE_MASK
+from tb_tick import PublishSpread, first_tick, phase_offset
+from tb_store import MQTT_CHANNEL
+from tb_synth import SyntheticGenerator, np
+
+
+# 把 paho 客户端的 socket 读写挂到 asyncio 事件循环上
+class AsyncioMqttBridge:
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    # 心跳、重传等定时处理
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+# 一次连续发送的最大条数，超过后让出事件循环处理 PUBACK 等网络读写
+BURST = 500
+
+log = get_logger("sim")
+
+# 子设备注册状态
+UNREGISTERED, REGISTERING, REGISTERED = 0, 1, 2
+# 预先注册 (eager) 时等待全部确认的最长秒数
+REGISTER_TIMEOUT = 30.0
+
+
+# 未安装 NumPy 时的子设备遥测值，与原 run.py 相同
+def default_values(sensor_name, now):
+    return {
+        "temperature": round(20 + 5 * (now % 6) / 5, 2),
+        "humidity": round(50 + 10 * (now % 6) / 5, 2)
+    }
+
+
+class GatewaySimulator:
+    def __init__(self, client, sensors, interval=10.0, qos=1, make_values=None,
+                 sensor_type="Sensor", max_inflight=1000, batcher=None, store=None,
+                 drain_batch=500, drain_rate=1000, encoder=None, deadband=None, rate_limit=None,
+                 global_limit=None, flow=None, registration="eager", phase="spread", align=False,
+                 dispatcher=None, supervisor=None):
+        self.client = client
+        self.sensors = list(sensors)
+        self.interval = interval
+        self.qos = qos
+        if make_values is None:
+            make_values = default_values if np is None else SyntheticGenerator(self.sensors).values
+        self.make_values = make_values
+        self.sensor_type = sensor_type
+        # 消息体编码器 (tb_encode)，batcher 应使用同一个编码器
+        self.encoder = encoder or JsonEncoder()
+        # 设置 deadband (tb_deadband.DeadbandFilter) 时只发送超出死区或到心跳时间的键
+        self.deadband = deadband
+        # 设置 batcher (tb_batch.BatchPublisher) 时读数先合并再发送
+        self.batcher = batcher
+        # 设置 store (tb_store.TelemetryStore) 时发送失败的消息写入本地缓存，连接恢复后限速补发
+        self.store = store
+        self.drain_batch = drain_batch
+        self.drain_rate = drain_rate
+        self.connected = False
+        # 发送流控：max_inflight 为未确认消息窗口，rate_limit 为本连接的速率限制 ("容量:秒,...")，
+        # global_limit 为多个连接共用的 tb_flow.RateLimit (租户限额)
+        self.flow = flow or FlowControl(max_inflight, rate_limit, global_limit)
+        # eager: 连接后先流水线注册全部子设备并等待确认；lazy: 每个子设备第一条遥测前注册
+        self.registration = registration
+        self.registered = bytearray(len(self.sensors))
+        self._registering = 0
+        self._all_registered = None
+        # 第一拍的相位方式 (tb_tick.PHASES) 和是否对齐到墙上时钟的整间隔
+        self.phase = phase
+        self.align = align
+        # 发送时间分布 (峰值/均值)
+        self.spread = PublishSpread()
+        # 下行 RPC / 共享属性分发；intervals 为按共享属性或 RPC 单独设置的发送间隔: {下标: 秒}
+        self.dispatcher = dispatcher
+        self.intervals = {}
+        self._indexes = None
+        self._loop = None
+        # 断线重连
+        self.supervisor = supervisor
+        # 调度堆: (下次发送时间, 传感器下标)
+        self.heap = []
+        self.stats = {"published": 0, "errors": 0, "suppressed": 0, "dropped": 0, "registered": 0, "started": None,
+                      "connect_s": None, "first_telemetry_s": None}
+        self._connected = None
+        self._connect_started = None
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0 and self._connected.done():
+            # 重新连接后服务端的子设备会话已失效，重新注册 (lazy 方式，随下一条遥测发送)
+            self.registered = bytearray(len(self.sensors))
+        self.connected = rc == 0
+        if rc == 0 and self.dispatcher:
+            self.dispatcher.subscribe(client)
+        if not self._connected.done():
+            if rc == 0:
+                self._connected.set_result(rc)
+            else:
+                self._connected.set_exception(ConnectionError(f"MQTT 连接失败: {mqtt.connack_string(rc)}"))
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        if self.dispatcher:
+            self.dispatcher.disconnected()
+
+    async def connect(self, host, port=1883, keepalive=60):
+        loop = self._loop = asyncio.get_running_loop()
+        AsyncioMqttBridge(loop, self.client)
+        if self.dispatcher:
+            self.dispatcher.attach(self.client, publish=self._publish_threadsafe)
+        self._connected = loop.create_future()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.flow.attach(self.client)
+        if self.supervisor:
+            self.supervisor.attach(self.client)
+        self._connect_started = time.monotonic()
+        self.client.connect(host, port, keepalive)
+        await self._connected
+        self.stats["connect_s"] = time.monotonic() - self._connect_started
+        print(f"[INFO] MQTT 已连接: {host}:{port}, 耗时 {self.stats['connect_s'] * 1000:.1f} ms")
+
+    # 发送一个子设备的注册消息，PUBACK 后标记为已注册；发送失败返回 False
+    def _register(self, index):
+        if not self.connected:
+            # 断开期间不注册，重连后随下一条遥测注册
+            return False
+        self.registered[index] = REGISTERING
+        self._registering += 1
+        info = self.flow.publish(self.client, "v1/gateway/connect",
+                                 self.encoder.connect(self.sensors[index], self.sensor_type), self.qos,
+                                 sample=False, callback=lambda ok: self._on_registered(index, ok))
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._on_registered(index, False)
+            return False
+        return True
+
+    def _on_registered(self, index, ok):
+        self._registering -= 1
+        if ok:
+            self.registered[index] = REGISTERED
+            self.stats["registered"] += 1
+        else:
+            # 未确认的下次发送遥测前重新注册
+            self.registered[index] = UNREGISTERED
+        if not self._registering and self._all_registered and not self._all_registered.done():
+            self._all_registered.set_result(True)
+
+    # 流水线注册全部未注册的子设备 (受窗口和速率限制)，等待确认最多 timeout 秒，返回已确认数
+    async def register_sensors(self, timeout=REGISTER_TIMEOUT):
+        started = time.monotonic()
+        flow = self.flow
+        for index in range(len(self.sensors)):
+            if self.registered[index] != UNREGISTERED:
+                continue
+            if not flow.ready():
+                await flow.wait()
+            self._register(index)
+        if self._registering:
+            self._all_registered = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._all_registered, timeout)
+            except asyncio.TimeoutError:
+                flow.expire()
+            self._all_registered = None
+        confirmed = self.registered.count(REGISTERED)
+        print(f"[INFO] 注册子设备: {confirmed}/{len(self.sensors)} 个已确认, "
+              f"耗时 {(time.monotonic() - started) * 1000:.1f} ms")
+        return confirmed
+
+    # 发送一条消息，失败时写入本地缓存；也作为 BatchPublisher 的 publish 回调
+    # 断开期间不交给 paho (paho 会在内存中排队，恢复后与缓存补发重复)
+    def publish_payload(self, topic, payload):
+        if self.connected and self.flow.publish(self.client, topic, payload, self.qos).rc == mqtt.MQTT_ERR_SUCCESS:
+            return True
+        self.stats["errors"] += 1
+        if self.store:
+            self.store.put(MQTT_CHANNEL, payload, topic)
+        return False
+
+    # RPC 回复：在工作线程中调用，转到事件循环线程发送 (paho 的 socket 回调只能在事件循环线程中注册)
+    def _publish_threadsafe(self, topic, payload):
+        self._loop.call_soon_threadsafe(
+            lambda: self.flow.publish(self.client, topic, payload, self.qos, sample=False))
+
+    # 按名字设置单个子设备的发送间隔 (秒)，None 恢复默认；从下一次发送后生效。可在任意线程调用
+    def set_interval(self, sensor, seconds):
+        if self._indexes is None:
+            self._indexes = {name: i for i, name in enumerate(self.sensors)}
+        index = self._indexes.get(sensor)
+        if index is None:
+            return False
+        seconds = float(seconds) if seconds is not None else None
+        if seconds is not None and seconds <= 0:
+            raise ValueError(f"无效的发送间隔: {seconds}")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._apply_interval, index, seconds)
+        else:
+            self._apply_interval(index, seconds)
+        return True
+
+    def _apply_interval(self, index, seconds):
+        if seconds is None:
+            self.intervals.pop(index, None)
+        else:
+            self.intervals[index] = seconds
+
+    # 共享属性更新的处理函数 (GatewayDispatcher.on_attributes)：interval 键修改该子设备的发送间隔
+    def on_shared_attributes(self, device, data):
+        if "interval" in data:
+            self.set_interval(device, data["interval"])
+            log.info("子设备发送间隔已修改", device=device, interval=data['interval'])
+
+    # RPC 处理函数 (GatewayDispatcher.on_rpc)：setInterval 的参数为秒数或 {"interval": 秒}，getInterval 无参数
+    def on_interval_rpc(self, device, method, params):
+        if method == "setInterval":
+            seconds = params.get("interval") if isinstance(params, dict) else params
+            if not self.set_interval(device, seconds):
+                return {"error": f"Unknown device: {device}"}
+            return {"interval": float(seconds) if seconds is not None else self.interval}
+        index = (self._indexes or {}).get(device)
+        return {"interval": self.intervals.get(index, self.interval)}
+
+    # 补发缓存中的一批消息，任一条失败即停止 (未确认的记录下次重发)
+    def _republish(self, records):
+        for _, topic, payload in records:
+            if self.flow.publish(self.client, topic, payload, self.qos).rc != mqtt.MQTT_ERR_SUCCESS:
+                return False
+        return True
+
+    # 后台补发任务：连接正常时按批量和速率上限清空缓存，每批不超过流控允许的条数
+    async def drain_store(self):
+        while True:
+            if self.connected and self.store.depth(MQTT_CHANNEL):
+                budget = min(self.drain_batch, self.flow.capacity())
+                if not budget:
+                    await self.flow.wait()
+                    continue
+                sent = self.store.drain_once(MQTT_CHANNEL, self._republish, budget)
+                if sent:
+                    await asyncio.sleep(sent / self.drain_rate)
+                    continue
+            await asyncio.sleep(1)
+
+    def publish_telemetry(self, index, now):
+        sensor = self.sensors[index]
+        values = self.make_values(sensor, now)
+        # 空字典表示这一拍的读数丢失 (模拟丢包)
+        if not values:
+            self.stats["dropped"] += 1
+            return
+        if self.deadband:
+            values = self.deadband.filter(sensor, values, now)
+            if not values:
+                self.stats["suppressed"] += 1
+                return
+        self.spread.record(now)
+        if not self.registered[index]:
+            # 同一连接上消息按顺序到达，注册消息发出后无需等待确认即可发送遥测
+            self._register(index)
+        if self.stats["first_telemetry_s"] is None:
+            self.stats["first_telemetry_s"] = time.monotonic() - self._connect_started
+            print(f"[INFO] 首条遥测: 距开始连接 {self.stats['first_telemetry_s'] * 1000:.1f} ms")
+        if self.batcher:
+            self.batcher.add(sensor, int(now * 1000), values)
+            self.stats["published"] += 1
+            return
+        encoder = self.encoder
+        if self.stats["published"] & SAMPLE_MASK:
+            reading = encoder.reading(int(now * 1000), values)
+        else:
+            started = time.perf_counter()
+            reading = encoder.reading(int(now * 1000), values)
+            ENCODE_READING.observe(time.perf_counter() - started)
+        if self.publish_payload("v1/gateway/telemetry", encoder.gateway([encoder.device(sensor, [reading])])):
+            self.stats["published"] += 1
+        elif self.deadband and not self.store:
+            # 没有缓存时这条读数丢失，下次全部重发
+            self.deadband.reset(sensor)
+
+    # 第一次发送时间：基准时间加上该子设备的相位偏移；子类可覆盖以实现逐步加压等启动方式
+    def first_deadline(self, index, now):
+        return first_tick(self.interval, now, self.align) + phase_offset(
+            self.phase, index, len(self.sensors), self.sensors[index], self.interval)
+
+    # 调度主循环：弹出所有到期的传感器，发送后按固定间隔放回堆中
+    async def schedule(self, duration=None):
+        heap = self.heap
+        now = time.time()
+        heap[:] = [(self.first_deadline(i, now), i) for i in range(len(self.sensors))]
+        heapq.heapify(heap)
+        self.stats["started"] = now
+        deadline = now + duration if duration else None
+        flow = self.flow
+        while heap:
+            now = time.time()
+            if deadline and now >= deadline:
+                break
+            burst = 0
+            while heap[0][0] <= now and burst < BURST:
+                if not flow.ready():
+                    break
+                due, index = heap[0]
+                self.publish_telemetry(index, now)
+                heapq.heapreplace(heap, (due + self.intervals.get(index, self.interval), index))
+                burst += 1
+            if heap[0][0] <= now and not flow.ready():
+                # 窗口已满或超出速率：等到可以发送再继续，到期的传感器顺延 (不在内存中堆积消息)
+                try:
+                    await asyncio.wait_for(flow.wait(), deadline - now if deadline else None)
+                except asyncio.TimeoutError:
+                    break
+                continue
+            # 让出事件循环处理网络读写，没有到期任务时睡到下一个截止时间
+            wake = min(heap[0][0], deadline) if deadline else heap[0][0]
+            if self.batcher:
+                wake = min(wake, time.time() + self.batcher.poll())
+            await asyncio.sleep(max(0.0, wake - time.time()))
+
+    async def run(self, host, port=1883, keepalive=60, duration=None):
+        await self.connect(host, port, keepalive)
+        if self.registration == "eager":
+            await self.register_sensors()
+        drain = asyncio.create_task(self.drain_store()) if self.store else None
+        supervise = asyncio.create_task(self.supervisor.run()) if self.supervisor else None
+        await self.schedule(duration)
+        for task in (drain, supervise):
+            if task:
+                task.cancel()
+        if self.batcher:
+            self.batcher.flush()
+        self.client.disconnect()
+
+    def rate(self):
+        elapsed = time.time() - self.stats["started"] if self.stats["started"] else 0
+        return self.stats["published"] / elapsed if elapsed > 0 else 0.0
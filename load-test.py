@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# load-test.py
+#
+# ThingsBoard 接入能力压测工具。模拟任意数量的子设备按指定速率发送遥测，
+# 输出吞吐、确认延迟分位数、错误率和客户端 CPU，并把结果写入 JSON 文件。
+#
+# 用法:
+#   MQTT (网关接口):  python load-test.py --transport mqtt --mqtt-host 127.0.0.1 --token <网关 token> \
+#                         --sensors 10000 --rate 2000 --ramp-up 30 --duration 120 --qos 1
+#   HTTP (设备接口):  python load-test.py --transport http --sensors 200 --rate 500 --duration 60
+#                     HTTP 模式会按 config.ini 中的 ThingsBoard 账号开通 (或复用) 压测设备
+
+import argparse
+import asyncio
+import configparser
+import json
+
+from tb_batch import BatchPublisher
+from tb_client import TBClient, client_options
+from tb_encode import ENCODERS, get_encoder
+from tb_loadgen import HttpLoadGenerator, MqttLoadGenerator, build_report
+from tb_metrics import REGISTRY, MetricsServer, StackSampler
+from tb_provision import FleetProvisioner
+from tb_reconnect import DEFAULT_MAX_CONNECTING, ConnectionSupervisor, ReconnectGate, mqtt_client
+from tb_shard import run_sharded
+
+
+def main():
+    # 读取配置文件
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description='ThingsBoard 接入能力压测')
+    parser.add_argument('--transport', choices=['mqtt', 'http'], default='mqtt')
+    parser.add_argument('--sensors', type=int, default=1000, help='子设备数量')
+    parser.add_argument('--rate', type=float, help='总发送速率 (msg/s)，指定后覆盖 --interval')
+    parser.add_argument('--interval', type=float, default=10.0, help='每个子设备的发送间隔 (秒)')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='线性加压时间 (秒)')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='单条读数的大致字节数')
+    parser.add_argument('--duration', type=float, default=60.0, help='压测时长 (秒)')
+    parser.add_argument('--synthetic', action='store_true', help='读数使用合成 AM308 数据 (需要 NumPy)，默认锯齿波')
+    parser.add_argument('--seed', type=int, help='合成数据的随机种子，相同种子的读数可复现')
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=1)
+    parser.add_argument('--encoding', choices=list(ENCODERS), default='json',
+                        help='MQTT 消息编码，protobuf 需要网关 Device Profile 使用 Protobuf 负载')
+    parser.add_argument('--batch-size', type=int, default=0, help='MQTT 合并发送条数，0 表示逐条发送')
+    parser.add_argument('--max-inflight', type=int, default=1000, help='每条 MQTT 连接未确认消息数上限')
+    parser.add_argument('--rate-limit', help='每条 MQTT 连接的速率限制，格式 容量:秒[,容量:秒]，如 100:1,2000:60')
+    parser.add_argument('--global-rate-limit', help='所有连接合计的速率限制 (租户限额)，格式同上')
+    parser.add_argument('--registration', choices=['eager', 'lazy'], default='eager',
+                        help='子设备注册方式: eager 先注册全部并等待确认，lazy 在第一条遥测前注册')
+    parser.add_argument('--max-connecting', type=int, default=DEFAULT_MAX_CONNECTING,
+                        help='断线后同时重连的 MQTT 连接数上限 (所有进程合计)，0 表示不自动重连')
+    parser.add_argument('--mqtt-host', default='127.0.0.1')
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--token', help='MQTT 网关 Access Token')
+    parser.add_argument('--connections', type=int, default=1, help='MQTT 网关连接数，子设备按一致性哈希分配')
+    parser.add_argument('--processes', type=int, default=1, help='MQTT 工作进程数')
+    parser.add_argument('--gateway-tokens', help='各网关连接的 Access Token，逗号分隔，数量与 --connections 一致')
+    parser.add_argument('--tb-host', default=config.get('ThingsBoard', 'TB_HOST', fallback=None), help='HTTP 模式服务地址')
+    parser.add_argument('--username', default=config.get('ThingsBoard', 'USERNAME', fallback=None))
+    parser.add_argument('--password', default=config.get('ThingsBoard', 'PASSWORD', fallback=None))
+    parser.add_argument('--workers', type=int, default=32, help='HTTP 并发线程数')
+    parser.add_argument('--prefix', default='LoadTest-Sensor', help='子设备名前缀')
+    parser.add_argument('--output', default='load-test-results.json', help='结果文件')
+    parser.add_argument('--metrics-port', type=int, default=0, help='压测期间在该端口提供 /metrics，0 表示不启动')
+    parser.add_argument('--profile', help='采样发送路径的调用栈并写入该文件 (collapsed stack 格式，单进程 MQTT 模式)')
+    args = parser.parse_args()
+
+    interval = args.sensors / args.rate if args.rate else args.interval
+    sensors = [f"{args.prefix}{i:06d}" for i in range(args.sensors)]
+    print(f"[INFO] 压测开始: {args.transport}, {args.sensors} 个子设备, 每个间隔 {interval:.3f}s, "
+          f"目标 {args.sensors / interval:.1f} msg/s")
+
+    if args.transport == 'mqtt' and (args.connections > 1 or args.processes > 1):
+        tokens = args.gateway_tokens.split(',') if args.gateway_tokens else [args.token] * args.connections
+        if len(tokens) != args.connections:
+            parser.error(f"--gateway-tokens 有 {len(tokens)} 个 token，与 --connections {args.connections} 不一致")
+        gateways = [(f"{args.prefix}-gw{i:03d}", tokens[i]) for i in range(args.connections)]
+        options = {"host": args.mqtt_host, "port": args.mqtt_port, "interval": interval, "qos": args.qos,
+                   "payload_bytes": args.payload_bytes, "ramp_up": args.ramp_up, "duration": args.duration,
+                   "batch_size": args.batch_size, "encoding": args.encoding, "max_inflight": args.max_inflight,
+                   "rate_limit": args.rate_limit, "global_rate_limit": args.global_rate_limit,
+                   "registration": args.registration, "max_connecting": args.max_connecting,
+                   "synthetic": args.synthetic, "seed": args.seed}
+        report = run_sharded(sensors, gateways, args.processes, options)
+        report["config"] = vars(args)
+        report["readings"] = report["sent"]
+    elif args.transport == 'mqtt':
+        # 压测不使用持久会话：每次运行从干净的会话开始，Broker 不为断开的压测连接保留消息
+        client = mqtt_client(f"{args.prefix}-gateway", args.token, persistent=False)
+        generator = MqttLoadGenerator(client, sensors, interval=interval, qos=args.qos,
+                                      payload_bytes=args.payload_bytes, ramp_up=args.ramp_up,
+                                      encoder=get_encoder(args.encoding), max_inflight=args.max_inflight,
+                                      rate_limit=args.rate_limit, global_limit=args.global_rate_limit,
+                                      registration=args.registration, synthetic=args.synthetic, seed=args.seed,
+                                      supervisor=ConnectionSupervisor(client, ReconnectGate(args.max_connecting))
+                                      if args.max_connecting else None)
+        if args.batch_size:
+            generator.batcher = BatchPublisher(generator.publish_payload, batch_size=args.batch_size,
+                                               encoder=generator.encoder)
+        REGISTRY.collect(generator.flow.metrics)
+        profiler = StackSampler().start() if args.profile else None
+        if args.metrics_port:
+            MetricsServer(port=args.metrics_port, profiler=profiler).start()
+        sent, acked, errors, elapsed, cpu = asyncio.run(
+            generator.run_load(args.mqtt_host, args.mqtt_port, duration=args.duration))
+        if profiler:
+            profiler.stop()
+            profiler.write(args.profile)
+            print(f"[INFO] 发送路径采样 {profiler.stats['kept']}/{profiler.stats['samples']} 次，已写入: {args.profile}")
+        readings = generator.stats["published"]
+        if generator.batcher:
+            sent = generator.batcher.stats["payloads"]
+        report = build_report(vars(args), sent, acked, errors, generator.latencies, elapsed, cpu)
+        report["readings"] = readings
+        report["flow"] = generator.flow.stats
+        if generator.supervisor:
+            report["reconnect"] = generator.supervisor.stats
+    else:
+        client = TBClient(args.tb_host, args.username, args.password,
+                          **dict(client_options(config), pool_size=args.workers))
+        client.login()
+        devices = [{"name": name, "profile": "LoadTest-Profile", "gateway": False, "attributes": {}}
+                   for name in sensors]
+        results = FleetProvisioner(client, workers=args.workers).run(devices, progress_every=0)
+        tokens = [r['access_token'] for r in results if r['access_token']]
+        if not tokens:
+            errors = sorted({r['error'] for r in results if r['error']})
+            parser.error(f"没有开通成功的压测设备，无法进行 HTTP 压测: {'; '.join(errors[:3]) or '未取得 Access Token'}")
+        print(f"[INFO] 压测设备就绪: {len(tokens)} 台")
+        generator = HttpLoadGenerator(client, tokens, interval=interval, payload_bytes=args.payload_bytes,
+                                      ramp_up=args.ramp_up, workers=args.workers, synthetic=args.synthetic,
+                                      seed=args.seed)
+        sent, acked, errors, elapsed, cpu = generator.run_load(args.duration)
+        report = build_report(vars(args), sent, acked, errors, generator.latencies, elapsed, cpu)
+        report["readings"] = sent
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[INFO] 吞吐 {report['throughput_msg_s']} msg/s, p50 {report['p50_ms']} ms, p99 {report['p99_ms']} ms, "
+          f"p999 {report['p99.9_ms']} ms, 错误率 {report['error_rate']}, CPU {report['client_cpu_percent']}%")
+    print(f"[INFO] 结果已写入: {args.output}")
+
+
+# 多进程压测 (tb_shard) 在 spawn 方式下会重新导入本脚本，入口代码只在主进程运行
+if __name__ == '__main__':
+    main()
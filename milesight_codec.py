@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# milesight_codec.py
+#
+# Milesight LoRaWAN 上行数据解码 (AM308 / AM319 / EM 系列)。
+# 上行报文由若干 [channel, type, 数据] 组成，每个型号预先编译一张 (channel << 8 | type) -> 解码项 的分发表，
+# 解码项使用预编译的 struct.Struct。批量解码时多条报文按 [长度(1 字节), 报文] 连续存放在一块缓冲区中，
+# 一次遍历整块缓冲区，按列输出 (每个字段一个 array，缺失值为 NaN)，不为每条报文创建字典。
+
+import struct
+from array import array
+
+NAN = float('nan')
+
+_U8 = struct.Struct('<B')
+_I16 = struct.Struct('<h')
+_U16 = struct.Struct('<H')
+
+
+class CodecError(ValueError):
+    pass
+
+
+# 数值字段: (名称, Struct, 缩放系数)
+def _num(name, fmt, scale=1):
+    return (name, fmt.unpack_from, fmt.size, scale, fmt)
+
+
+# 非数值字段: (名称, 解码函数, 长度, None)
+def _text(name, size, decode):
+    return (name, decode, size, None, None)
+
+
+def _version(buf, offset):
+    major, minor = buf[offset], buf[offset + 1]
+    return f"v{major}.{minor}"
+
+
+def _firmware(buf, offset):
+    major, minor = buf[offset], buf[offset + 1]
+    return f"v{major}.{minor >> 4}.{minor & 0x0F}" if minor > 0x0F else f"v{major}.{minor}"
+
+
+def _sn(buf, offset):
+    return bytes(buf[offset:offset + 8]).hex().upper()
+
+
+def _class(buf, offset):
+    return ("Class A", "Class B", "Class C", "Class CtoB")[buf[offset]] if buf[offset] < 4 else str(buf[offset])
+
+
+# 所有型号共有的设备信息 (channel 0xFF)
+_DEVICE_INFO = {
+    0xFF01: _text("ipso_version", 1, lambda buf, i: f"v{buf[i] >> 4}.{buf[i] & 0x0F}"),
+    0xFF09: _text("hardware_version", 2, _version),
+    0xFF0A: _text("firmware_version", 2, _firmware),
+    0xFF0B: _text("device_status", 1, lambda buf, i: "on"),
+    0xFF0F: _text("lorawan_class", 1, _class),
+    0xFF16: _text("sn", 8, _sn),
+    0xFFFF: _text("tsl_version", 2, _version),
+}
+
+_BATTERY = {0x0175: _num("battery", _U8)}
+_TEMP_HUMI = {
+    0x0367: _num("temperature", _I16, 0.1),
+    0x0468: _num("humidity", _U8, 0.5),
+}
+
+# 型号 -> 字段定义
+MODELS = {
+    "AM308": {
+        **_BATTERY, **_TEMP_HUMI,
+        0x0500: _num("pir", _U8),
+        0x06CB: _num("light_level", _U8),
+        0x077D: _num("co2", _U16),
+        0x087D: _num("tvoc", _U16, 0.01),       # IAQ 等级
+        0x08E6: _num("tvoc", _U16),             # µg/m³ (新固件)
+        0x0973: _num("pressure", _U16, 0.1),
+        0x0A7D: _num("hcho", _U16, 0.01),
+        0x0B7D: _num("pm2_5", _U16),
+        0x0C7D: _num("pm10", _U16),
+        0x0E01: _num("buzzer_status", _U8),
+    },
+    "AM319": {
+        **_BATTERY, **_TEMP_HUMI,
+        0x0500: _num("pir", _U8),
+        0x06CB: _num("light_level", _U8),
+        0x077D: _num("co2", _U16),
+        0x087D: _num("tvoc", _U16, 0.01),
+        0x08E6: _num("tvoc", _U16),
+        0x0973: _num("pressure", _U16, 0.1),
+        0x0A7D: _num("hcho", _U16, 0.01),
+        0x0B7D: _num("pm2_5", _U16),
+        0x0C7D: _num("pm10", _U16),
+        0x0D7D: _num("o3", _U16, 0.01),
+        0x0E01: _num("buzzer_status", _U8),
+    },
+    "EM300-TH": {**_BATTERY, **_TEMP_HUMI},
+    "EM500-CO2": {
+        **_BATTERY, **_TEMP_HUMI,
+        0x057D: _num("co2", _U16),
+        0x0673: _num("pressure", _U16, 0.1),
+    },
+    "EM310-UDL": {
+        **_BATTERY,
+        0x0382: _num("distance", _U16),
+        0x0400: _num("position", _U8),
+    },
+}
+
+
+# 预编译的分发表：型号 -> {channel<<8|type: 解码项}
+class ModelCodec:
+    def __init__(self, model):
+        if model not in MODELS:
+            raise CodecError(f"不支持的型号: {model}")
+        self.model = model
+        self.table = {**_DEVICE_INFO, **MODELS[model]}
+        # 数值字段的列名，保持定义顺序
+        self.columns = list(dict.fromkeys(e[0] for e in self.table.values() if e[3] is not None))
+
+    # 解码一条报文为字典
+    def decode(self, payload):
+        table = self.table
+        result = {}
+        end = len(payload)
+        i = 0
+        while i < end:
+            if i + 2 > end:
+                raise CodecError(f"报文在偏移 {i} 处截断")
+            entry = table.get(payload[i] << 8 | payload[i + 1])
+            if entry is None:
+                raise CodecError(f"{self.model} 未知的 channel/type: {payload[i]:02X} {payload[i + 1]:02X}")
+            name, read, size, scale, _ = entry
+            i += 2
+            if i + size > end:
+                raise CodecError(f"{name} 数据长度不足")
+            if scale is None:
+                result[name] = read(payload, i)
+            elif scale == 1:
+                result[name] = read(payload, i)[0]
+            else:
+                result[name] = round(read(payload, i)[0] * scale, 2)
+            i += size
+        return result
+
+    # 批量解码：buffer 为 pack_frames() 格式，一次遍历整块缓冲区，输出列式结果
+    # 返回 (帧数, {字段: array('d')})，某帧没有该字段时为 NaN；
+    # 传入 errors 列表时遇到无法解析的帧记录 (帧序号, 错误信息) 并跳过，否则抛出 CodecError
+    def decode_columns(self, buffer, errors=None):
+        data = bytes(buffer)
+        end = len(data)
+        starts = []
+        i = 0
+        while i < end:
+            starts.append(i)
+            i += 1 + data[i]
+        if i != end:
+            raise CodecError("缓冲区末尾的报文不完整")
+
+        count = len(starts)
+        columns = {name: array('d', [NAN]) * count for name in self.columns}
+        # 本次调用的分发表：把目标列直接绑定到解码项上，循环内不再按名称查找
+        # 比例均为 1/整数 (1、0.5、0.1、0.01)，整数原始值除以该整数与 decode() 中乘比例后保留两位小数的结果相同
+        table = {key: (columns[e[0]] if e[3] is not None else None, e[1], 2 + e[2],
+                       round(1 / e[3]) if e[3] is not None else None)
+                 for key, e in self.table.items()}
+        for row, start in enumerate(starts):
+            i = start + 1
+            stop = i + data[start]
+            while i < stop:
+                entry = table.get(data[i] << 8 | data[i + 1]) if i + 2 <= stop else None
+                if entry is None or i + entry[2] > stop:
+                    error = f"帧 {row} 在偏移 {i - start - 1} 处无法解析"
+                    if errors is None:
+                        raise CodecError(error)
+                    errors.append((row, error))
+                    break
+                column, read, size, divisor = entry
+                if column is not None:
+                    column[row] = read(data, i + 2)[0] / divisor
+                i += size
+        return count, columns
+
+    # 批量解码为字典列表 (逐帧)，便于直接作为遥测上报
+    def decode_frames(self, buffer):
+        view = memoryview(buffer)
+        frames = []
+        i = 0
+        while i < len(view):
+            length = view[i]
+            frames.append(self.decode(view[i + 1:i + 1 + length]))
+            i += 1 + length
+        return frames
+
+    # 按字段编码一条报文 (仅数值字段)，用于生成测试数据和模拟上行
+    def encode(self, values):
+        by_name = {}
+        for key, entry in self.table.items():
+            if entry[3] is not None:
+                by_name.setdefault(entry[0], (key, entry))
+        out = bytearray()
+        for name, value in values.items():
+            key, (_, _, _, scale, fmt) = by_name[name]
+            out += bytes((key >> 8, key & 0xFF))
+            out += fmt.pack(int(round(value / scale)))
+        return bytes(out)
+
+
+_CODECS = {}
+
+
+# 获取型号对应的解码器 (缓存)
+def get_codec(model):
+    codec = _CODECS.get(model)
+    if codec is None:
+        codec = _CODECS[model] = ModelCodec(model)
+    return codec
+
+
+def decode(model, payload):
+    return get_codec(model).decode(payload)
+
+
+# 把多条报文打包为连续缓冲区: [长度][报文][长度][报文]...
+def pack_frames(frames):
+    out = bytearray()
+    for frame in frames:
+        if len(frame) > 255:
+            raise CodecError("单条报文超过 255 字节")
+        out.append(len(frame))
+        out += frame
+    return bytes(out)
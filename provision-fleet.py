@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# provision-fleet.py
+#
+# 批量开通网关/传感器。读取设备清单 (CSV 或 JSON)，只登录一次，
+# 通过连接池和有界线程池并发开通整批设备，并把每台设备的结果写入结果文件。
+#
+# 用法:
+#   python provision-fleet.py devices.csv --workers 32 --output results.csv
+#   python provision-fleet.py devices.csv --profile-template sensor   # 同时按声明同步 Device Profile
+#
+# CSV 清单至少包含 name 列，可选 profile、gateway 列，其余列作为 SERVER_SCOPE 属性；
+# JSON 清单为对象列表，属性可放在 "attributes" 字段中。
+
+import argparse
+import configparser
+import time
+
+from tb_attrs import attribute_options
+from tb_client import TBClient, client_options
+from tb_credentials import CredentialStore, credential_options
+from tb_profile import reconciler_options
+from tb_provision import FleetProvisioner, load_manifest, write_results, summarize
+
+# 读取配置文件
+config = configparser.ConfigParser()
+config.read('config.ini', encoding='utf-8')
+
+parser = argparse.ArgumentParser(description='ThingsBoard 批量设备开通')
+parser.add_argument('manifest', help='设备清单文件 (.csv / .json)')
+parser.add_argument('--workers', type=int, default=16, help='并发线程数')
+parser.add_argument('--output', default='provision-results.csv', help='结果文件 (.csv / .json)')
+parser.add_argument('--profile', default=config.get('Device', 'device_profile_name', fallback=None),
+                    help='清单未指定 profile 时使用的 Device Profile')
+parser.add_argument('--profile-template', help='按 profiles.json 中的该模板同步清单中的所有 Device Profile')
+args = parser.parse_args()
+
+try:
+    devices = load_manifest(args.manifest, default_profile=args.profile)
+except ValueError as e:
+    parser.error(str(e))
+print(f"[INFO] 读取设备清单完成，共 {len(devices)} 台设备")
+
+client = TBClient(config['ThingsBoard']['TB_HOST'],
+                  config['ThingsBoard']['USERNAME'],
+                  config['ThingsBoard']['PASSWORD'],
+                  **dict(client_options(config), pool_size=args.workers))
+client.login()
+print("[INFO] 登录成功，JWT token 获取完毕")
+
+started = time.perf_counter()
+profile_options = reconciler_options(config)
+attr_options = attribute_options(config)
+credentials = credential_options(config)
+results = FleetProvisioner(client, workers=args.workers, profile_template=args.profile_template,
+                           spec_path=profile_options['spec_path'],
+                           profile_cache=profile_options['cache_path'],
+                           attribute_cache=attr_options['cache_path'],
+                           verify_attributes=attr_options['verify'],
+                           credentials=CredentialStore(credentials['path']),
+                           credential_max_age=credentials['max_age']).run(devices)
+summary = summarize(results, time.perf_counter() - started)
+
+write_results(args.output, results)
+print(f"[INFO] 开通结果已写入: {args.output}")
+print(f"[INFO] 汇总: {summary}")
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# replay.py
+#
+# 历史遥测回放工具：把记录的传感器数据经网关接口重新发送到 ThingsBoard，或把 CSV / JSONL 转换为列式文件。
+#
+# 用法:
+#   原速回放:     python replay.py history.csv --token <网关 token> --mqtt-host 127.0.0.1
+#   10 倍速:      python replay.py history.jsonl --token <网关 token> --speed 10x --timestamps rebase
+#   最快速度:     python replay.py history.tbr --token <网关 token> --speed max --rate-limit 1000:1
+#   转换格式:     python replay.py history.csv --convert history.tbr
+
+import argparse
+import asyncio
+import time
+
+import paho.mqtt.client as mqtt
+
+from tb_encode import ENCODERS, get_encoder
+from tb_replay import FORMATS, TIMESTAMPS, TelemetryReplayer, convert, open_source, parse_speed
+
+parser = argparse.ArgumentParser(description='历史遥测回放')
+parser.add_argument('input', help='回放文件 (.csv / .jsonl / .tbr)')
+parser.add_argument('--format', choices=FORMATS, help='文件格式，默认按扩展名判断')
+parser.add_argument('--ts-column', default='ts', help='时间戳列名 (CSV / JSONL)')
+parser.add_argument('--device-column', default='device', help='子设备名列名 (CSV / JSONL)')
+parser.add_argument('--convert', metavar='OUTPUT', help='转换为列式文件 (.tbr) 后退出，不发送')
+parser.add_argument('--speed', type=parse_speed, default=1.0, help='回放速度: 1、10x、max')
+parser.add_argument('--timestamps', choices=TIMESTAMPS, default='original',
+                    help='original 保留原时间戳，rebase 平移到回放开始时刻 (间隔按速度缩短)')
+parser.add_argument('--duration', type=float, help='最长回放时间 (秒)')
+parser.add_argument('--batch-size', type=int, default=500, help='每条 v1/gateway/telemetry 消息合并的读数')
+parser.add_argument('--linger', type=float, default=0.2, help='未满的批次最长等待时间 (秒)')
+parser.add_argument('--encoding', choices=list(ENCODERS), default='json')
+parser.add_argument('--qos', type=int, choices=[0, 1], default=1)
+parser.add_argument('--max-inflight', type=int, default=1000, help='未确认消息数上限')
+parser.add_argument('--rate-limit', help='MQTT 速率限制，格式 容量:秒[,容量:秒]，如 100:1,2000:60')
+parser.add_argument('--sensor-type', default='Sensor', help='子设备注册时的设备类型')
+parser.add_argument('--progress', type=float, default=5.0, help='进度输出间隔 (秒)，0 表示只输出结果')
+parser.add_argument('--mqtt-host', default='127.0.0.1')
+parser.add_argument('--mqtt-port', type=int, default=1883)
+parser.add_argument('--token', help='MQTT 网关 Access Token')
+args = parser.parse_args()
+
+source = open_source(args.input, args.format, args.ts_column, args.device_column)
+
+if args.convert:
+    started = time.perf_counter()
+    stats = convert(source, args.convert)
+    print(f"[INFO] 已转换: {args.convert}, {stats['records']:,} 条, 跳过非数值 {stats['skipped']:,} 个, "
+          f"耗时 {time.perf_counter() - started:.1f} s")
+else:
+    client = mqtt.Client("replay-gateway")
+    if args.token:
+        client.username_pw_set(args.token)
+    encoder = get_encoder(args.encoding)
+    replayer = TelemetryReplayer(client, source, speed=args.speed, timestamps=args.timestamps,
+                                 batch_size=args.batch_size, linger=args.linger, progress_every=args.progress,
+                                 qos=args.qos, encoder=encoder, max_inflight=args.max_inflight,
+                                 rate_limit=args.rate_limit, sensor_type=args.sensor_type)
+    speed = f"{args.speed:g} 倍速" if args.speed else "最快速度"
+    print(f"[INFO] 开始回放: {args.input}, {speed}, 时间戳 {args.timestamps}")
+    asyncio.run(replayer.run(args.mqtt_host, args.mqtt_port, duration=args.duration))
+    print(f"[INFO] 发送统计: {replayer.batcher.stats}, 流控: {replayer.flow.stats}")
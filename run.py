@@ -1,9 +1,27 @@
 # -*- coding: utf-8 -*-
-import requests
+import asyncio
+import configparser
 import time
 import threading
-import paho.mqtt.client as mqtt
-import json
+
+from tb_attrs import AttributeSync
+from tb_client import TBClient, client_options
+from tb_credentials import CredentialStore, device_token
+from tb_lookup import DeviceIndex
+from tb_shared import SharedAttributeCache
+from tb_profile import sync_profile
+from tb_reconnect import Backoff, ConnectionSupervisor, ReconnectGate, mqtt_client
+from gw_sim import GatewaySimulator, default_values
+from tb_batch import BatchPublisher
+from tb_deadband import Deadband, DeadbandFilter
+from tb_dispatch import GatewayDispatcher
+from tb_encode import get_encoder
+from tb_store import HttpTelemetrySender, TelemetryStore
+from tb_synth import SyntheticGenerator, np
+from tb_tick import Ticker, hash_offset
+from gw_metrics import SystemMetrics
+from tb_log import get_logger, setup_logging
+from tb_metrics import REGISTRY, MetricsServer, StackSampler
 
 # ================= 配置 =================
 TB_HOST = "https://thingsboard.cloud"
@@ -14,6 +32,75 @@ GATEWAY_NAME = "MyPythonGateway"
 DEVICE_PROFILE_NAME = "GatewayProfile"
 SENSORS = ["Sensor1", "Sensor2", "Sensor3"]
 
+# HTTP 连接池大小 (每个主机)
+HTTP_POOL_SIZE = 4
+
+# 网关存储 (eMMC) 挂载点，用于采集存储容量
+METRICS_DISK_PATH = "/"
+
+# 设备 Access Token 本地凭据库
+CREDENTIALS_PATH = "credentials.db"
+
+# 断网缓存队列文件和容量上限 (MB)
+STORE_PATH = "run-store.db"
+STORE_MAX_MB = 64
+
+# 子设备遥测合并发送: 每条消息最多读数条数、最长等待秒数、消息字节上限
+BATCH_SIZE = 500
+BATCH_LINGER = 0.5
+BATCH_MAX_PAYLOAD_BYTES = 64 * 1024
+
+# MQTT 发送流控: 未确认消息数上限和速率限制 (ThingsBoard 限流格式 容量:秒，逗号分隔多个窗口)
+# 设为略低于服务端的 device / tenant 限额，超出时模拟器暂停产生读数而不是堆积消息
+MQTT_MAX_INFLIGHT = 100
+MQTT_RATE_LIMIT = "100:1,2000:60"
+
+# 子设备注册方式: lazy 在每个子设备第一条遥测前注册 (首条遥测只等连接建立)；
+# eager 连接后先流水线注册全部子设备并等待 PUBACK 确认
+REGISTRATION = "lazy"
+
+# 发送间隔 (秒)；子设备的第一拍按相位均匀分散在间隔内 (spread / hash / none)，之后按绝对时间递推不漂移
+# SCHEDULE_ALIGN=True 时对齐到墙上时钟的整间隔
+TELEMETRY_INTERVAL = 10
+SENSOR_PHASE = "spread"
+SCHEDULE_ALIGN = False
+
+# 子设备读数: 合成 AM308 数据 (需要 NumPy，否则为锯齿波) 的随机种子 (None 时每次运行不同)
+# 和每次读数丢失的概率 (模拟 LoRaWAN 上行丢失)
+SYNTHETIC_SEED = None
+SYNTHETIC_DROPOUT = 0.01
+
+# 下行 RPC / 共享属性处理线程数和未处理完的消息上限 (超出时 RPC 直接回复 Gateway busy)
+RPC_WORKERS = 8
+RPC_MAX_PENDING = 1000
+
+# MQTT 断线重连: 退避 (秒，每次 random(base, 上次 * 3)，不超过 cap) 和同时重连的连接数上限
+# 使用持久会话 (clean_session=False，client id 为网关名)，重连后 Broker 保留订阅和未送达的下行消息
+MQTT_RECONNECT_BASE = 1
+MQTT_RECONNECT_CAP = 120
+MQTT_MAX_CONNECTING = 1
+
+# 子设备共享属性本地缓存: 启动时批量取回的键；MQTT 推送断开时条目的有效期 (秒)
+SHARED_ATTRIBUTE_KEYS = ["interval"]
+SHARED_ATTRIBUTE_TTL = 300
+
+# 遥测编码: json / template (固定键预渲染模板)；protobuf 需要网关的 Device Profile 使用 Protobuf 负载
+TELEMETRY_ENCODING = "template"
+
+# 子设备按变化上报: 各键死区 (绝对值 / 百分比) 和每个键的最长静默秒数 (心跳)
+DEADBAND = {"temperature": Deadband(abs_threshold=0.2), "humidity": Deadband(pct_threshold=0.02),
+            "co2": Deadband(abs_threshold=20), "tvoc": Deadband(abs_threshold=0.1), "pm2_5": Deadband(abs_threshold=2)}
+DEADBAND_HEARTBEAT = 600
+
+# 日志级别 (DEBUG 时输出每次网关遥测的内容)；同一条日志每分钟最多 LOG_RATE_LIMIT 条
+LOG_LEVEL = "INFO"
+LOG_RATE_LIMIT = 10
+
+# 本地指标端点 http://127.0.0.1:METRICS_PORT/metrics (Prometheus 格式)，0 表示不启动
+# PROFILE_INTERVAL > 0 时按该间隔 (秒) 采样事件循环线程在发送路径上的调用栈，从 /profile 取回
+METRICS_PORT = 0
+PROFILE_INTERVAL = 0
+
 # 网关固定属性
 CLIENT_ATTRIBUTES = {
     "Model": "UG65-L04EU-915M-EA",
@@ -24,45 +111,27 @@ CLIENT_ATTRIBUTES = {
     "HardwareVersion": "V1.3"
 }
 
+setup_logging(LOG_LEVEL, rate=LOG_RATE_LIMIT)
+log = get_logger("run")
+
 # ================= HTTP 登录获取 JWT =================
-login_url = f"{TB_HOST}/api/auth/login"
-login_resp = requests.post(login_url, json={"username": USERNAME, "password": PASSWORD})
-login_resp.raise_for_status()
-jwt_token = login_resp.json()['token']
-headers = {'Content-Type': 'application/json', 'X-Authorization': f'Bearer {jwt_token}'}
+# 所有 HTTP 请求 (包括网关 telemetry 循环) 共用同一个 keep-alive 连接池；
+# token 缓存和每个主机的连接上限与其它脚本共用 config.ini ([ThingsBoard] token_cache、[HTTP])
+config = configparser.ConfigParser()
+config.read('config.ini', encoding='utf-8')
+client = TBClient(TB_HOST, USERNAME, PASSWORD, **dict(client_options(config), pool_size=HTTP_POOL_SIZE))
+jwt_token = client.login()
+session = client.session
 print(f"[INFO] 登录成功，JWT token 获取完毕")
 
 # ================= HTTP 创建网关设备 =================
-# 检查 Device Profile
-profiles_resp = requests.get(f"{TB_HOST}/api/deviceProfiles?pageSize=100&page=0", headers=headers)
-profiles_resp.raise_for_status()
-profiles = profiles_resp.json().get('data', [])
-existing_profile = next((p for p in profiles if p['name'] == DEVICE_PROFILE_NAME), None)
-
-if existing_profile:
-    device_profile_id = existing_profile['id']['id']
-    print(f"[INFO] Device Profile 已存在: {DEVICE_PROFILE_NAME}")
-else:
-    profile_payload = {
-        "name": DEVICE_PROFILE_NAME,
-        "type": "DEFAULT",
-        "transportType": "DEFAULT",
-        "profileData": {"configuration": {"type": "DEFAULT"},
-                        "transportConfiguration": {"type": "DEFAULT"}}
-    }
-    resp = requests.post(f"{TB_HOST}/api/deviceProfile", json=profile_payload, headers=headers)
-    resp.raise_for_status()
-    device_profile_id = resp.json()['id']['id']
-    print(f"[INFO] Device Profile 创建成功: {DEVICE_PROFILE_NAME}")
+# 按 profiles.json 中的声明同步 Device Profile (已同步且声明未变时不发请求)
+device_profile_id = sync_profile(client, 'default', DEVICE_PROFILE_NAME)
 
 # 检查并创建网关
-devices_resp = requests.get(f"{TB_HOST}/api/tenant/devices?pageSize=100&page=0", headers=headers)
-devices_resp.raise_for_status()
-devices = devices_resp.json().get('data', [])
-existing_device = next((d for d in devices if d['name'] == GATEWAY_NAME), None)
+device_id = DeviceIndex(client).get(GATEWAY_NAME)
 
-if existing_device:
-    device_id = existing_device['id']['id']
+if device_id:
     print(f"[INFO] 网关设备已存在: {GATEWAY_NAME}")
 else:
     device_payload = {
@@ -71,79 +140,90 @@ else:
         "deviceProfileId": {"id": device_profile_id, "entityType": "DEVICE_PROFILE"},
         "additionalInfo": {"gateway": True}
     }
-    resp = requests.post(f"{TB_HOST}/api/device", json=device_payload, headers=headers)
+    resp = session.post(f"{TB_HOST}/api/device", json=device_payload)
     resp.raise_for_status()
     device_id = resp.json()['id']['id']
     print(f"[INFO] 网关设备创建成功，ID: {device_id}")
 
-# 获取网关 Access Token
-credentials_resp = requests.get(f"{TB_HOST}/api/device/{device_id}/credentials", headers=headers)
-credentials_resp.raise_for_status()
-GATEWAY_TOKEN = credentials_resp.json()['credentialsId']
+# 获取网关 Access Token (本地凭据库中未过期时直接使用)
+credential_store = CredentialStore(CREDENTIALS_PATH)
+GATEWAY_TOKEN = device_token(client, credential_store, GATEWAY_NAME, device_id)
 print(f"[INFO] 网关 Access Token 获取成功: {GATEWAY_TOKEN}")
 
-# 上报网关固定属性
-attr_url = f"{TB_HOST}/api/v1/{GATEWAY_TOKEN}/attributes"
-requests.post(attr_url, json=CLIENT_ATTRIBUTES, headers={'Content-Type': 'application/json'}).raise_for_status()
-print(f"[INFO] 网关属性上报成功")
-
-# ================= MQTT 客户端 =================
-MQTT_CLIENT = mqtt.Client(GATEWAY_NAME)
-MQTT_CLIENT.username_pw_set(GATEWAY_TOKEN)
-MQTT_CLIENT.connect("thingsboard.cloud", 1883, 60)
-MQTT_CLIENT.loop_start()
-time.sleep(1)
-
-# 注册子设备
-for sensor in SENSORS:
-    payload = {"device": sensor, "type": "Sensor"}
-    MQTT_CLIENT.publish("v1/gateway/connect", json.dumps(payload), qos=1)
-    print(f"[INFO] 注册子设备: {sensor}")
-time.sleep(2)
+# 上报网关固定属性 (只发送与上次不同的键，未变化时不发请求)
+if AttributeSync(client).sync_client(GATEWAY_TOKEN, CLIENT_ATTRIBUTES):
+    print("[INFO] 网关属性上报成功")
+else:
+    print("[INFO] 网关属性无变化，跳过上报")
+
+# ================= 断网缓存 =================
+# 网关 HTTP telemetry 和子设备 MQTT 消息发送失败时写入同一个本地队列，恢复后限速补发
+store = TelemetryStore(STORE_PATH, max_bytes=STORE_MAX_MB * 1024 * 1024)
+# HTTP 设备接口只支持 JSON
+http_encoder = get_encoder("json" if TELEMETRY_ENCODING == "protobuf" else TELEMETRY_ENCODING)
+# 网关 Token 被拒绝 (401 / 403) 时重新验证并获取，期间数据保留在队列中
+telemetry_sender = HttpTelemetrySender(client, GATEWAY_TOKEN, store, encoder=http_encoder,
+                                       renew=lambda: device_token(client, credential_store, GATEWAY_NAME, device_id,
+                                                                  max_age=0))
+system_metrics = SystemMetrics(disk_path=METRICS_DISK_PATH)
 
 # ================= 网关 telemetry 线程 =================
 def gateway_telemetry_thread():
-    url = f"{TB_HOST}/api/v1/{GATEWAY_TOKEN}/telemetry"
-    while True:
-        data = {
-            "LocalTime": time.strftime("%Y-%m-%d %H:%M:%S %A"),
-            "Uptime": "13days,03:26:19",
-            "CPULoad": 7.0,
-            "RAM_Capacity_MB": 512,
-            "RAM_Available_MB": 121,
-            "RAM_Usage_Percent": 23.63,
-            "eMMC_Capacity_GB": 8.0,
-            "eMMC_Available_GB": 6.5,
-            "eMMC_Usage_Percent": 80.88
-        }
-        try:
-            requests.post(url, json=data, headers={'Content-Type': 'application/json'}).raise_for_status()
-            print(f"[INFO] 网关 telemetry: {data}")
-        except Exception as e:
-            print(f"[ERROR] 网关 telemetry 发送失败: {e}")
-        time.sleep(10)
-
-# ================= 子设备 telemetry 线程 =================
-def sensor_telemetry_thread(sensor_name):
+    ticker = Ticker(TELEMETRY_INTERVAL, offset=hash_offset(GATEWAY_NAME, TELEMETRY_INTERVAL), align=SCHEDULE_ALIGN)
     while True:
-        ts = int(time.time() * 1000)
-        telemetry = [{
-            "ts": ts,
-            "values": {
-                "temperature": round(20 + 5*(time.time()%6)/5, 2),
-                "humidity": round(50 + 10*(time.time()%6)/5, 2)
-            }
-        }]
-        payload = {sensor_name: telemetry}
-        MQTT_CLIENT.publish("v1/gateway/telemetry", json.dumps(payload), qos=1)
-        print(f"[INFO] {sensor_name} telemetry: {telemetry}")
-        time.sleep(10)
-
-# 启动线程
+        ticker.wait()
+        # CPU、内存、运行时间和存储均为实际采集的数值
+        data = {"LocalTime": time.strftime("%Y-%m-%d %H:%M:%S %A")}
+        data.update(system_metrics.sample())
+        data["storage.messageCount"] = store.depth()
+        # 子设备 MQTT 连接的未确认消息数、PUBACK 延迟和被限流次数
+        data.update(simulator.flow.metrics())
+        # 子设备发送时间分布: 峰值/均值 (越接近 1 越平滑)
+        data["mqtt.publishPeakToMean"] = simulator.spread.report()["peak_to_mean"]
+        # 下行 RPC 数量和处理延迟
+        data.update(dispatcher.metrics())
+        # 断线重连次数、重连尝试和恢复时间
+        data.update(supervisor.metrics())
+        if telemetry_sender.send(data):
+            log.debug("网关遥测已发送", **data)
+        else:
+            log.warning("网关遥测已缓存", pending=store.depth())
+
+# ================= 子设备 telemetry (asyncio 单线程调度) =================
+# 所有子设备共用一个事件循环和一个 MQTT 连接，由 GatewaySimulator 按最小堆调度发送
+MQTT_CLIENT = mqtt_client(GATEWAY_NAME, GATEWAY_TOKEN)
+supervisor = ConnectionSupervisor(MQTT_CLIENT, ReconnectGate(MQTT_MAX_CONNECTING),
+                                  Backoff(MQTT_RECONNECT_BASE, MQTT_RECONNECT_CAP))
+# 订阅下行 RPC 和共享属性：共享属性 interval 或 RPC setInterval / getInterval 调整单个子设备的发送间隔
+dispatcher = GatewayDispatcher(workers=RPC_WORKERS, max_pending=RPC_MAX_PENDING)
+sensor_values = default_values if np is None else SyntheticGenerator(
+    SENSORS, seed=SYNTHETIC_SEED, dropout=SYNTHETIC_DROPOUT).values
+simulator = GatewaySimulator(MQTT_CLIENT, SENSORS, interval=TELEMETRY_INTERVAL, qos=1, store=store,
+                             make_values=sensor_values,
+                             phase=SENSOR_PHASE, align=SCHEDULE_ALIGN,
+                             max_inflight=MQTT_MAX_INFLIGHT, rate_limit=MQTT_RATE_LIMIT, registration=REGISTRATION,
+                             encoder=get_encoder(TELEMETRY_ENCODING),
+                             deadband=DeadbandFilter(DEADBAND, heartbeat=DEADBAND_HEARTBEAT), dispatcher=dispatcher,
+                             supervisor=supervisor)
+# 共享属性启动时一次批量取回 (已在界面上设置的 interval 重启后仍然生效)，之后由 MQTT 推送保持最新
+shared_attributes = SharedAttributeCache(client, ttl=SHARED_ATTRIBUTE_TTL, dispatcher=dispatcher)
+shared_attributes.listen(simulator.on_shared_attributes)
+shared_attributes.load(SENSORS, SHARED_ATTRIBUTE_KEYS)
+dispatcher.on_rpc("setInterval", simulator.on_interval_rpc)
+dispatcher.on_rpc("getInterval", simulator.on_interval_rpc)
+simulator.batcher = BatchPublisher(simulator.publish_payload, batch_size=BATCH_SIZE,
+                                   linger=BATCH_LINGER, max_payload_bytes=BATCH_MAX_PAYLOAD_BYTES,
+                                   encoder=simulator.encoder)
+
+# 本地指标端点：发送延迟、HTTP 延迟和编码耗时直方图，以及各组件的队列深度、未确认消息数等
+for component in (simulator.flow, dispatcher, supervisor, store):
+    REGISTRY.collect(component.metrics)
+profiler = StackSampler(PROFILE_INTERVAL).start() if PROFILE_INTERVAL else None
+if METRICS_PORT:
+    MetricsServer(port=METRICS_PORT, profiler=profiler).start()
+
+# 网关 telemetry 走 HTTP，仍使用单独线程
 threading.Thread(target=gateway_telemetry_thread, daemon=True).start()
-for sensor in SENSORS:
-    threading.Thread(target=sensor_telemetry_thread, args=(sensor,), daemon=True).start()
 
-# 主线程保持
-while True:
-    time.sleep(1)
+# 主线程运行事件循环：连接、注册子设备并持续发送
+asyncio.run(simulator.run("thingsboard.cloud", 1883, 60))
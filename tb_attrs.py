@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# tb_attrs.py
+#
+# 幂等的属性同步：每个设备、每个作用域记住已写入属性值的哈希 (本地缓存文件)，
+# 再次同步时只发送值有变化的键，没有变化时不发请求，也就不会触发规则链。
+# 本地缓存缺失或需要核对时，从服务端取回当前值比较；批量开通时通过 entitiesQuery 一次取回一批设备的属性。
+# ThingsBoard 在实体查询中把属性值统一返回为字符串，因此哈希前先把值转换为同样的字符串形式。
+
+import hashlib
+import json
+import threading
+from urllib.parse import quote
+
+import requests
+
+from tb_cache import JsonFileCache
+from tb_log import get_logger
+
+log = get_logger("attrs")
+
+DEFAULT_CACHE_PATH = '.tb-attributes.json'
+
+SERVER_SCOPE = 'SERVER_SCOPE'
+SHARED_SCOPE = 'SHARED_SCOPE'
+CLIENT_SCOPE = 'CLIENT_SCOPE'
+
+# entitiesQuery 中各作用域对应的键类型
+_QUERY_KEY_TYPES = {SERVER_SCOPE: 'SERVER_ATTRIBUTE', SHARED_SCOPE: 'SHARED_ATTRIBUTE', CLIENT_SCOPE: 'CLIENT_ATTRIBUTE'}
+
+# 每次 entitiesQuery 查询的设备数
+QUERY_PAGE_SIZE = 1000
+
+
+# 与 ThingsBoard 的字符串形式一致：布尔为 true/false，JSON 值为紧凑 JSON
+def _as_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'), sort_keys=True)
+    return str(value)
+
+
+def value_hash(value):
+    return hashlib.sha1(_as_text(value).encode('utf-8')).hexdigest()[:16]
+
+
+# 用 entitiesQuery 批量读取一批设备的属性，每次查询 (最多 QUERY_PAGE_SIZE 台) 产生一页
+# [(设备 ID, {键: (字符串值, ts)})]；服务端没有的属性 (ts 为 0) 不在结果中
+def query_attributes(client, device_ids, keys, scope=SERVER_SCOPE):
+    device_ids, keys = list(device_ids), sorted(set(keys))
+    if not device_ids or not keys:
+        return
+    key_type = _QUERY_KEY_TYPES[scope]
+    for start in range(0, len(device_ids), QUERY_PAGE_SIZE):
+        chunk = device_ids[start:start + QUERY_PAGE_SIZE]
+        query = {
+            "entityFilter": {"type": "entityList", "entityType": "DEVICE", "entityList": chunk},
+            "pageLink": {"pageSize": len(chunk), "page": 0},
+            "latestValues": [{"type": key_type, "key": k} for k in keys],
+        }
+        page = client.post('/api/entitiesQuery/find', query)
+        yield [(item['entityId']['id'],
+                {k: (v['value'], v['ts']) for k, v in item.get('latest', {}).get(key_type, {}).items() if v.get('ts')})
+               for item in page.get('data', [])]
+
+
+class AttributeSync:
+    def __init__(self, client, cache_path=DEFAULT_CACHE_PATH, verify=False, autosave=True):
+        self.client = client
+        self.cache = JsonFileCache(cache_path)
+        # verify=True 时不信任本地缓存，每个设备先取回服务端当前值再比较
+        self.verify = verify
+        self.autosave = autosave
+        self.stats = {"writes": 0, "skipped": 0, "keys_sent": 0, "keys_skipped": 0, "fetched": 0}
+        self._fresh = set()   # 本次运行中已从服务端取回过的 (实体, 作用域)，verify 时不再重复取回
+        self._lock = threading.Lock()
+
+    def _key(self, entity, scope):
+        return f'{self.client.host} {entity} {scope}'
+
+    # 与已知值比较，返回需要发送的键值
+    def changed(self, entity, scope, attributes):
+        known = self.cache.get(self._key(entity, scope)) or {}
+        return {k: v for k, v in attributes.items() if known.get(k) != value_hash(v)}
+
+    def _stale(self, entity, scope):
+        key = self._key(entity, scope)
+        return self.cache.get(key) is None or (self.verify and key not in self._fresh)
+
+    def _remember(self, entity, scope, values):
+        key = self._key(entity, scope)
+        known = dict(self.cache.get(key) or {})
+        known.update((k, value_hash(v)) for k, v in values.items())
+        self.cache.set(key, known)
+
+    def _count(self, attributes, changes, fetched=0):
+        with self._lock:
+            self.stats["keys_sent"] += len(changes)
+            self.stats["keys_skipped"] += len(attributes) - len(changes)
+            self.stats["writes" if changes else "skipped"] += 1
+            self.stats["fetched"] += fetched
+
+    # === 服务端属性 (SERVER_SCOPE / SHARED_SCOPE)，使用租户 JWT ===
+    def fetch_device(self, device_id, keys, scope=SERVER_SCOPE):
+        items = self.client.get(f'/api/plugins/telemetry/DEVICE/{device_id}/values/attributes/{scope}',
+                                params={'keys': ','.join(keys)})
+        return {item['key']: item['value'] for item in items}
+
+    # 同步一个设备的属性，返回实际发送的键值
+    # new=True 表示刚创建的设备，服务端还没有任何属性，不必先取回
+    def sync_device(self, device_id, attributes, scope=SERVER_SCOPE, new=False):
+        fetched = 0
+        if new:
+            self.cache.set(self._key(device_id, scope), {})
+        elif self._stale(device_id, scope):
+            self._remember(device_id, scope, self.fetch_device(device_id, attributes, scope))
+            self._fresh.add(self._key(device_id, scope))
+            fetched = 1
+        changes = self.changed(device_id, scope, attributes)
+        if changes:
+            self.client.post(f'/api/plugins/telemetry/DEVICE/{device_id}/attributes/{scope}', changes)
+            self._remember(device_id, scope, changes)
+        self._count(attributes, changes, fetched)
+        if self.autosave:
+            self.cache.save()
+        return changes
+
+    # 批量取回一批设备的当前属性，写入本地缓存；之后 sync_device 直接按缓存比较
+    def prefetch(self, device_ids, keys, scope=SERVER_SCOPE):
+        loaded = 0
+        for page in query_attributes(self.client, device_ids, keys, scope):
+            self.stats["fetched"] += 1
+            for device_id, latest in page:
+                self.cache.set(self._key(device_id, scope), {k: value_hash(v) for k, (v, _) in latest.items()})
+                self._fresh.add(self._key(device_id, scope))
+            loaded += len(page)
+        if self.autosave:
+            self.cache.save()
+        return loaded
+
+    # === 客户端属性，使用设备 Access Token ===
+    def fetch_client(self, access_token, keys):
+        resp = self.client.device_request('GET', access_token, f'attributes?clientKeys={quote(",".join(keys))}')
+        resp.raise_for_status()
+        return resp.json().get('client', {})
+
+    def sync_client(self, access_token, attributes):
+        entity = 'TOKEN-' + hashlib.sha1(access_token.encode('utf-8')).hexdigest()[:16]
+        fetched = 0
+        if self._stale(entity, CLIENT_SCOPE):
+            try:
+                self._remember(entity, CLIENT_SCOPE, self.fetch_client(access_token, attributes))
+                fetched = 1
+            except requests.exceptions.RequestException as e:
+                log.warning("读取客户端属性失败，全部发送", error=e)
+        changes = self.changed(entity, CLIENT_SCOPE, attributes)
+        if changes:
+            self.client.post_client_attributes(access_token, changes)
+            self._remember(entity, CLIENT_SCOPE, changes)
+        self._count(attributes, changes, fetched)
+        if self.autosave:
+            self.cache.save()
+        return changes
+
+    def save(self):
+        self.cache.save()
+
+
+# 从 config.ini 的 [AttributeSync] 段读取缓存路径和是否核对服务端
+def attribute_options(config):
+    section = config['AttributeSync'] if config.has_section('AttributeSync') else {}
+    return {"cache_path": section.get('cache', DEFAULT_CACHE_PATH),
+            "verify": str(section.get('verify', 'false')).lower() in ('1', 'true', 'yes', 'on')}
+
+
+def attribute_sync_from_config(client, config, **kwargs):
+    return AttributeSync(client, **attribute_options(config), **kwargs)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# tb_auth.py
+#
+# JWT token 管理：token 和 refresh token 缓存在本地文件中，过期时间从 JWT 中解析；
+# 临近过期时通过 /api/auth/token 提前刷新，refresh token 也失效时才重新登录。
+# 同一进程内的线程用锁互斥，不同进程通过文件锁共享同一个 token，
+# 并发运行多个开通任务时每个 token 有效期内只登录一次。
+
+import base64
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.auth import AuthBase
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只做进程内互斥
+    fcntl = None
+
+DEFAULT_CACHE_PATH = '.tb-token.json'
+# 距离过期不足该秒数时提前刷新
+REFRESH_MARGIN = 300
+
+
+# 解析 JWT 的过期时间 (exp，秒)，解析失败返回 0
+def jwt_expiry(token):
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class TokenManager:
+    def __init__(self, host, username, password, cache_path=DEFAULT_CACHE_PATH,
+                 refresh_margin=REFRESH_MARGIN, session=None):
+        self.host = host.rstrip('/')
+        self.username = username
+        self.password = password
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.session = session or requests.Session()
+        self.key = f'{self.host}|{username}'
+        self.token = None
+        self.refresh_token = None
+        self.expires = 0
+        self.stats = {"login": 0, "refresh": 0, "cache_hit": 0}
+        self._lock = threading.Lock()
+
+    def _fresh(self, now):
+        return self.token and self.expires - self.refresh_margin > now
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # 原子写入缓存文件 (先写临时文件再替换)，权限 600
+    def _write_cache(self):
+        cache = self._read_cache()
+        cache[self.key] = {"token": self.token, "refreshToken": self.refresh_token}
+        tmp = f'{self.cache_path}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp, self.cache_path)
+
+    def _store(self, data):
+        self.token = data['token']
+        self.refresh_token = data.get('refreshToken')
+        self.expires = jwt_expiry(self.token)
+
+    def _login(self):
+        resp = self.session.post(f'{self.host}/api/auth/login',
+                                 json={'username': self.username, 'password': self.password})
+        resp.raise_for_status()
+        self._store(resp.json())
+        self.stats["login"] += 1
+
+    def _refresh(self):
+        resp = self.session.post(f'{self.host}/api/auth/token', json={'refreshToken': self.refresh_token})
+        if resp.status_code != 200:
+            return False
+        self._store(resp.json())
+        self.stats["refresh"] += 1
+        return True
+
+    # 返回有效的 JWT；force=True 时忽略缓存。rejected 为服务器返回 401 的 token：
+    # 多个线程同时收到 401 时只有第一个刷新，其余线程发现 token 已被换掉后直接使用新 token
+    def get_token(self, force=False, rejected=None):
+        now = time.time()
+        force = force or rejected is not None
+        if not force and self._fresh(now):
+            return self.token
+        with self._lock:
+            if rejected is not None and self.token and self.token != rejected:
+                return self.token
+            if not force and self._fresh(now):
+                return self.token
+            with _FileLock(self.cache_path + '.lock'):
+                # 其它进程可能已经刷新过
+                cached = self._read_cache().get(self.key)
+                stale = self.token
+                if cached and cached['token'] != stale and cached['token'] != rejected:
+                    self._store(cached)
+                    if self._fresh(now):
+                        self.stats["cache_hit"] += 1
+                        return self.token
+                if force:
+                    self.expires = 0
+                refresh_alive = self.refresh_token and jwt_expiry(self.refresh_token) > now + 10
+                if not (refresh_alive and self._refresh()):
+                    self._login()
+                self._write_cache()
+        return self.token
+
+
+# requests 认证钩子：给 REST 请求加上 X-Authorization，401 时刷新 token 后重试一次
+class TokenAuth(AuthBase):
+    # 登录接口和设备接口 (使用 Access Token) 不需要 JWT
+    SKIP = ('/api/auth/', '/api/v1/')
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __call__(self, r):
+        if any(p in r.url for p in self.SKIP):
+            r.headers.pop('X-Authorization', None)
+            return r
+        token = self.manager.get_token()
+        r.headers['X-Authorization'] = f'Bearer {token}'
+        r.register_hook('response', self._retry_401)
+        return r
+
+    def _retry_401(self, resp, **kwargs):
+        if resp.status_code != 401 or getattr(resp.request, '_tb_retried', False):
+            return resp
+        resp.content
+        resp.close()
+        rejected = resp.request.headers.get('X-Authorization', '').partition('Bearer ')[2] or None
+        retry = resp.request.copy()
+        retry._tb_retried = True
+        retry.headers['X-Authorization'] = f'Bearer {self.manager.get_token(force=True, rejected=rejected)}'
+        new_resp = resp.connection.send(retry, **kwargs)
+        new_resp.history.append(resp)
+        new_resp.request = retry
+        return new_resp
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# tb_cache.py
+#
+# 本地 JSON 缓存文件 (Profile 内容哈希、属性哈希等)。整体读入内存，修改后原子替换写回；
+# 文件不存在或损坏时视为空缓存。path 为空时只在内存中使用。
+
+import json
+import os
+import threading
+
+
+class JsonFileCache:
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self.data[key] = value
+            self.dirty = True
+
+    # 有修改时写回文件 (先写临时文件再替换，避免中断后留下半个文件)
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            text = json.dumps(self.data, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+            self.dirty = False
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, self.path)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# tb_client.py
+#
+# ThingsBoard REST 客户端：JWT 由 tb_auth.TokenManager 缓存和刷新，复用同一个 requests.Session 的连接池，
+# 供各个脚本和批量开通 (provision-fleet.py) 共用。
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tb_auth import DEFAULT_CACHE_PATH, TokenAuth, TokenManager
+from tb_log import get_logger
+from tb_metrics import REGISTRY
+
+
+# 连接池默认参数，可在 config.ini 的 [HTTP] 段中覆盖
+DEFAULT_POOL_SIZE = 32
+DEFAULT_POOL_HOSTS = 4
+
+log = get_logger("http")
+_LATENCY = REGISTRY.histogram("http_request_seconds", "HTTP 请求发出到收到响应头的耗时 (秒)")
+_ERRORS = REGISTRY.counter("http_error_responses_total", "状态码 >= 400 的 HTTP 响应数")
+
+
+# requests 的响应钩子：记录耗时和错误响应
+def _observe(resp, *args, **kwargs):
+    _LATENCY.observe(resp.elapsed.total_seconds())
+    if resp.status_code >= 400:
+        _ERRORS.inc()
+
+
+# 创建带连接池的 Session：同一主机的连接 keep-alive 复用，避免每次请求重新握手 (TCP + TLS)
+# pool_size 为每个主机的最大连接数；host_limits 可按主机单独指定，如 {'https://thingsboard.cloud': 8}
+# pool_block=True 时连接用尽的请求会等待空闲连接，而不是临时新建连接
+def make_session(pool_size=DEFAULT_POOL_SIZE, pool_hosts=DEFAULT_POOL_HOSTS, host_limits=None,
+                 pool_block=False):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, pool_block=pool_block)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    for prefix, limit in (host_limits or {}).items():
+        session.mount(prefix.rstrip('/') + '/', HTTPAdapter(pool_connections=1, pool_maxsize=limit,
+                                                            pool_block=pool_block))
+    session.headers['Content-Type'] = 'application/json'
+    session.hooks['response'].append(_observe)
+    return session
+
+
+# 从 config.ini 读取 TBClient 的可选参数：[HTTP] 段的连接池参数，[ThingsBoard] 段的 token_cache
+def client_options(config):
+    options = {}
+    if config.has_option('ThingsBoard', 'token_cache'):
+        options["token_cache"] = config.get('ThingsBoard', 'token_cache')
+    if not config.has_section('HTTP'):
+        return options
+    section = config['HTTP']
+    host_limits = {}
+    for item in section.get('host_limits', '').split(','):
+        if '=' in item:
+            prefix, limit = item.rsplit('=', 1)
+            host_limits[prefix.strip()] = int(limit)
+    options.update({
+        "pool_size": section.getint('pool_size', DEFAULT_POOL_SIZE),
+        "pool_hosts": section.getint('pool_hosts', DEFAULT_POOL_HOSTS),
+        "pool_block": section.getboolean('pool_block', False),
+        "host_limits": host_limits,
+    })
+    return options
+
+
+class TBClient:
+    def __init__(self, host, username=None, password=None, pool_size=DEFAULT_POOL_SIZE,
+                 token_cache=DEFAULT_CACHE_PATH, **pool_kwargs):
+        self.host = host.rstrip('/')
+        self.username = username
+        self.password = password
+
+        # 连接池大小需不小于并发线程数，否则多出来的连接用完即关
+        self.session = make_session(pool_size, **pool_kwargs)
+        # JWT 由 TokenManager 统一管理：本地缓存、提前刷新，每个请求发出前自动带上
+        self.tokens = TokenManager(self.host, username, password, cache_path=token_cache,
+                                   session=self.session)
+        self.session.auth = TokenAuth(self.tokens)
+
+    @property
+    def jwt_token(self):
+        return self.tokens.token
+
+    # === 登录，获取 JWT token (优先使用缓存中未过期的 token) ===
+    def login(self):
+        return self.tokens.get_token()
+
+    def request(self, method, path, **kwargs):
+        resp = self.session.request(method, f'{self.host}{path}', **kwargs)
+        try:
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            log.error("服务器返回错误", method=method, path=path, status=resp.status_code, body=resp.text[:500])
+            raise e
+        return resp
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs).json()
+
+    def post(self, path, payload=None, **kwargs):
+        resp = self.request('POST', path, json=payload, **kwargs)
+        return resp.json() if resp.content else None
+
+    # === 常用接口 ===
+    # 请求体带 id 时为更新
+    def create_device_profile(self, payload):
+        return self.post('/api/deviceProfile', payload)
+
+    def get_device_profile(self, profile_id):
+        return self.get(f'/api/deviceProfile/{profile_id}')
+
+    # 按名字精确查询设备，不存在时返回 None
+    def get_device_by_name(self, name):
+        resp = self.session.get(f'{self.host}/api/tenant/devices', params={'deviceName': name})
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.json() or None
+
+    def create_device(self, name, device_profile_id, gateway=False, device_type='DEFAULT'):
+        payload = {
+            "name": name,
+            "type": device_type,
+            "deviceProfileId": {"id": device_profile_id, "entityType": "DEVICE_PROFILE"},
+        }
+        if gateway:
+            payload["additionalInfo"] = {"gateway": True}
+        return self.post('/api/device', payload)
+
+    def get_access_token(self, device_id):
+        return self.get(f'/api/device/{device_id}/credentials')['credentialsId']
+
+    def post_server_attributes(self, device_id, attributes):
+        return self.post(f'/api/plugins/telemetry/DEVICE/{device_id}/attributes/SERVER_SCOPE', attributes)
+
+    # === 设备接口 (使用 Access Token，不带 JWT) ===
+    def device_request(self, method, access_token, resource, payload=None):
+        return self.session.request(method, f'{self.host}/api/v1/{access_token}/{resource}', json=payload)
+
+    def post_telemetry(self, access_token, telemetry):
+        self.device_request('POST', access_token, 'telemetry', telemetry).raise_for_status()
+
+    # 发送已编码的遥测 (单条对象或 JSON 数组)
+    def post_telemetry_raw(self, access_token, body):
+        self.session.post(f'{self.host}/api/v1/{access_token}/telemetry', data=body).raise_for_status()
+
+    def post_client_attributes(self, access_token, attributes):
+        self.device_request('POST', access_token, 'attributes', attributes).raise_for_status()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# tb_credentials.py
+#
+# 设备 Access Token 本地存储 (SQLite，WAL 模式)，按设备名字索引，可按 EUI 查找。
+# 每个线程使用自己的只读连接，模拟器的多个工作线程可以同时读取；写入集中在一个连接上，批量写入为一个事务。
+# CredentialRefresher 只处理过期 (超过 max_age 未验证) 或缺失的条目：先并发验证已有 Token，
+# 无效或缺失的再并发从 ThingsBoard 取回，启动时不必对每台设备逐个调用接口。
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tb_lookup import DeviceIndex
+from tb_log import get_logger
+
+log = get_logger("credentials")
+
+DEFAULT_PATH = 'credentials.db'
+# 超过该秒数未验证的 Token 视为过期，下次刷新时重新验证
+DEFAULT_MAX_AGE = 24 * 3600
+# 需要按名字查找的设备多于该数量时先一次性加载设备索引
+PRELOAD_THRESHOLD = 200
+# 每条 IN 查询的名字数 (低于 SQLite 的参数个数上限)
+_CHUNK = 500
+
+_COLUMNS = 'name, eui, device_id, access_token, validated, updated'
+
+
+def _chunks(items, size=_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CredentialStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS credentials ('
+                        'name TEXT PRIMARY KEY, eui TEXT, device_id TEXT, access_token TEXT NOT NULL, '
+                        'validated REAL NOT NULL DEFAULT 0, updated REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS credentials_eui ON credentials (eui)')
+
+    # 当前线程的只读连接 (WAL 模式下读不阻塞写)
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def get(self, name):
+        row = self._reader().execute('SELECT access_token FROM credentials WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_by_eui(self, eui):
+        row = self._reader().execute('SELECT access_token FROM credentials WHERE eui = ?', (eui,)).fetchone()
+        return row[0] if row else None
+
+    # 批量读取多台设备的记录: {名字: 记录}，没有记录的名字不出现在结果中
+    def records(self, names):
+        names = list(names)
+        found = {}
+        conn = self._reader()
+        for chunk in _chunks(names):
+            marks = ','.join('?' * len(chunk))
+            for row in conn.execute(f'SELECT {_COLUMNS} FROM credentials WHERE name IN ({marks})', chunk):
+                found[row['name']] = dict(row)
+        return found
+
+    # 批量读取 Token: {名字: Token}
+    def tokens(self, names):
+        return {name: row['access_token'] for name, row in self.records(names).items()}
+
+    # 写入或更新一台设备；validated 为最近一次确认 Token 有效的时间
+    def put(self, name, access_token, device_id=None, eui=None, validated=None):
+        self.put_many([{"name": name, "access_token": access_token, "device_id": device_id, "eui": eui,
+                        "validated": validated}])
+
+    # 批量写入 (一个事务)；device_id / eui 为 None 时保留已有的值
+    def put_many(self, rows):
+        now = time.time()
+        params = [(r['name'], r.get('eui'), r.get('device_id'), r['access_token'],
+                   r.get('validated') or 0, now) for r in rows]
+        if not params:
+            return
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT INTO credentials (name, eui, device_id, access_token, validated, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET '
+                'eui = COALESCE(excluded.eui, eui), device_id = COALESCE(excluded.device_id, device_id), '
+                'access_token = excluded.access_token, validated = excluded.validated, updated = excluded.updated',
+                params)
+            self.db.execute('COMMIT')
+
+    # 记录一批 Token 已验证有效
+    def mark_validated(self, names, when=None):
+        when = when or time.time()
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('UPDATE credentials SET validated = ? WHERE name = ?', ((when, n) for n in names))
+            self.db.execute('COMMIT')
+
+    # 更新 EUI: {名字: EUI}
+    def set_euis(self, euis):
+        if not euis:
+            return
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('UPDATE credentials SET eui = ? WHERE name = ?', ((e, n) for n, e in euis.items()))
+            self.db.execute('COMMIT')
+
+    def delete(self, names):
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('DELETE FROM credentials WHERE name = ?', ((n,) for n in names))
+            self.db.execute('COMMIT')
+
+    def __len__(self):
+        return self._reader().execute('SELECT COUNT(*) FROM credentials').fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        self.db.close()
+
+
+class CredentialRefresher:
+    def __init__(self, client, store, workers=16, max_age=DEFAULT_MAX_AGE, index=None):
+        self.client = client
+        self.store = store
+        self.workers = workers
+        self.max_age = max_age
+        self.devices = index or DeviceIndex(client)
+        self.stats = {"fresh": 0, "validated": 0, "fetched": 0, "missing": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    # 用设备接口验证 Token：200 有效，401 / 404 无效，其他错误返回 None (保留原 Token，下次再验证)
+    def validate(self, access_token):
+        try:
+            resp = self.client.device_request('GET', access_token, 'attributes')
+        except requests.exceptions.RequestException:
+            return None
+        if resp.status_code == 200:
+            return True
+        if resp.status_code in (401, 404):
+            return False
+        return None
+
+    # 从 ThingsBoard 取回 Token，设备不存在时返回 None
+    def _fetch(self, name, device_id):
+        device_id = device_id or self.devices.get(name)
+        if not device_id:
+            return None
+        return {"name": name, "device_id": device_id, "access_token": self.client.get_access_token(device_id),
+                "validated": time.time()}
+
+    # 确保一批设备都有有效的 Token，返回 {名字: Token}，ThingsBoard 上不存在的设备不在结果中
+    # device_ids 为已知的 {名字: 设备 ID}，可省去按名字查找；与存储中的设备 ID 不同 (设备被删除后同名重建) 时
+    # 存储中的 Token 已失效，重新取回；euis 为 {名字: EUI}，写入存储用于按 EUI 查找
+    def refresh(self, names, device_ids=None, euis=None):
+        names = list(dict.fromkeys(names))
+        device_ids, euis = dict(device_ids or {}), euis or {}
+        records = self.store.records(names)
+        cutoff = time.time() - self.max_age
+        tokens, to_check, to_fetch = {}, [], []
+        for name in names:
+            row = records.get(name)
+            if row is None or device_ids.get(name, row['device_id']) != row['device_id']:
+                to_fetch.append(name)
+                continue
+            device_ids[name] = row['device_id']
+            if row['validated'] >= cutoff:
+                tokens[name] = row['access_token']
+            else:
+                to_check.append(name)
+        self._count("fresh", len(tokens))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # 并发验证过期的 Token
+            valid = []
+            checks = pool.map(lambda n: self.validate(records[n]['access_token']), to_check)
+            for name, ok in zip(to_check, checks):
+                if ok is False:
+                    to_fetch.append(name)
+                    continue
+                tokens[name] = records[name]['access_token']
+                if ok:
+                    valid.append(name)
+                else:
+                    self._count("failed")
+            self.store.mark_validated(valid)
+            self._count("validated", len(valid))
+
+            # 无效或缺失的并发取回；需要按名字查找的设备多时先加载设备索引
+            unknown = sum(1 for name in to_fetch if not device_ids.get(name))
+            if unknown > PRELOAD_THRESHOLD and not self.devices.complete:
+                self.devices.preload()
+            fetched, gone = [], []
+            for name, result in pool.map(self._fetch_safe, ((n, device_ids.get(n)) for n in to_fetch)):
+                if result is None:
+                    gone.append(name)
+                elif result:
+                    fetched.append(result)
+                    tokens[name] = result["access_token"]
+
+        for row in fetched:
+            row["eui"] = euis.get(row["name"])
+        self.store.put_many(fetched)
+        self.store.delete(gone)
+        self.store.set_euis({n: e for n, e in euis.items() if n in records and records[n]['eui'] != e})
+        self._count("fetched", len(fetched))
+        self._count("missing", len(gone))
+        return tokens
+
+    # 取回单台设备的 Token：返回 (名字, 记录)；设备不存在为 None，请求失败为 False (计入 failed)
+    def _fetch_safe(self, item):
+        name, device_id = item
+        try:
+            try:
+                return name, self._fetch(name, device_id)
+            except requests.exceptions.HTTPError as e:
+                # 存储中的设备 ID 已被删除时按名字重新查找
+                if device_id and e.response is not None and e.response.status_code == 404:
+                    return name, self._fetch(name, None)
+                raise
+        except requests.exceptions.RequestException as e:
+            log.error("获取 Access Token 失败", device=name, error=e)
+            self._count("failed")
+            return name, False
+
+
+# 从 config.ini 的 [Credentials] 段读取存储路径和验证间隔
+def credential_options(config):
+    section = config['Credentials'] if config.has_section('Credentials') else {}
+    return {"path": section.get('path', DEFAULT_PATH),
+            "max_age": int(section.get('max_age', DEFAULT_MAX_AGE))}
+
+
+# 单台设备取得有效 Token (脚本用)；legacy_token 为旧版 config.ini 中保存的 Token，存储中没有记录时导入后验证
+def device_token(client, store, name, device_id=None, max_age=DEFAULT_MAX_AGE, legacy_token=None):
+    if legacy_token and store.get(name) is None:
+        store.put(name, legacy_token, device_id=device_id)
+    token = CredentialRefresher(client, store, workers=1, max_age=max_age).refresh(
+        [name], device_ids={name: device_id} if device_id else None).get(name)
+    if token is None:
+        raise RuntimeError(f"设备不存在，无法获取 Access Token: {name}")
+    return token
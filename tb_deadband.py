@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# tb_deadband.py
+#
+# 按变化上报 (report-by-exception)。每个设备、每个键记住上次发出的值和时间，
+# 新读数与上次发出值的差超过死区才发送；字符串等非数值只在变化时发送。
+# 死区 = max(绝对阈值, 百分比阈值 × |上次值|)，绝对阈值同时是零点附近的下限。
+# 某个键超过 heartbeat 秒没有发送时无论是否变化都发送一次，服务端据此判断设备在线、数据不陈旧。
+
+import math
+import time
+
+
+# 一个键的死区设置；abs_threshold / pct_threshold 为 0 表示任何变化都发送
+class Deadband:
+    def __init__(self, abs_threshold=0.0, pct_threshold=0.0):
+        self.abs_threshold = abs_threshold
+        self.pct_threshold = pct_threshold
+
+    # 解析 "0.5"、"2%"、"0.5,2%" 形式的配置
+    @classmethod
+    def parse(cls, text):
+        band = cls()
+        for part in str(text).split(','):
+            part = part.strip()
+            if part.endswith('%'):
+                band.pct_threshold = float(part[:-1]) / 100
+            elif part:
+                band.abs_threshold = float(part)
+        return band
+
+    def exceeded(self, last, value):
+        if type(value) is bool or not isinstance(value, (int, float)) or not isinstance(last, (int, float)):
+            return value != last
+        if math.isnan(value) or math.isnan(last):
+            return not (math.isnan(value) and math.isnan(last))
+        delta = abs(value - last)
+        return delta > 0 and delta >= max(self.abs_threshold, self.pct_threshold * abs(last))
+
+
+class DeadbandFilter:
+    # bands: {键: Deadband}，未列出的键使用 default；heartbeat 为每个键的最长静默秒数，0 表示不强制发送
+    def __init__(self, bands=None, default=None, heartbeat=600.0):
+        self.bands = dict(bands or {})
+        self.default = default or Deadband()
+        self.heartbeat = heartbeat
+        # 设备 -> {键: (上次发出的值, 发出时间)}
+        self.state = {}
+        self.stats = {"readings": 0, "sent": 0, "suppressed": 0, "values_in": 0, "values_out": 0}
+
+    # 返回需要发送的键值 (可能为空字典)，并把它们记为已发送
+    def filter(self, device, values, now=None):
+        now = time.time() if now is None else now
+        last = self.state.get(device)
+        if last is None:
+            last = self.state[device] = {}
+        out = {}
+        bands, default, heartbeat = self.bands, self.default, self.heartbeat
+        for key, value in values.items():
+            previous = last.get(key)
+            if (previous is None
+                    or (heartbeat and now - previous[1] >= heartbeat)
+                    or bands.get(key, default).exceeded(previous[0], value)):
+                out[key] = value
+                last[key] = (value, now)
+        stats = self.stats
+        stats["readings"] += 1
+        stats["values_in"] += len(values)
+        stats["values_out"] += len(out)
+        if out:
+            stats["sent"] += 1
+        else:
+            stats["suppressed"] += 1
+        return out
+
+    # 清除设备状态，下一条读数全部发送 (如重新连接、服务端数据丢失后)
+    def reset(self, device=None):
+        if device is None:
+            self.state.clear()
+        else:
+            self.state.pop(device, None)
+
+    # 被抑制的键值比例
+    def reduction(self):
+        values_in = self.stats["values_in"]
+        return 1 - self.stats["values_out"] / values_in if values_in else 0.0
+
+
+# 从 config.ini 的 [Deadband] 段创建过滤器，没有该段或 enabled = false 时返回 None
+#   default = 0.1,1%   heartbeat = 600   其他键为各遥测键的死区，如 temperature = 0.2  humidity = 2%
+def deadband_from_config(config):
+    if not config.has_section('Deadband'):
+        return None
+    section = config['Deadband']
+    if not section.getboolean('enabled', True):
+        return None
+    reserved = {'enabled', 'default', 'heartbeat'}
+    bands = {key: Deadband.parse(value) for key, value in section.items()
+             if key not in reserved and key not in config.defaults()}
+    return DeadbandFilter(bands, default=Deadband.parse(section.get('default', '0')),
+                          heartbeat=section.getfloat('heartbeat', 600.0))
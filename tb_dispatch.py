@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# tb_dispatch.py
+#
+# 网关下行消息分发：每条网关连接 (包括重连后) 用一次 SUBSCRIBE 订阅 v1/gateway/rpc 和 v1/gateway/attributes，
+# 按子设备名在字典中 (O(1)) 查找处理函数，交给有界线程池执行，处理慢的函数不会阻塞 MQTT 网络循环。
+# 同一子设备的消息按到达顺序依次处理 (属性更新不会乱序)，不同子设备并行处理。
+# 尚未处理完的消息达到 max_pending 时，新的 RPC 直接回复错误，共享属性更新丢弃并计数，不在内存中无限堆积。
+#
+# 消息格式 (ThingsBoard 网关接口):
+#   RPC 请求:  v1/gateway/rpc         {"device": "Sensor1", "data": {"id": 1, "method": "setInterval", "params": 30}}
+#   RPC 回复:  v1/gateway/rpc         {"device": "Sensor1", "id": 1, "data": {...}}
+#   共享属性:  v1/gateway/attributes  {"device": "Sensor1", "data": {"interval": 30}}
+
+import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tb_flow import DEFAULT_SAMPLES, percentiles
+from tb_log import get_logger
+
+log = get_logger("dispatch")
+
+RPC_TOPIC = "v1/gateway/rpc"
+ATTRIBUTES_TOPIC = "v1/gateway/attributes"
+# 默认并发处理线程数和未处理完的消息上限
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PENDING = 1000
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class GatewayDispatcher:
+    # workers=0 时在 MQTT 网络回调中直接处理 (不使用线程池，仅用于对比)
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, qos=1):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tb-dispatch') if workers else None
+        self.max_pending = max_pending
+        self.qos = qos
+        # (子设备, 方法) -> handler(device, method, params)；子设备或方法为 None 表示任意
+        self.rpc_handlers = {}
+        # 子设备 -> handler(device, {键: 值})；None 表示任意子设备
+        self.attribute_handlers = {}
+        self.publish = None
+        # 最近一次订阅的时间 (monotonic)，连接断开时为 None；共享属性缓存据此判断推送是否在线
+        self.subscribed_at = None
+        # 从收到 RPC 到发出回复的秒数
+        self.latencies = collections.deque(maxlen=DEFAULT_SAMPLES)
+        self.stats = {"rpc": 0, "replied": 0, "failed": 0, "unhandled": 0, "rejected": 0,
+                      "attributes": 0, "dropped": 0}
+        # 子设备 -> 待处理的任务队列；存在即表示该子设备已有一个任务在线程池中运行
+        self._queues = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    # 注册 RPC 处理函数，返回值作为回复的 data；抛出异常时回复 {"error": 异常信息}
+    def on_rpc(self, method, handler, device=None):
+        self.rpc_handlers[(device, method)] = handler
+
+    # 注册共享属性更新的处理函数
+    def on_attributes(self, handler, device=None):
+        self.attribute_handlers[device] = handler
+
+    # 挂到 paho 客户端；publish(topic, payload) 用于发送 RPC 回复 (会在工作线程中调用)，默认 client.publish
+    def attach(self, client, publish=None):
+        client.message_callback_add(RPC_TOPIC, self._on_rpc)
+        client.message_callback_add(ATTRIBUTES_TOPIC, self._on_attributes)
+        self.publish = publish or (lambda topic, payload: client.publish(topic, payload, qos=self.qos))
+
+    # 每次连接建立后调用 (clean session 下重连后订阅已失效)
+    def subscribe(self, client):
+        client.subscribe([(RPC_TOPIC, self.qos), (ATTRIBUTES_TOPIC, self.qos)])
+        self.subscribed_at = time.monotonic()
+
+    # 连接断开时调用，之后收不到推送
+    def disconnected(self):
+        self.subscribed_at = None
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    # 精确匹配优先，其次任意子设备的同名方法，最后该子设备 / 全部的默认处理函数
+    def _rpc_handler(self, device, method):
+        handlers = self.rpc_handlers
+        return (handlers.get((device, method)) or handlers.get((None, method))
+                or handlers.get((device, None)) or handlers.get((None, None)))
+
+    # 加入子设备的任务队列；该子设备没有任务在运行时提交到线程池。超过上限返回 False
+    def _submit(self, device, task):
+        if self.pool is None:
+            task()
+            return True
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            queue = self._queues.get(device)
+            if queue is not None:
+                queue.append(task)
+                return True
+            self._queues[device] = collections.deque([task])
+        self.pool.submit(self._drain, device)
+        return True
+
+    # 依次执行一个子设备的任务，直到队列为空
+    def _drain(self, device):
+        while True:
+            with self._lock:
+                queue = self._queues[device]
+                if not queue:
+                    del self._queues[device]
+                    return
+                task = queue.popleft()
+            try:
+                task()
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def _reply(self, device, request_id, data):
+        self.publish(RPC_TOPIC, _dumps({"device": device, "id": request_id, "data": data}))
+
+    def _on_rpc(self, client, userdata, msg):
+        received = time.perf_counter()
+        try:
+            message = json.loads(msg.payload)
+            device, data = message["device"], message["data"]
+            request_id, method = data["id"], data["method"]
+        except (ValueError, KeyError, TypeError):
+            # 不是 RPC 请求 (普通 Broker 会把网关自己发出的回复也投递回来)
+            return
+        self._count("rpc")
+        handler = self._rpc_handler(device, method)
+        if handler is None:
+            self._count("unhandled")
+            self._reply(device, request_id, {"error": f"Unsupported method: {method}"})
+            return
+        params = data.get("params")
+        if not self._submit(device, lambda: self._run_rpc(handler, device, request_id, method, params, received)):
+            self._count("rejected")
+            self._reply(device, request_id, {"error": "Gateway busy"})
+
+    def _run_rpc(self, handler, device, request_id, method, params, received):
+        try:
+            result = handler(device, method, params)
+        except Exception as e:
+            log.error("RPC 处理失败", device=device, method=method, error=e)
+            self._count("failed")
+            result = {"error": str(e)}
+        self._reply(device, request_id, result if result is not None else {"success": True})
+        self.latencies.append(time.perf_counter() - received)
+        self._count("replied")
+
+    def _on_attributes(self, client, userdata, msg):
+        try:
+            message = json.loads(msg.payload)
+            device, data = message["device"], message["data"]
+        except (ValueError, KeyError, TypeError):
+            log.warning("无法解析的共享属性消息", payload=msg.payload[:200])
+            return
+        handler = self.attribute_handlers.get(device) or self.attribute_handlers.get(None)
+        if handler is None:
+            return
+        self._count("attributes")
+        if not self._submit(device, lambda: self._run_attributes(handler, device, data)):
+            self._count("dropped")
+
+    def _run_attributes(self, handler, device, data):
+        try:
+            handler(device, data)
+        except Exception as e:
+            log.error("共享属性处理失败", device=device, error=e)
+
+    def metrics(self):
+        latency = percentiles(list(self.latencies), (50, 99))
+        return {"rpc.received": self.stats["rpc"], "rpc.failed": self.stats["failed"],
+                "rpc.rejected": self.stats["rejected"], "rpc.pending": self._pending,
+                "rpc.latencyP50Ms": latency["p50_ms"], "rpc.latencyP99Ms": latency["p99_ms"]}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# tb_encode.py
+#
+# 遥测编码层。发送路径只依赖编码器的几个方法，可按需替换：
+#   json      紧凑 JSON；安装了 orjson 时自动使用 orjson
+#   template  按键集合预先渲染字节模板，固定键的读数只需填入数值，其他情况回退到 json
+#   protobuf  ThingsBoard MQTT 传输的 protobuf 格式 (transport.proto)，手写编码，不依赖 protobuf 库；
+#             需要在设备配置 (Device Profile) 中把 MQTT 传输的负载类型设为 Protobuf，HTTP 设备接口不支持
+#
+# 编码器接口：
+#   reading(ts, values)         一条读数片段 (网关接口中子设备列表的一个元素)
+#   device(name, readings)      一个子设备的全部片段
+#   gateway(parts)              合并多个子设备，得到 v1/gateway/telemetry 的消息体
+#   telemetry(values, ts)       设备接口 (v1/devices/me/telemetry 或 HTTP /api/v1/{token}/telemetry) 的消息体
+#   connect(name, device_type)  v1/gateway/connect 的消息体
+#   device_overhead(name) / separator / empty   消息字节数计算，供 BatchPublisher 控制消息大小
+
+import json
+import math
+import struct
+
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库
+    orjson = None
+
+
+# 预先创建，避免 json.dumps 带参数时每次新建 JSONEncoder
+_COMPACT = json.JSONEncoder(separators=(',', ':'))
+
+
+def _std_dumps(obj):
+    return _COMPACT.encode(obj).encode('utf-8')
+
+
+class JsonEncoder:
+    content_type = 'application/json'
+    separator = 1       # 同一子设备的读数之间的 ","
+    empty = 2           # 外层 "{}"
+
+    def __init__(self, fast=True):
+        self.dumps = orjson.dumps if fast and orjson else _std_dumps
+        self.backend = 'orjson' if self.dumps is not _std_dumps else 'json'
+        self._names = {}
+
+    # 子设备名的 JSON 字符串，缓存避免重复转义
+    def _name(self, name):
+        encoded = self._names.get(name)
+        if encoded is None:
+            if len(self._names) >= 100000:
+                self._names.clear()
+            encoded = self._names[name] = self.dumps(name)
+        return encoded
+
+    def reading(self, ts, values):
+        return self.dumps({"ts": ts, "values": values})
+
+    def telemetry(self, values, ts=None):
+        return self.reading(ts, values) if ts is not None else self.dumps(values)
+
+    def device(self, name, readings):
+        return self._name(name) + b':[' + b','.join(readings) + b']'
+
+    def gateway(self, parts):
+        return b'{' + b','.join(parts) + b'}'
+
+    # 新增一个子设备时除读数本身外增加的字节数 ("name":[] 加上与前一个子设备之间的逗号)
+    def device_overhead(self, name, first):
+        return len(self._name(name)) + 3 + (0 if first else 1)
+
+    def connect(self, name, device_type):
+        return self.dumps({"device": name, "type": device_type})
+
+
+# 按键集合缓存的模板: '{"ts":%d,"values":{"temperature":%s,"humidity":%s}}'
+class TemplateEncoder(JsonEncoder):
+    MAX_TEMPLATES = 1024
+
+    def __init__(self, fast=True):
+        super().__init__(fast)
+        self._templates = {}
+
+    def _template(self, keys, with_ts):
+        cache_key = (keys, with_ts)
+        template = self._templates.get(cache_key)
+        if template is None:
+            if len(self._templates) >= self.MAX_TEMPLATES:
+                self._templates.clear()
+            body = ','.join(json.dumps(k).replace('%', '%%') + ':%s' for k in keys)
+            template = '{"ts":%d,"values":{' + body + '}}' if with_ts else '{' + body + '}'
+            self._templates[cache_key] = template
+        return template
+
+    def _render(self, ts, values):
+        # 有限的 int/float (不含 bool) 的 str 与 json.dumps 输出一致，字符串单独转义，其他类型回退到 json
+        args = [] if ts is None else [ts]
+        for value in values.values():
+            kind = type(value)
+            if kind is int or (kind is float and math.isfinite(value)):
+                args.append(value)
+            elif kind is str:
+                args.append(json.dumps(value))
+            else:
+                return None
+        return (self._template(tuple(values), ts is not None) % tuple(args)).encode('utf-8')
+
+    def reading(self, ts, values):
+        return self._render(ts, values) or super().reading(ts, values)
+
+    def telemetry(self, values, ts=None):
+        return self._render(ts, values) or super().telemetry(values, ts)
+
+
+# ---------------- protobuf (transport.proto) ----------------
+# message KeyValueProto       { string key = 1; KeyValueType type = 2; bool bool_v = 3; int64 long_v = 4;
+#                               double double_v = 5; string string_v = 6; string json_v = 7; }
+# message TsKvListProto       { int64 ts = 1; repeated KeyValueProto kv = 2; }
+# message PostTelemetryMsg    { repeated TsKvListProto tsKvList = 1; }
+# message TelemetryMsg        { string deviceName = 1; PostTelemetryMsg msg = 3; }
+# message GatewayTelemetryMsg { repeated TelemetryMsg msg = 1; }
+# message ConnectMsg          { string deviceName = 1; string deviceType = 2; }
+
+_DOUBLE = struct.Struct('<d')
+
+
+def varint(value):
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# 长度前缀字段 (wire type 2)
+def _field(tag, data):
+    return bytes((tag << 3 | 2,)) + varint(len(data)) + data
+
+
+class ProtobufEncoder:
+    content_type = 'application/x-protobuf'
+    separator = 0
+    empty = 0
+
+    def __init__(self):
+        # 键名 -> 已编码的 key 字段；(键名, 类型) -> 定长值 (double/bool) 的完整 kv 前缀
+        self._keys = {}
+        self._prefixes = {}
+        self._names = {}
+
+    def _key(self, key):
+        encoded = self._keys.get(key)
+        if encoded is None:
+            if len(self._keys) >= 100000:
+                self._keys.clear()
+                self._prefixes.clear()
+            encoded = self._keys[key] = _field(1, key.encode('utf-8'))
+        return encoded
+
+    # 定长值的 kv 只有数值部分变化，前缀 (外层标签、长度、key、type、值标签) 按键缓存
+    def _prefix(self, key, kind):
+        prefix = self._prefixes.get((key, kind))
+        if prefix is None:
+            head = self._key(key) + (b'\x10\x02\x29' if kind is float else b'\x10\x00\x18')
+            prefix = self._prefixes[(key, kind)] = b'\x12' + varint(len(head) + (8 if kind is float else 1)) + head
+        return prefix
+
+    # KeyValueProto; type: 0 BOOLEAN_V, 1 LONG_V, 2 DOUBLE_V, 3 STRING_V, 4 JSON_V
+    def _kv(self, key, value):
+        kind = type(value)
+        if kind is float:
+            return self._prefix(key, float) + _DOUBLE.pack(value)
+        if kind is bool:
+            return self._prefix(key, bool) + (b'\x01' if value else b'\x00')
+        if kind is int:
+            body = b'\x10\x01\x20' + varint(value)
+        elif isinstance(value, str):
+            body = b'\x10\x03' + _field(6, value.encode('utf-8'))
+        else:
+            body = b'\x10\x04' + _field(7, json.dumps(value).encode('utf-8'))
+        return _field(2, self._key(key) + body)
+
+    # TsKvListProto，作为 PostTelemetryMsg 的 tsKvList 字段
+    def reading(self, ts, values):
+        body = b'\x08' + varint(ts) + b''.join([self._kv(k, v) for k, v in values.items()])
+        return _field(1, body)
+
+    # PostTelemetryMsg；不带 ts 时服务端使用接收时间
+    def telemetry(self, values, ts=None):
+        if ts is None:
+            return _field(1, b''.join([self._kv(k, v) for k, v in values.items()]))
+        return self.reading(ts, values)
+
+    def _name(self, name):
+        encoded = self._names.get(name)
+        if encoded is None:
+            if len(self._names) >= 100000:
+                self._names.clear()
+            encoded = self._names[name] = _field(1, name.encode('utf-8'))
+        return encoded
+
+    # GatewayTelemetryMsg 的一个 msg 元素 (TelemetryMsg)
+    def device(self, name, readings):
+        return _field(1, self._name(name) + _field(3, b''.join(readings)))
+
+    def gateway(self, parts):
+        return b''.join(parts)
+
+    # 外层和 msg 字段的标签各 1 字节，长度前缀按最多 3 字节计 (单条消息 < 2 MB)，结果为上界
+    def device_overhead(self, name, first):
+        return len(self._name(name)) + 2 * (1 + 3)
+
+    def connect(self, name, device_type):
+        return self._name(name) + _field(2, device_type.encode('utf-8'))
+
+
+ENCODERS = {
+    "json": JsonEncoder,
+    "template": TemplateEncoder,
+    "protobuf": ProtobufEncoder,
+}
+
+
+def get_encoder(name="json"):
+    if name not in ENCODERS:
+        raise ValueError(f"未知的遥测编码: {name}，可选 {', '.join(ENCODERS)}")
+    return ENCODERS[name]()
+
+
+# 从 config.ini 的 [Telemetry] 段选择编码，未配置时使用 json
+def encoder_from_config(config):
+    return get_encoder(config.get('Telemetry', 'encoding', fallback='json'))
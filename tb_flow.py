@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# tb_flow.py
+#
+# MQTT 发送流控：限制未确认消息数 (in-flight 窗口)，按令牌桶限制每条连接和全局 (租户) 的发送速率，
+# 记录每条消息从 publish 到 PUBACK (QoS0 为写出 socket) 的延迟，同时计入指标 tb_mqtt_puback_seconds。
+# 窗口已满或令牌不足时由 wait() 让发送方等待 (背压)，而不是把消息堆积在 paho 的内部队列中。
+#
+# 速率限制使用 ThingsBoard 的格式 "容量:秒"，多个窗口用逗号分隔，全部满足才允许发送，
+# 如 "100:1,2000:60" 表示每秒最多 100 条且每分钟最多 2000 条。
+
+import asyncio
+import collections
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from tb_metrics import REGISTRY
+
+# 超过该秒数仍未确认的消息不再占用窗口 (连接断开后 paho 会重发，确认可能永远不会回来)
+DEFAULT_ACK_TIMEOUT = 30.0
+# 默认保留的延迟样本数
+DEFAULT_SAMPLES = 10000
+
+_PUBACK = REGISTRY.histogram("mqtt_puback_seconds", "MQTT publish 到 PUBACK 的延迟 (秒)")
+
+
+# 计算延迟分位数 (毫秒)
+def percentiles(samples, points=(50, 99, 99.9)):
+    if not samples:
+        return {f"p{p:g}_ms": None for p in points}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {f"p{p:g}_ms": round(ordered[min(last, int(len(ordered) * p / 100))] * 1000, 3) for p in points}
+
+
+class TokenBucket:
+    # capacity 条 / period 秒，令牌匀速补充，最多积累 capacity 个 (允许的突发量)
+    def __init__(self, capacity, period=1.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return int(self.tokens)
+
+    # 距离有 n 个令牌还需等待的秒数
+    def delay(self, n, now):
+        self._refill(now)
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    def consume(self, n, now):
+        self._refill(now)
+        self.tokens -= n
+
+
+class RateLimit:
+    # spec 为 "容量:秒[,容量:秒...]"；share 用于把全局限额按比例分给多个进程
+    def __init__(self, spec, share=1.0):
+        self.spec = spec
+        self.buckets = []
+        for item in spec.split(','):
+            if not item.strip():
+                continue
+            capacity, period = item.split(':')
+            self.buckets.append(TokenBucket(max(1.0, float(capacity) * share), float(period)))
+        if not self.buckets:
+            raise ValueError(f"无效的速率限制: {spec!r}")
+        self._lock = threading.Lock()
+
+    def available(self, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            return min(b.available(now) for b in self.buckets)
+
+    def delay(self, n=1, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            return max(b.delay(n, now) for b in self.buckets)
+
+    def consume(self, n=1, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            for b in self.buckets:
+                b.consume(n, now)
+
+    def __repr__(self):
+        return f"RateLimit({self.spec!r})"
+
+
+def _as_limit(limit):
+    if limit is None or isinstance(limit, RateLimit):
+        return limit
+    return RateLimit(limit)
+
+
+class FlowControl:
+    # rate_limit 限制本连接，global_limit 为多条连接共用的 RateLimit 对象 (租户限额)
+    # samples 为保留的延迟样本数，None 表示全部保留 (压测)
+    def __init__(self, max_inflight=1000, rate_limit=None, global_limit=None, ack_timeout=DEFAULT_ACK_TIMEOUT,
+                 samples=DEFAULT_SAMPLES):
+        self.max_inflight = max_inflight
+        self.limits = [limit for limit in (_as_limit(rate_limit), _as_limit(global_limit)) if limit]
+        self.ack_timeout = ack_timeout
+        self.inflight = {}      # mid -> (publish 时间, 是否记录延迟, 确认回调)
+        self.latencies = collections.deque(maxlen=samples)
+        self.stats = {"published": 0, "acked": 0, "expired": 0, "throttled": 0, "throttled_s": 0.0}
+        self._early = set()     # publish() 返回前就已确认的 mid
+        self._publishing = None
+        self._acked = None
+        self._next = None
+
+    # 接管客户端的 on_publish 回调 (原回调仍会被调用)；paho 自己的窗口设为同样大小
+    def attach(self, client):
+        if client.on_publish != self._on_publish:
+            self._next = client.on_publish
+            client.on_publish = self._on_publish
+        client.max_inflight_messages_set(self.max_inflight)
+
+    def _on_publish(self, client, userdata, mid):
+        entry = self.inflight.pop(mid, None)
+        if entry is None and self._publishing is not None:
+            # QoS0 可能在 publish() 返回前就已回调
+            entry = self._publishing
+            self._early.add(mid)
+        if entry is not None:
+            self.stats["acked"] += 1
+            if entry[1]:
+                latency = time.perf_counter() - entry[0]
+                self.latencies.append(latency)
+                _PUBACK.observe(latency)
+            if entry[2]:
+                entry[2](True)
+        if self._acked is not None:
+            self._acked.set()
+        if self._next:
+            self._next(client, userdata, mid)
+
+    # 丢弃超时未确认的记录，带回调的通知发送方未确认
+    def expire(self):
+        if not self.inflight:
+            return
+        cutoff = time.perf_counter() - self.ack_timeout
+        stale = [mid for mid, entry in self.inflight.items() if entry[0] < cutoff]
+        for mid in stale:
+            callback = self.inflight.pop(mid)[2]
+            if callback:
+                callback(False)
+        self.stats["expired"] += len(stale)
+
+    # 当前还可以发送的消息数
+    def capacity(self):
+        free = self.max_inflight - len(self.inflight)
+        if free <= 0 or not self.limits:
+            return max(0, free)
+        now = time.monotonic()
+        return max(0, min(free, *(limit.available(now) for limit in self.limits)))
+
+    def ready(self):
+        if len(self.inflight) >= self.max_inflight:
+            return False
+        if not self.limits:
+            return True
+        now = time.monotonic()
+        return all(limit.available(now) >= 1 for limit in self.limits)
+
+    # 等待直到可以发送一条消息：窗口满时等待确认，令牌不足时睡到令牌补充
+    async def wait(self):
+        started = time.monotonic()
+        waited = False
+        while True:
+            if len(self.inflight) >= self.max_inflight:
+                self.expire()
+            if self.ready():
+                break
+            waited = True
+            if len(self.inflight) >= self.max_inflight:
+                if self._acked is None:
+                    self._acked = asyncio.Event()
+                self._acked.clear()
+                try:
+                    await asyncio.wait_for(self._acked.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                now = time.monotonic()
+                await asyncio.sleep(max(limit.delay(1, now) for limit in self.limits))
+        if waited:
+            self.stats["throttled"] += 1
+            self.stats["throttled_s"] += time.monotonic() - started
+
+    # 发送一条消息并登记到窗口中；sample=False 时不记录延迟 (如子设备注册)
+    # callback(ok) 在收到确认 (True) 或超时 (False) 时调用；发送失败时不调用，由返回值判断
+    def publish(self, client, topic, payload, qos=1, sample=True, callback=None):
+        if self.limits:
+            now = time.monotonic()
+            for limit in self.limits:
+                limit.consume(1, now)
+        self._publishing = entry = (time.perf_counter(), sample, callback)
+        info = client.publish(topic, payload, qos=qos)
+        self._publishing = None
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return info
+        self.stats["published"] += 1
+        if info.mid in self._early:
+            self._early.discard(info.mid)
+        else:
+            self.inflight[info.mid] = entry
+        return info
+
+    # 当前状态，用于上报网关自身的遥测
+    def metrics(self):
+        latency = percentiles(list(self.latencies), (50, 99))
+        return {"mqtt.inflight": len(self.inflight), "mqtt.acked": self.stats["acked"],
+                "mqtt.throttled": self.stats["throttled"], "mqtt.pubackP50Ms": latency["p50_ms"],
+                "mqtt.pubackP99Ms": latency["p99_ms"]}
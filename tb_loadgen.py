@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# tb_loadgen.py
+#
+# ThingsBoard 接入能力压测引擎。支持 MQTT (网关接口) 和 HTTP (设备接口) 两种传输，
+# 可配置子设备数量、发送速率、线性加压时间、消息大小和 QoS；读数为锯齿波或 tb_synth 的合成 AM308 数据 (synthetic)；
+# 统计吞吐、发送到确认的延迟分位数 (p50/p99/p999)、错误率和客户端 CPU 占用。
+
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gw_sim import GatewaySimulator
+from tb_flow import FlowControl, percentiles
+from tb_synth import SyntheticGenerator
+
+
+# 生成指定大小 (近似字节数) 的遥测值，不足部分用填充字段补齐；base 为读数来源 (make_values)，默认锯齿波
+def make_padded_values(payload_bytes, base=None):
+    def values(sensor_name, now):
+        if base:
+            data = base(sensor_name, now)
+        else:
+            data = {"temperature": round(20 + 5 * (now % 6) / 5, 2),
+                    "humidity": round(50 + 10 * (now % 6) / 5, 2)}
+        pad = payload_bytes - len(json.dumps(data)) - len(sensor_name) - 40
+        if pad > 0:
+            data["pad"] = "x" * pad
+        return data
+    return values
+
+
+class CpuMeter:
+    def __init__(self):
+        self.start()
+
+    def start(self):
+        t = os.times()
+        self.cpu = t.user + t.system
+        self.wall = time.monotonic()
+
+    # 自 start() 以来客户端进程 CPU 占用 (单核百分比)
+    def percent(self):
+        t = os.times()
+        wall = time.monotonic() - self.wall
+        return round((t.user + t.system - self.cpu) / wall * 100, 1) if wall > 0 else 0.0
+
+
+# 汇总一次压测结果
+def build_report(config, sent, acked, errors, latencies, elapsed, cpu_percent):
+    report = {
+        "config": config,
+        "sent": sent,
+        "acked": acked,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(acked / elapsed, 1) if elapsed > 0 else 0.0,
+        "error_rate": round(errors / (sent + errors), 6) if sent + errors else 0.0,
+        "client_cpu_percent": cpu_percent,
+    }
+    report.update(percentiles(latencies))
+    return report
+
+
+# MQTT 压测：在 GatewaySimulator 基础上统计每条消息从 publish 到 PUBACK (QoS0 为写出 socket) 的延迟，
+# 延迟由 FlowControl 记录 (保留全部样本)；max_inflight / rate_limit 可用于测试服务端限流下的表现
+# synthetic=True 时读数为合成 AM308 数据 (每个间隔向量化计算一次)，seed 相同时各次压测的读数相同
+class MqttLoadGenerator(GatewaySimulator):
+    def __init__(self, client, sensors, interval=10.0, qos=1, payload_bytes=0, ramp_up=0.0, max_inflight=1000,
+                 rate_limit=None, global_limit=None, synthetic=False, seed=None, **kwargs):
+        base = SyntheticGenerator(sensors, seed=seed).values if synthetic else None
+        super().__init__(client, sensors, interval=interval, qos=qos,
+                         make_values=make_padded_values(payload_bytes, base),
+                         flow=FlowControl(max_inflight, rate_limit, global_limit, samples=None), **kwargs)
+        self.ramp_up = ramp_up
+
+    @property
+    def latencies(self):
+        return self.flow.latencies
+
+    # 线性加压：第 i 个子设备在 ramp_up * i / N 秒后开始发送；不加压时按相位偏移分散
+    def first_deadline(self, index, now):
+        if not self.ramp_up:
+            return super().first_deadline(index, now)
+        return now + self.ramp_up * index / len(self.sensors)
+
+    # 运行压测并返回报告；结束后等待剩余确认最多 drain_timeout 秒
+    async def run_load(self, host, port=1883, duration=60.0, drain_timeout=5.0):
+        await self.connect(host, port)
+        if self.registration == "eager":
+            await self.register_sensors()
+        cpu = CpuMeter()
+        started = time.monotonic()
+        supervise = asyncio.create_task(self.supervisor.run()) if self.supervisor else None
+        await self.schedule(duration)
+        if supervise:
+            supervise.cancel()
+        if self.batcher:
+            self.batcher.flush()
+        deadline = time.monotonic() + drain_timeout
+        while self.flow.inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.monotonic() - started
+        cpu_percent = cpu.percent()
+        self.client.disconnect()
+        return self.stats["published"], len(self.latencies), self.stats["errors"], elapsed, cpu_percent
+
+
+# HTTP 压测：一个调度线程按最小堆分发任务，线程池并发 POST 到各设备的遥测接口
+class HttpLoadGenerator:
+    def __init__(self, client, tokens, interval=10.0, payload_bytes=0, ramp_up=0.0, workers=32, synthetic=False,
+                 seed=None):
+        self.client = client
+        self.tokens = list(tokens)
+        if not self.tokens:
+            raise ValueError("没有可用的设备 Access Token")
+        self.interval = interval
+        self.ramp_up = ramp_up
+        self.workers = workers
+        base = SyntheticGenerator(self.tokens, seed=seed).values if synthetic else None
+        self.make_values = make_padded_values(payload_bytes, base)
+        self.latencies = []
+        self.sent = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _post(self, index, now, values):
+        body = json.dumps({"ts": int(now * 1000), "values": values})
+        started = time.perf_counter()
+        try:
+            self.client.post_telemetry_raw(self.tokens[index], body)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.sent += 1
+            self.latencies.append(latency)
+
+    def run_load(self, duration=60.0):
+        now = time.time()
+        count = len(self.tokens)
+        heap = [(now + self.ramp_up * i / count, i) for i in range(count)]
+        heapq.heapify(heap)
+        cpu = CpuMeter()
+        started = time.monotonic()
+        deadline = now + duration
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                now = time.time()
+                if now >= deadline:
+                    break
+                while heap[0][0] <= now:
+                    due, index = heap[0]
+                    # 读数在调度线程中生成 (合成数据生成器不是线程安全的)
+                    pool.submit(self._post, index, now, self.make_values(self.tokens[index], now))
+                    heapq.heapreplace(heap, (due + self.interval, index))
+                time.sleep(max(0.0, min(heap[0][0], deadline) - time.time()))
+        elapsed = time.monotonic() - started
+        return self.sent, len(self.latencies), self.errors, elapsed, cpu.percent()
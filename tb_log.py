@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# tb_log.py
+#
+# 分级、限流的结构化日志，代替热循环中每条消息一次的 print。
+# 消息文本是固定的模板，可变内容作为字段传入: log.info("遥测已发送", keys=12)，输出
+#   [INFO] 2025-05-01 12:00:00 tb.run: 遥测已发送 keys=12
+# 或 JSON 一行 (format = json)。未开启的级别在格式化之前就返回，不产生字符串拼接和 I/O。
+# 同一个 (logger, 消息模板) 每个窗口最多输出 rate 条，超出的计数，并在窗口结束后的下一条中注明被限流的条数；
+# 被限流的总数同时计入指标 tb_log_suppressed_total。
+
+import json
+import logging
+import sys
+import threading
+import time
+
+from tb_metrics import REGISTRY
+
+# 默认级别和限流：每个消息模板每 per 秒最多 rate 条
+DEFAULT_LEVEL = "INFO"
+DEFAULT_RATE = 10
+DEFAULT_PER = 60.0
+
+_SUPPRESSED = REGISTRY.counter("log_suppressed_total", "被限流丢弃的日志条数")
+
+
+# 按 (logger, 消息模板) 限流，在创建 LogRecord 之前判断，被丢弃的日志几乎没有开销
+class RateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, per=DEFAULT_PER):
+        self.rate = rate
+        self.per = per
+        # (logger, 消息模板) -> [窗口开始时间, 本窗口已输出条数, 被限流条数]
+        self.windows = {}
+        self._lock = threading.Lock()
+
+    # 允许输出时返回此前被限流的条数，否则返回 None
+    def check(self, name, msg):
+        if not self.rate:
+            return 0
+        key = (name, msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.per:
+                self.windows[key] = [now, 1, 0]
+                return window[2] if window else 0
+            if window[1] < self.rate:
+                window[1] += 1
+                return 0
+            window[2] += 1
+        _SUPPRESSED.inc()
+        return None
+
+
+_LIMITER = RateLimiter()
+
+
+def _fields(record):
+    return getattr(record, 'fields', None) or {}
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = f"[{record.levelname}] {self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.name}: {record.msg}"
+        fields = _fields(record)
+        if fields:
+            text += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        if getattr(record, 'suppressed', 0):
+            text += f' (此前 {record.suppressed} 条相同日志被限流)'
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "msg": record.msg}
+        entry.update(_fields(record))
+        if getattr(record, 'suppressed', 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructLogger:
+    def __init__(self, logger):
+        self.logger = logger
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = _LIMITER.check(self.logger.name, msg)
+        if suppressed is not None:
+            self.logger.log(level, msg, extra={"fields": fields, "suppressed": suppressed}, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, exc_info=False, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info)
+
+    def enabled(self, level):
+        return self.logger.isEnabledFor(level)
+
+
+def get_logger(name):
+    return StructLogger(logging.getLogger(f"tb.{name}"))
+
+
+# 配置 tb.* 日志：级别、输出格式 (text / json) 和限流；可重复调用，后一次覆盖前一次
+def setup_logging(level=DEFAULT_LEVEL, fmt="text", rate=DEFAULT_RATE, per=DEFAULT_PER, stream=None):
+    root = logging.getLogger("tb")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    _LIMITER.rate, _LIMITER.per = rate, per
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+    return root
+
+
+# 从 config.ini 的 [Logging] 段配置日志；rate_limit 格式为 条数:秒，0 表示不限流
+def logging_from_config(config):
+    section = config['Logging'] if config.has_section('Logging') else {}
+    rate, _, per = str(section.get('rate_limit', f'{DEFAULT_RATE}:{DEFAULT_PER:g}')).partition(':')
+    return setup_logging(section.get('level', DEFAULT_LEVEL), section.get('format', 'text'),
+                         int(rate), float(per or DEFAULT_PER))
+
+
+# 未配置时使用默认设置 (INFO、文本格式、默认限流)
+if not logging.getLogger("tb").handlers:
+    setup_logging()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# tb_lookup.py
+#
+# Device / Device Profile 按名字查找。
+# 优先使用精确名字接口；没有精确接口时按页惰性遍历全部结果 (跟随 hasNext)，
+# 并把遍历过的实体记入内存中的 名字 -> ID 索引，之后的查找都是 O(1)。
+
+import threading
+
+PAGE_SIZE = 1000
+
+
+# 按页惰性遍历分页接口，逐个返回实体
+def iter_pages(client, path, page_size=PAGE_SIZE, text_search=None):
+    page = 0
+    while True:
+        params = {'pageSize': page_size, 'page': page}
+        if text_search:
+            params['textSearch'] = text_search
+        data = client.get(path, params=params)
+        for item in data.get('data', []):
+            yield item
+        if not data.get('hasNext'):
+            return
+        page += 1
+
+
+class EntityIndex:
+    list_path = None
+
+    def __init__(self, client, page_size=PAGE_SIZE):
+        self.client = client
+        self.page_size = page_size
+        self.ids = {}
+        self.complete = False   # 已完整加载时，索引中没有的名字即不存在
+        self._lock = threading.Lock()
+
+    def _remember(self, entity):
+        self.ids[entity['name']] = entity['id']['id']
+
+    # 遍历全部分页建立完整索引，适合一次查找大量名字
+    def preload(self):
+        ids = {}
+        for entity in iter_pages(self.client, self.list_path, self.page_size):
+            ids[entity['name']] = entity['id']['id']
+        with self._lock:
+            self.ids.update(ids)
+            self.complete = True
+        return len(ids)
+
+    # 精确查找单个名字：按 textSearch 翻页直到找到同名实体；有按名字查询接口的子类覆盖此方法
+    def _lookup(self, name):
+        for entity in iter_pages(self.client, self.list_path, self.page_size, text_search=name):
+            self._remember(entity)
+            if entity['name'] == name:
+                return entity['id']['id']
+        return None
+
+    # 返回名字对应的 ID，不存在时返回 None
+    def get(self, name):
+        entity_id = self.ids.get(name)
+        if entity_id or self.complete:
+            return entity_id
+        entity_id = self._lookup(name)
+        if entity_id:
+            self.ids[name] = entity_id
+        return entity_id
+
+    # 新建实体后登记到索引
+    def add(self, name, entity_id):
+        self.ids[name] = entity_id
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ProfileIndex(EntityIndex):
+    # Device Profile 没有按名字精确查询的接口，用 textSearch 缩小分页范围
+    list_path = '/api/deviceProfiles'
+
+
+class DeviceIndex(EntityIndex):
+    list_path = '/api/tenant/devices'
+
+    def _lookup(self, name):
+        device = self.client.get_device_by_name(name)
+        return device['id']['id'] if device else None
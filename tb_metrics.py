@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# tb_metrics.py
+#
+# 进程内指标：计数器和直方图 (固定桶，与 Prometheus 相同)，以及从各组件 metrics() 字典取值的采集函数，
+# 通过本地 HTTP 端点 /metrics 以 Prometheus 文本格式输出，可直接被 Prometheus / VictoriaMetrics 抓取。
+# 热路径上的直方图只做一次二分查找和加锁计数；单条消息耗时很短的环节 (编码) 按 1/SAMPLE_EVERY 抽样计时。
+# StackSampler 为可选的采样分析器：后台线程定期抓取指定线程的调用栈，只保留经过发送路径 (focus) 的样本，
+# 输出 collapsed stack 格式 (flamegraph.pl / speedscope 可直接读取)，也可从 /profile 取回。
+
+import bisect
+import collections
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 指标名前缀
+PREFIX = "tb_"
+# 默认直方图桶 (秒)：网络往返
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 编码耗时桶 (秒)
+ENCODE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+# 编码计时的抽样间隔 (2 的幂，用位与判断)
+SAMPLE_EVERY = 64
+SAMPLE_MASK = SAMPLE_EVERY - 1
+# /metrics 默认监听地址
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9108
+# 默认发送路径：采样分析器只保留经过这些函数的调用栈
+PUBLISH_PATH = ("publish_telemetry", "publish_payload", "_flush_locked", "_republish")
+
+
+def _name(name):
+    return PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text=''):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter', f'{self.name} {self.value}']
+
+
+class Histogram:
+    def __init__(self, name, help_text='', buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # 每个桶 (含 +Inf) 的非累计计数
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    # 按桶估算分位数 (毫秒，桶内线性插值)，用于在遥测中上报
+    def quantile_ms(self, q):
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return round((lower + (upper - lower) * (rank - seen) / n) * 1000, 3)
+            seen += n
+        return None
+
+    def render(self):
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f'{self.name}_sum {value_sum!r}')
+        lines.append(f'{self.name}_count {total}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        # (采集函数, 标签)；采集函数返回 {指标名: 数值}，与各组件 metrics() 的返回值相同
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args):
+        name = _name(name)
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    # 登记一个采集函数，每次输出时调用，返回值作为 gauge 输出 (None 跳过)
+    def collect(self, collector, **labels):
+        self.collectors.append((collector, labels))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        gauges = collections.defaultdict(list)
+        for collector, labels in self.collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                lines.append(f'# 采集失败: {e}')
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gauges[_name(key)].append(f'{_name(key)}{_labels(labels)} {_number(value)}')
+        for name, samples in gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内默认注册表，各模块的指标都登记在这里
+REGISTRY = MetricsRegistry()
+
+
+class StackSampler:
+    # thread 为被采样线程的 ident (默认主线程)；focus 为函数名集合，只保留经过其中任一函数的样本，None 保留全部
+    def __init__(self, interval=0.01, thread=None, focus=PUBLISH_PATH, max_depth=64):
+        self.interval = interval
+        self.thread = thread or threading.main_thread().ident
+        self.focus = set(focus) if focus else None
+        self.max_depth = max_depth
+        # "外层;...;内层" -> 次数
+        self.stacks = collections.Counter()
+        self.stats = {"samples": 0, "kept": 0}
+        self._stop = threading.Event()
+        self._worker = None
+
+    def start(self):
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='tb-sampler', daemon=True)
+        self._worker.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._worker:
+            self._worker.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread)
+            if frame is None:
+                continue
+            self.stats["samples"] += 1
+            names = []
+            hit = self.focus is None
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                if not hit and code.co_name in self.focus:
+                    hit = True
+                names.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                frame = frame.f_back
+            if hit:
+                self.stats["kept"] += 1
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+
+
+# 本地 HTTP 端点：GET /metrics 输出注册表，设置了 profiler 时 GET /profile 输出采样结果
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host=DEFAULT_HOST, port=DEFAULT_PORT, profiler=None):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.profiler = profiler
+        self.server = None
+
+    def start(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    body = owner.registry.render().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path.split('?')[0] == '/profile' and owner.profiler:
+                    body = owner.profiler.collapsed().encode('utf-8')
+                    content_type = 'text/plain; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        # tb_log 依赖本模块的 REGISTRY，在这里导入避免循环导入
+        from tb_log import get_logger
+        log = get_logger("metrics")
+        # 端口被占用 (例如同一台机器上的第二个进程) 时只记录警告，不影响遥测
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            log.warning("指标端点启动失败", host=self.host, port=self.port, error=e)
+            return self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name='tb-metrics', daemon=True).start()
+        log.info("指标端点已启动", url=f"http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# 从 config.ini 的 [Metrics] 段启动指标端点 (port = 0 或未配置时不启动)，profile = true 时同时采样发送路径
+def metrics_server_from_config(config, registry=REGISTRY):
+    section = config['Metrics'] if config.has_section('Metrics') else {}
+    port = int(section.get('port', 0))
+    if not port:
+        return None
+    profiler = None
+    if str(section.get('profile', 'false')).lower() in ('1', 'true', 'yes', 'on'):
+        profiler = StackSampler(float(section.get('profile_interval', 0.01))).start()
+    return MetricsServer(registry, section.get('host', DEFAULT_HOST), port, profiler).start()
+
+
+# 本进程开始运行以来的秒数，作为默认的 gauge
+_STARTED = time.monotonic()
+REGISTRY.collect(lambda: {"process.uptimeS": round(time.monotonic() - _STARTED, 3)})
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# tb_profile.py
+#
+# 声明式 Device Profile：profiles.json 中用简写描述告警规则，展开为 ThingsBoard 的 Device Profile 结构。
+# 同步 (reconcile) 时取回服务端当前的 Profile，只比较声明中出现的字段 (服务端补充的字段不算差异)，
+# 有差异才发送更新。每个 Profile 展开结果的内容哈希记录在本地缓存中，
+# 声明未变化的 Profile 再次运行时不发任何请求；需要检查服务端是否被手工修改时使用 verify。
+#
+# 告警简写:
+#   {"id": "...", "alarmType": "...",
+#    "create": {"CRITICAL": [{"attribute": "active", "equals": false}]},
+#    "clear": [{"attribute": "active", "equals": true}]}
+# 条件的键: attribute / timeseries / entity_field 之一；比较: equals / not_equals / greater / less /
+# greater_or_equal / less_or_equal；值类型由值推断 (bool -> BOOLEAN, 数值 -> NUMERIC, 字符串 -> STRING)。
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tb_cache import JsonFileCache
+from tb_log import get_logger
+from tb_lookup import ProfileIndex
+
+log = get_logger("profile")
+
+DEFAULT_SPEC_PATH = 'profiles.json'
+DEFAULT_CACHE_PATH = '.tb-profiles.json'
+
+# 需要同步的 Profile 多于该数量时先一次性加载全部名字
+PRELOAD_THRESHOLD = 50
+
+KEY_TYPES = {"attribute": "ATTRIBUTE", "timeseries": "TIME_SERIES", "entity_field": "ENTITY_FIELD"}
+OPERATIONS = {"equals": "EQUAL", "not_equals": "NOT_EQUAL", "greater": "GREATER", "less": "LESS",
+              "greater_or_equal": "GREATER_OR_EQUAL", "less_or_equal": "LESS_OR_EQUAL"}
+
+
+class ProfileSpecError(ValueError):
+    pass
+
+
+def _condition(spec):
+    keys = [k for k in KEY_TYPES if k in spec]
+    ops = [op for op in OPERATIONS if op in spec]
+    if len(keys) != 1 or len(ops) != 1:
+        raise ProfileSpecError(f"告警条件需要一个键和一个比较: {spec}")
+    value = spec[ops[0]]
+    if isinstance(value, bool):
+        value_type = "BOOLEAN"
+    elif isinstance(value, (int, float)):
+        value_type = "NUMERIC"
+    else:
+        value_type = "STRING"
+    return {
+        "key": {"type": KEY_TYPES[keys[0]], "key": spec[keys[0]]},
+        "valueType": value_type,
+        "predicate": {"type": value_type, "operation": OPERATIONS[ops[0]], "value": {"defaultValue": value}},
+    }
+
+
+def _rule(conditions):
+    return {"condition": {"condition": [_condition(c) for c in conditions]}}
+
+
+def expand_alarm(spec):
+    alarm = {
+        "id": spec["id"],
+        "alarmType": spec["alarmType"],
+        "createRules": {severity: _rule(conditions) for severity, conditions in spec["create"].items()},
+    }
+    if "clear" in spec:
+        alarm["clearRule"] = _rule(spec["clear"])
+    alarm["detail"] = spec.get("detail")
+    return alarm
+
+
+# 读取声明文件: {模板名: 声明}
+def load_specs(path=DEFAULT_SPEC_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# 按模板展开为完整的 Device Profile 请求体；extends 继承另一个模板，本模板的字段覆盖父模板
+def build_profile(specs, template, name):
+    spec, seen = {}, []
+    while template is not None:
+        if template in seen or template not in specs:
+            raise ProfileSpecError(f"Profile 模板不存在或循环继承: {template}")
+        seen.append(template)
+        parent = specs[template]
+        spec = {**parent, **spec}
+        template = parent.get("extends")
+
+    profile = {
+        "name": name,
+        "type": "DEFAULT",
+        "transportType": spec.get("transportType", "DEFAULT"),
+        "provisionType": "DISABLED",
+        "default": False,
+        "profileData": {
+            "configuration": {"type": "DEFAULT"},
+            "transportConfiguration": spec.get("transportConfiguration", {"type": "DEFAULT"}),
+            "provisionConfiguration": {"type": "DISABLED"},
+        },
+    }
+    if "description" in spec:
+        profile["description"] = spec["description"]
+    if "alarms" in spec:
+        profile["profileData"]["alarms"] = [expand_alarm(a) for a in spec["alarms"]]
+    return profile
+
+
+# 键本身是数据的字典 (如 严重级别 -> 规则)，服务端多出的键也算差异
+EXACT_KEYS = {'createRules'}
+
+
+# 结构化差异：只比较 desired 中出现的字段，返回 [(路径, 当前值, 期望值)]
+# 列表按位置比较，长度不同时整体视为变化
+def diff(desired, current, path='', exact=False):
+    if isinstance(desired, dict) and isinstance(current, dict):
+        changes = []
+        for key, value in desired.items():
+            sub = f'{path}.{key}' if path else key
+            if key not in current:
+                if value is not None:
+                    changes.append((sub, None, value))
+            else:
+                changes.extend(diff(value, current[key], sub, key in EXACT_KEYS))
+        if exact:
+            changes.extend((f'{path}.{key}', current[key], None) for key in current if key not in desired)
+        return changes
+    if isinstance(desired, list) and isinstance(current, list) and len(desired) == len(current):
+        changes = []
+        for i, (d, c) in enumerate(zip(desired, current)):
+            changes.extend(diff(d, c, f'{path}[{i}]'))
+        return changes
+    return [] if desired == current else [(path, current, desired)]
+
+
+# 把 desired 合并进服务端当前的 Profile：字典逐层合并，保留服务端字段 (id、版本号等)，列表整体替换
+def merge(current, desired):
+    merged = copy.deepcopy(current)
+    for key, value in desired.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def content_hash(profile):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class ProfileReconciler:
+    def __init__(self, client, cache_path=DEFAULT_CACHE_PATH, index=None, workers=8):
+        self.client = client
+        self.cache_path = cache_path
+        self.index = index or ProfileIndex(client)
+        self.workers = workers
+        self.stats = {"cached": 0, "in_sync": 0, "created": 0, "updated": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self.cache = JsonFileCache(cache_path)
+
+    # 缓存按服务器和名字区分
+    def _cache_key(self, name):
+        return f'{self.client.host} {name}'
+
+    def _fetch(self, profile_id):
+        try:
+            return self.client.get_device_profile(profile_id)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+
+    # 同步一个 Profile，返回 (Profile ID, 状态)；状态为 cached / in_sync / created / updated
+    # verify=True 时忽略本地缓存，取回服务端 Profile 比较 (用于发现服务端被手工修改)
+    def reconcile(self, desired, verify=False, save=True):
+        name = desired["name"]
+        digest = content_hash(desired)
+        key = self._cache_key(name)
+        cached = self.cache.get(key)
+        if not verify and cached and cached["hash"] == digest:
+            self.index.add(name, cached["id"])
+            return self._done(name, cached["id"], digest, "cached", save)
+
+        profile_id = cached["id"] if cached else self.index.get(name)
+        current = self._fetch(profile_id) if profile_id else None
+        if current is None and cached:
+            # 缓存中的 ID 已被删除，按名字重新查找
+            profile_id = self.index.get(name)
+            current = self._fetch(profile_id) if profile_id else None
+
+        if current is None:
+            profile_id = self.client.create_device_profile(desired)['id']['id']
+            print(f"[INFO] Device Profile 创建成功: {name}")
+            status = "created"
+        else:
+            changes = diff(desired, current)
+            if changes:
+                print(f"[INFO] Device Profile {name} 有 {len(changes)} 处变更:\n" + '\n'.join(
+                    f"    {path}: {json.dumps(old, ensure_ascii=False)} -> {json.dumps(new, ensure_ascii=False)}"
+                    for path, old, new in changes))
+                self.client.create_device_profile(merge(current, desired))
+                status = "updated"
+            else:
+                status = "in_sync"
+        self.index.add(name, profile_id)
+        return self._done(name, profile_id, digest, status, save)
+
+    def _done(self, name, profile_id, digest, status, save):
+        if status != "cached":
+            self.cache.set(self._cache_key(name), {"id": profile_id, "hash": digest, "synced": int(time.time())})
+        with self._lock:
+            self.stats[status] += 1
+        if save and status != "cached":
+            self.cache.save()
+        return profile_id, status
+
+    # 并发同步多个 Profile，返回 {名字: Profile ID}，失败的为 None；结束后统一写一次缓存
+    def reconcile_all(self, profiles, verify=False):
+        profiles = list(profiles)
+        pending = [p for p in profiles if verify or
+                   (self.cache.get(self._cache_key(p["name"])) or {}).get("hash") != content_hash(p)]
+        if len(pending) > PRELOAD_THRESHOLD and not self.index.complete:
+            self.index.preload()
+
+        def run(profile):
+            try:
+                return profile["name"], self.reconcile(profile, verify=verify, save=False)[0]
+            except requests.exceptions.RequestException as e:
+                log.error("Device Profile 同步失败", profile=profile['name'], error=e)
+                with self._lock:
+                    self.stats["failed"] += 1
+                return profile["name"], None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            ids = dict(pool.map(run, profiles))
+        self.cache.save()
+        return ids
+
+
+# 从 config.ini 的 [Profiles] 段读取声明文件和缓存路径
+def reconciler_options(config):
+    section = config['Profiles'] if config.has_section('Profiles') else {}
+    return {"spec_path": section.get('spec_path', DEFAULT_SPEC_PATH),
+            "cache_path": section.get('cache', DEFAULT_CACHE_PATH),
+            "verify": str(section.get('verify', 'false')).lower() in ('1', 'true', 'yes', 'on')}
+
+
+# 按声明同步单个 Profile，返回 Profile ID；供各脚本调用
+def sync_profile(client, template, name, spec_path=DEFAULT_SPEC_PATH, cache_path=DEFAULT_CACHE_PATH,
+                 verify=False, index=None):
+    reconciler = ProfileReconciler(client, cache_path=cache_path, index=index)
+    profile_id, status = reconciler.reconcile(build_profile(load_specs(spec_path), template, name), verify=verify)
+    if status in ("cached", "in_sync"):
+        print(f"[INFO] Device Profile 无变化: {name}")
+    return profile_id
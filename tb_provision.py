@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# tb_provision.py
+#
+# 批量开通引擎：读取设备清单 (CSV / JSON)，一次登录后用有界线程池并发完成
+# 设备查询、创建、获取 Access Token 和 SERVER_SCOPE 属性上报，并记录每台设备的结果。
+
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tb_attrs import DEFAULT_CACHE_PATH as ATTRIBUTE_CACHE_PATH, SERVER_SCOPE, AttributeSync
+from tb_credentials import DEFAULT_MAX_AGE, CredentialRefresher
+from tb_log import get_logger
+from tb_lookup import DeviceIndex, ProfileIndex
+from tb_profile import DEFAULT_CACHE_PATH, DEFAULT_SPEC_PATH, ProfileReconciler, build_profile, load_specs
+
+log = get_logger("provision")
+
+# 清单中除这些列以外的字段都作为 SERVER_SCOPE 属性上报
+MANIFEST_FIELDS = ('name', 'profile', 'gateway')
+RESULT_FIELDS = ['name', 'status', 'device_id', 'access_token', 'elapsed_ms', 'error']
+# 清单超过该数量时先分页加载租户下全部设备，之后每台设备的查找不再调用接口
+PRELOAD_THRESHOLD = 200
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+# 读取设备清单，统一为 {"name", "profile", "gateway", "attributes"} 列表
+def load_manifest(path, default_profile=None):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    devices = []
+    for line, row in enumerate(rows, 1):
+        # CSV 中的 attributes 列为 JSON 字符串
+        attributes = row.get('attributes') or {}
+        if isinstance(attributes, str):
+            try:
+                attributes = json.loads(attributes)
+            except ValueError as e:
+                raise ValueError(f"清单第 {line} 条 ({row.get('name')}) 的 attributes 不是合法的 JSON: {e}")
+        attributes = dict(attributes)
+        attributes.update({k: v for k, v in row.items()
+                           if k not in MANIFEST_FIELDS and k != 'attributes' and v not in (None, '')})
+        devices.append({
+            "name": row['name'],
+            "profile": row.get('profile') or default_profile,
+            "gateway": _to_bool(row.get('gateway', False)),
+            "attributes": attributes,
+        })
+    _check_profiles(devices)
+    return devices
+
+
+# 每台设备都必须有 Device Profile (清单中的 profile 或默认值)，否则列出缺少的设备
+def _check_profiles(devices):
+    missing = [f"第 {line} 条 ({d['name']})" for line, d in enumerate(devices, 1) if not d.get('profile')]
+    if missing:
+        raise ValueError(f"{len(missing)} 台设备没有 Device Profile，请在清单中填写 profile 列或指定默认 Profile: "
+                         + ', '.join(missing[:10]) + (' ...' if len(missing) > 10 else ''))
+
+
+def write_results(path, results):
+    if path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+class FleetProvisioner:
+    # profile_template 为 profiles.json 中的模板名，设置后清单中的 Profile 都按该声明同步 (创建或更新)
+    def __init__(self, client, workers=16, profile_template=None, spec_path=DEFAULT_SPEC_PATH,
+                 profile_cache=DEFAULT_CACHE_PATH, attribute_cache=ATTRIBUTE_CACHE_PATH, verify_attributes=False,
+                 credentials=None, credential_max_age=DEFAULT_MAX_AGE):
+        self.client = client
+        self.workers = workers
+        self.profiles = ProfileIndex(client)
+        self.devices = DeviceIndex(client)
+        self.profile_template = profile_template
+        self.spec_path = spec_path
+        self.profile_cache = profile_cache
+        self.credentials = credentials
+        self.credential_max_age = credential_max_age
+        self.tokens = {}
+        self.attributes = AttributeSync(client, cache_path=attribute_cache, verify=verify_attributes,
+                                        autosave=False)
+
+    # 在开启线程池之前准备好所有用到的 Device Profile，避免并发重复创建
+    def prepare_profiles(self, names):
+        names = sorted(set(names))
+        if self.profile_template:
+            specs = load_specs(self.spec_path)
+            reconciler = ProfileReconciler(self.client, cache_path=self.profile_cache, index=self.profiles,
+                                           workers=self.workers)
+            reconciler.reconcile_all(build_profile(specs, self.profile_template, name) for name in names)
+            print(f"[INFO] Device Profile 同步完成: {reconciler.stats}")
+            return
+        for name in names:
+            if self.profiles.get(name):
+                continue
+            payload = {
+                "name": name,
+                "type": "DEFAULT",
+                "transportType": "DEFAULT",
+                "profileData": {"configuration": {"type": "DEFAULT"},
+                                "transportConfiguration": {"type": "DEFAULT"}}
+            }
+            self.profiles.add(name, self.client.create_device_profile(payload)['id']['id'])
+            print(f"[INFO] Device Profile 创建成功: {name}")
+
+    # 开通单台设备：查询 -> (创建) -> Access Token -> SERVER_SCOPE 属性
+    def provision_one(self, device):
+        started = time.perf_counter()
+        result = {"name": device['name'], "status": None, "device_id": None,
+                  "access_token": None, "elapsed_ms": None, "error": None}
+        try:
+            device_id = self.devices.get(device['name'])
+            new = not device_id
+            if device_id:
+                result['status'] = 'exists'
+            else:
+                created = self.client.create_device(device['name'], self.profiles.get(device['profile']),
+                                                    gateway=device['gateway'])
+                device_id = created['id']['id']
+                self.devices.add(device['name'], device_id)
+                result['status'] = 'created'
+            result['device_id'] = device_id
+            # 新建的设备 (可能与凭据库中已删除的设备同名) 总是取回新的 Token
+            token = None if new else self.tokens.get(device['name'])
+            result['access_token'] = token or self.client.get_access_token(device_id)
+            # 只发送与服务端不同的键，重复开通时不再写入
+            if device['attributes']:
+                self.attributes.sync_device(device_id, device['attributes'], new=new)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def run(self, devices, progress_every=500):
+        _check_profiles(devices)
+        self.prepare_profiles(d['profile'] for d in devices)
+        if len(devices) > PRELOAD_THRESHOLD:
+            print(f"[INFO] 已加载租户设备索引: {self.devices.preload()} 台")
+            self.prefetch_attributes(devices)
+        # 传入凭据库时，已存在设备的 Token 在有效期内直接使用，过期的并发验证
+        if self.credentials is not None:
+            refresher = CredentialRefresher(self.client, self.credentials, workers=self.workers,
+                                            max_age=self.credential_max_age, index=self.devices)
+            # 设备索引中已有的 ID 交给刷新器核对，凭据库中同名设备的 ID 不同时重新取回 Token
+            known = {d['name']: self.devices.ids[d['name']] for d in devices if d['name'] in self.devices.ids}
+            self.tokens = refresher.refresh((d['name'] for d in devices), device_ids=known)
+            print(f"[INFO] 凭据库: {refresher.stats}")
+        results = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for result in pool.map(self.provision_one, devices):
+                results.append(result)
+                done += 1
+                if result['status'] == 'error':
+                    log.error("设备开通失败", device=result['name'], error=result['error'])
+                elif progress_every and done % progress_every == 0:
+                    print(f"[INFO] 已完成 {done}/{len(devices)}")
+        self.attributes.save()
+        # 新取得的 Token 写回凭据库
+        if self.credentials is not None:
+            now = time.time()
+            self.credentials.put_many({"name": r['name'], "device_id": r['device_id'], "access_token": r['access_token'],
+                                       "validated": now} for r in results
+                                      if r['access_token'] and r['access_token'] != self.tokens.get(r['name']))
+        print(f"[INFO] 属性同步: {self.attributes.stats}")
+        return results
+
+    # 成批取回清单中已存在设备的当前属性 (本地缓存已有的跳过)，避免逐台查询
+    def prefetch_attributes(self, devices):
+        pending, keys = [], set()
+        for device in devices:
+            device_id = self.devices.get(device['name'])
+            if device_id and device['attributes'] and (
+                    self.attributes.verify or self.attributes.changed(device_id, SERVER_SCOPE, device['attributes'])):
+                pending.append(device_id)
+                keys.update(device['attributes'])
+        if pending:
+            print(f"[INFO] 已取回现有设备属性: {self.attributes.prefetch(pending, keys)} 台")
+
+
+# 汇总结果：各状态数量和吞吐
+def summarize(results, elapsed):
+    summary = {"total": len(results), "elapsed_s": round(elapsed, 3)}
+    for r in results:
+        summary[r['status']] = summary.get(r['status'], 0) + 1
+    summary['devices_per_s'] = round(len(results) / elapsed, 1) if elapsed > 0 else None
+    return summary
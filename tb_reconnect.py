@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# tb_reconnect.py
+#
+# 断线重连：Broker 重启后成千上万个网关如果同时、按固定间隔重连，会在恢复的瞬间再次把 ThingsBoard 压垮 (重连风暴)。
+#   Backoff:             decorrelated jitter 退避，每次等待 random(base, 上次 * 3)，不超过 cap，成功后复位；
+#                        各客户端的重连时间很快错开，不会在同一时刻集中到达
+#   ReconnectGate:       同一进程内所有连接共用的重连并发上限 (已发出 CONNECT、尚未收到 CONNACK 的连接数)
+#   ConnectionSupervisor: 挂到 GatewaySimulator 的 paho 客户端上，连接意外断开后按退避和并发上限重连，统计重连指标
+# 客户端使用持久会话 (clean_session=False，固定 client id)：重连后 Broker 保留订阅和下发的 QoS1 消息，
+# paho 重发未确认的 QoS1 消息，FlowControl 中登记的确认照常回来。
+
+import asyncio
+import collections
+import random
+import time
+
+import paho.mqtt.client as mqtt
+
+from tb_flow import DEFAULT_SAMPLES, percentiles
+
+# 默认退避参数 (秒) 和等待 CONNACK 的超时
+DEFAULT_BASE = 1.0
+DEFAULT_CAP = 120.0
+CONNECT_TIMEOUT = 10.0
+# 默认重连并发上限
+DEFAULT_MAX_CONNECTING = 50
+
+
+# 创建网关 MQTT 客户端；persistent=True 时使用持久会话，client_id 必须固定且唯一
+def mqtt_client(client_id, token=None, persistent=True):
+    client = mqtt.Client(client_id, clean_session=not persistent)
+    if token:
+        client.username_pw_set(token)
+    return client
+
+
+class Backoff:
+    # jitter=False 时为不加随机的指数退避 (base, 2*base, 4*base ...)，与 paho 默认行为相同，仅用于对比
+    def __init__(self, base=DEFAULT_BASE, cap=DEFAULT_CAP, jitter=True, rng=None):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.attempt = 0
+        self.sleep = base
+
+    # 下一次等待的秒数
+    def next(self):
+        if self.jitter:
+            self.sleep = min(self.cap, self.rng.uniform(self.base, self.sleep * 3))
+        else:
+            self.sleep = min(self.cap, self.base * 2 ** self.attempt)
+        self.attempt += 1
+        return self.sleep
+
+    def reset(self):
+        self.attempt = 0
+        self.sleep = self.base
+
+
+class ReconnectGate:
+    # limit 为同时进行中的重连数上限，None 表示不限制 (只统计)；多进程时按进程数平分 (share)
+    def __init__(self, limit=DEFAULT_MAX_CONNECTING, share=1.0):
+        self.limit = max(1, int(limit * share)) if limit else None
+        self.active = 0
+        self.peak = 0
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self.limit:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.limit)
+            await self._semaphore.acquire()
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+# 从 config.ini 的 [Reconnect] 段创建退避，未配置时使用默认值
+def backoff_from_config(config):
+    section = config['Reconnect'] if config.has_section('Reconnect') else {}
+    return Backoff(float(section.get('base', DEFAULT_BASE)), float(section.get('cap', DEFAULT_CAP)))
+
+
+class ConnectionSupervisor:
+    # gate 为同一进程内共用的 ReconnectGate；backoff 默认为 decorrelated jitter
+    def __init__(self, client, gate=None, backoff=None, connect_timeout=CONNECT_TIMEOUT):
+        self.client = client
+        self.gate = gate
+        self.backoff = backoff or Backoff()
+        self.connect_timeout = connect_timeout
+        # 每次断开到恢复连接的秒数
+        self.recoveries = collections.deque(maxlen=DEFAULT_SAMPLES)
+        self.stats = {"disconnects": 0, "attempts": 0, "failures": 0, "reconnects": 0, "downtime_s": 0.0}
+        self.down_since = None
+        self._down = None
+        self._attempt = None
+        self._reconnecting = False
+        self._next_connect = None
+        self._next_disconnect = None
+
+    # 接管客户端的 on_connect / on_disconnect (原回调仍会被调用)；在设置完原回调之后调用
+    def attach(self, client=None):
+        client = client or self.client
+        self._down = asyncio.Event()
+        if client.on_connect != self._on_connect:
+            self._next_connect = client.on_connect
+            client.on_connect = self._on_connect
+        if client.on_disconnect != self._on_disconnect:
+            self._next_disconnect = client.on_disconnect
+            client.on_disconnect = self._on_disconnect
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if self._next_connect:
+            self._next_connect(client, userdata, flags, rc)
+        if self._attempt is not None and not self._attempt.done():
+            self._attempt.set_result(rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self._next_disconnect:
+            self._next_disconnect(client, userdata, rc)
+        # rc == 0 为主动断开，不重连；重连过程中的失败由 _reconnect 处理 (不用等到超时)
+        if self._attempt is not None and not self._attempt.done():
+            self._attempt.set_result(None)
+        if rc == 0 or self._reconnecting:
+            return
+        self.stats["disconnects"] += 1
+        self.down_since = time.monotonic()
+        self._down.set()
+
+    # 后台任务：每次意外断开后重连直到成功
+    async def run(self):
+        while True:
+            await self._down.wait()
+            self._down.clear()
+            await self._reconnect()
+
+    async def _reconnect(self):
+        loop = asyncio.get_running_loop()
+        self._reconnecting = True
+        try:
+            while True:
+                await asyncio.sleep(self.backoff.next())
+                rc = None
+                if self.gate:
+                    async with self.gate:
+                        rc = await self._try_connect(loop)
+                else:
+                    rc = await self._try_connect(loop)
+                if rc == 0:
+                    break
+                self.stats["failures"] += 1
+        finally:
+            self._reconnecting = False
+        self.backoff.reset()
+        recovery = time.monotonic() - self.down_since
+        self.recoveries.append(recovery)
+        self.stats["reconnects"] += 1
+        self.stats["downtime_s"] += recovery
+        self.down_since = None
+
+    # 发起一次重连并等待 CONNACK，返回 rc；连接被拒绝或超时返回 None
+    async def _try_connect(self, loop):
+        self.stats["attempts"] += 1
+        self._attempt = loop.create_future()
+        try:
+            self.client.reconnect()
+            return await asyncio.wait_for(self._attempt, self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            # 已建立 TCP 但没等到 CONNACK 时关闭 socket，下次重新连接
+            self.client.disconnect()
+            return None
+        finally:
+            self._attempt = None
+
+    def metrics(self):
+        latency = percentiles(list(self.recoveries), (50, 99))
+        return {"mqtt.reconnects": self.stats["reconnects"], "mqtt.reconnectAttempts": self.stats["attempts"],
+                "mqtt.reconnectFailures": self.stats["failures"],
+                "mqtt.downtimeS": round(self.stats["downtime_s"], 3),
+                "mqtt.recoveryP50Ms": latency["p50_ms"], "mqtt.recoveryP99Ms": latency["p99_ms"]}
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+# tb_replay.py
+#
+# 历史遥测回放：把记录下来的传感器数据 (CSV、JSONL 或紧凑列式文件) 按原速、加速或最快速度
+# 经网关接口 v1/gateway/telemetry 重新发送，时间戳保留原值或平移到回放开始时刻。
+# 输入文件可达数 GB，全部以 mmap 按顺序流式读取，内存中只保留当前一行 (列式文件为当前一个数据块)。
+# 回放器复用 GatewaySimulator 的连接、流控、子设备注册和合并发送，子设备在数据中第一次出现时注册。
+#
+# 输入格式 (记录需按时间排序):
+#   csv:   表头包含 ts、device 列，其余列为遥测键，空值表示该行没有这个键
+#   jsonl: 每行 {"ts": ..., "device": "...", "values": {...}}，没有 values 时 ts / device 以外的键都是遥测值
+#   tbr:   本模块的列式格式 (ColumnarWriter 生成)，数值按块存为定长数组，读取时直接映射不解析文本
+# ts 可以是毫秒、秒 (小于 1e11) 或 ISO 8601 字符串 (不带时区时按 UTC)。
+#
+# 列式文件布局 (小端):
+#   b'TBRC' | 数据块 ... | 尾部 JSON | uint64 尾部长度 | b'TBRC'
+#   数据块 (8 字节对齐): uint32 条数 n, uint32 键数 k, uint32 键编号[k] (补齐到 8 字节),
+#                        int64 ts[n], uint32 设备编号[n] (补齐到 8 字节), float64 值[k][n] (NaN 表示缺失)
+#   尾部 JSON: {"version": 1, "devices": [...], "keys": [...], "blocks": [[偏移, 条数], ...], "records": N,
+#               "first_ts": ..., "last_ts": ...}
+
+import asyncio
+import csv
+import datetime
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from gw_sim import BURST, GatewaySimulator
+from tb_batch import BatchPublisher
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_loads = orjson.loads if orjson else json.loads
+
+MAGIC = b'TBRC'
+VERSION = 1
+FORMATS = ('csv', 'jsonl', 'tbr')
+TIMESTAMPS = ('original', 'rebase')
+# 列式文件每块的记录数
+DEFAULT_BLOCK_SIZE = 65536
+
+_BLOCK_HEADER = struct.Struct('<II')
+_FOOTER = struct.Struct('<Q4s')
+
+
+# 统一为毫秒时间戳
+def parse_ts(value):
+    if isinstance(value, (int, float)):
+        return int(value * 1000) if value < 1e11 else int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return parse_ts(int(text))
+    try:
+        return parse_ts(float(text))
+    except ValueError:
+        pass
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    moment = datetime.datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+# CSV 单元格转为数值 / 布尔值，其他保留字符串
+def _cell(text):
+    try:
+        return int(text) if text.lstrip('-').isdigit() else float(text)
+    except ValueError:
+        pass
+    lowered = text.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    return text
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mm, 'madvise'):
+        # 只按顺序读一遍：提示内核加大预读，读过的页可以尽早回收
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+class _MappedSource:
+    # 迭代产生 (毫秒时间戳, 设备名, {键: 值})；position() 为已读取的字节数，用于进度
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.mm = None
+
+    def position(self):
+        return self.mm.tell() if self.mm is not None else 0
+
+    def _lines(self):
+        self.mm = _map(self.path)
+        if self.mm is None:
+            return
+        try:
+            yield from iter(self.mm.readline, b'')
+        finally:
+            self.mm.close()
+            self.mm = None
+
+
+class CsvSource(_MappedSource):
+    def __init__(self, path, ts_column='ts', device_column='device'):
+        super().__init__(path)
+        self.ts_column = ts_column
+        self.device_column = device_column
+
+    def __iter__(self):
+        # 第一行可能带 BOM
+        lines = (line.decode('utf-8-sig' if not n else 'utf-8') for n, line in enumerate(self._lines()))
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        try:
+            ts_at, device_at = header.index(self.ts_column), header.index(self.device_column)
+        except ValueError:
+            raise ValueError(f"CSV 表头缺少 {self.ts_column} 或 {self.device_column} 列: {self.path}")
+        keys = [(i, key) for i, key in enumerate(header) if i not in (ts_at, device_at)]
+        width = len(header)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            yield parse_ts(row[ts_at]), row[device_at], {key: _cell(row[i]) for i, key in keys if row[i]}
+
+
+class JsonlSource(_MappedSource):
+    def __init__(self, path, ts_column='ts', device_column='device'):
+        super().__init__(path)
+        self.ts_column = ts_column
+        self.device_column = device_column
+
+    def __iter__(self):
+        ts_key, device_key = self.ts_column, self.device_column
+        for line in self._lines():
+            if not line.strip():
+                continue
+            item = _loads(line)
+            values = item.get('values')
+            if values is None:
+                values = {k: v for k, v in item.items() if k not in (ts_key, device_key)}
+            yield parse_ts(item[ts_key]), item[device_key], values
+
+
+def _pad8(n):
+    return (n + 7) & ~7
+
+
+class ColumnarWriter:
+    # 流式写入列式文件：每 block_size 条写出一块；非数值 (字符串等) 的值无法存为 float64，跳过并计数
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        if sys.byteorder != 'little':
+            raise RuntimeError("列式文件只支持小端平台")
+        self.path = path
+        self.block_size = block_size
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC + b'\0' * 4)
+        self.devices, self.keys = {}, {}
+        self.blocks = []
+        self.stats = {"records": 0, "skipped": 0}
+        self.first_ts = self.last_ts = None
+        self._rows = []
+
+    def add(self, ts, device, values):
+        self._rows.append((ts, device, values))
+        if len(self._rows) >= self.block_size:
+            self._write_block()
+
+    def _write_block(self):
+        rows, self._rows = self._rows, []
+        if not rows:
+            return
+        devices, keys = self.devices, self.keys
+        used = {}
+        for _, _, values in rows:
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    if key not in used:
+                        used[key] = keys.setdefault(key, len(keys))
+                else:
+                    self.stats["skipped"] += 1
+        n = len(rows)
+        ts = array('q', (row[0] for row in rows))
+        device_ids = array('I', (devices.setdefault(row[1], len(devices)) for row in rows))
+        columns = []
+        for key in used:
+            column = array('d', [math.nan]) * n
+            for i, (_, _, values) in enumerate(rows):
+                value = values.get(key)
+                if isinstance(value, (int, float)):
+                    column[i] = value
+            columns.append(column)
+
+        offset = self.f.tell()
+        key_ids = array('I', used.values())
+        self.f.write(_BLOCK_HEADER.pack(n, len(key_ids)))
+        self.f.write(key_ids.tobytes().ljust(_pad8(4 * len(key_ids)), b'\0'))
+        self.f.write(ts.tobytes())
+        self.f.write(device_ids.tobytes().ljust(_pad8(4 * n), b'\0'))
+        for column in columns:
+            self.f.write(column.tobytes())
+        self.blocks.append([offset, n])
+        self.stats["records"] += n
+        if self.first_ts is None:
+            self.first_ts = ts[0]
+        self.last_ts = ts[-1]
+
+    def close(self):
+        if self.f.closed:
+            return
+        self._write_block()
+        footer = json.dumps({"version": VERSION, "devices": list(self.devices), "keys": list(self.keys),
+                             "blocks": self.blocks, "records": self.stats["records"],
+                             "first_ts": self.first_ts, "last_ts": self.last_ts},
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.f.write(footer)
+        self.f.write(_FOOTER.pack(len(footer), MAGIC))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarSource:
+    # 整个文件映射到内存，各列直接从映射区转换为类型化视图 (memoryview.cast)，不复制数据
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise RuntimeError("列式文件只支持小端平台")
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._position = 0
+        with open(path, 'rb') as f:
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"不是列式回放文件: {path}")
+            f.seek(-_FOOTER.size - length, os.SEEK_END)
+            self.meta = json.loads(f.read(length))
+        self.devices = self.meta['devices']
+        self.keys = self.meta['keys']
+
+    def __len__(self):
+        return self.meta['records']
+
+    def position(self):
+        return self._position
+
+    # 逐块产生 (ts 视图, 设备编号视图, [(键, 值视图)])
+    def blocks(self):
+        mm = _map(self.path)
+        view = memoryview(mm)
+        try:
+            for offset, n in self.meta['blocks']:
+                self._position = offset
+                count, nkeys = _BLOCK_HEADER.unpack_from(mm, offset)
+                at = offset + _BLOCK_HEADER.size
+                key_ids = view[at:at + 4 * nkeys].cast('I')
+                at += _pad8(4 * nkeys)
+                ts = view[at:at + 8 * count].cast('q')
+                at += 8 * count
+                device_ids = view[at:at + 4 * count].cast('I')
+                at += _pad8(4 * count)
+                columns = []
+                for key_id in key_ids:
+                    columns.append((self.keys[key_id], view[at:at + 8 * count].cast('d')))
+                    at += 8 * count
+                yield ts, device_ids, columns
+                del key_ids, ts, device_ids, columns
+            self._position = self.size
+        finally:
+            view.release()
+            try:
+                mm.close()
+            except BufferError:
+                # 提前结束迭代时调用方仍持有某块的视图，由垃圾回收关闭
+                pass
+
+    def __iter__(self):
+        devices = self.devices
+        for ts, device_ids, columns in self.blocks():
+            keys = [key for key, _ in columns]
+            rows = zip(*(column for _, column in columns)) if columns else [()] * len(ts)
+            for i, row in enumerate(rows):
+                # NaN 不等于自身，表示该记录没有这个键
+                yield ts[i], devices[device_ids[i]], {k: v for k, v in zip(keys, row) if v == v}
+
+
+# 按扩展名选择读取方式 (.csv / .jsonl / .ndjson / .tbr)，fmt 可显式指定
+def open_source(path, fmt=None, ts_column='ts', device_column='device'):
+    if not fmt:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.tbr': 'tbr'}.get(ext)
+    if fmt == 'csv':
+        return CsvSource(path, ts_column, device_column)
+    if fmt == 'jsonl':
+        return JsonlSource(path, ts_column, device_column)
+    if fmt == 'tbr':
+        return ColumnarSource(path)
+    raise ValueError(f"无法识别的回放文件格式: {path}，可选: {', '.join(FORMATS)}")
+
+
+# 把 CSV / JSONL 转换为列式文件，返回写入的统计
+def convert(source, path, block_size=DEFAULT_BLOCK_SIZE):
+    with ColumnarWriter(path, block_size) as writer:
+        for ts, device, values in source:
+            writer.add(ts, device, values)
+    return writer.stats
+
+
+# 回放速度: "1"、"10x"、"max" (不等待，只受流控限制)；max 返回 None
+def parse_speed(text):
+    text = str(text).strip().lower()
+    if text in ('max', '0', 'inf'):
+        return None
+    speed = float(text.rstrip('x'))
+    if speed <= 0:
+        raise ValueError(f"无效的回放速度: {text}")
+    return speed
+
+
+class TelemetryReplayer(GatewaySimulator):
+    # speed 为加速倍数，None 表示最快；timestamps="original" 保留原时间戳，
+    # "rebase" 把第一条记录平移到回放开始时刻，间隔按 speed 缩短 (与实际发送时间一致)
+    def __init__(self, client, source, speed=1.0, timestamps='original', batch_size=500, linger=0.2,
+                 progress_every=5.0, **kwargs):
+        if timestamps not in TIMESTAMPS:
+            raise ValueError(f"未知的时间戳方式: {timestamps}，可选: {', '.join(TIMESTAMPS)}")
+        # 子设备事先未知，第一次出现时注册
+        kwargs['registration'] = 'lazy'
+        super().__init__(client, [], **kwargs)
+        self.source = source
+        self.speed = speed
+        self.timestamps = timestamps
+        self.progress_every = progress_every
+        if self.batcher is None:
+            self.batcher = BatchPublisher(self.publish_payload, batch_size=batch_size, linger=linger,
+                                          encoder=self.encoder)
+        self.index = {}
+        self.stats.update({"records": 0, "devices": 0, "lag_s": 0.0, "first_ts": None, "last_ts": None,
+                           "elapsed_s": 0.0})
+        self._last_report = None
+
+    # 子设备下标，第一次出现时加入列表
+    def _device(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.sensors)
+            self.sensors.append(name)
+            self.registered.append(0)
+            self.stats["devices"] += 1
+        return index
+
+    def _emit(self, ts, device, values):
+        index = self._device(device)
+        if not self.registered[index]:
+            self._register(index)
+        self.batcher.add(device, ts, values)
+        self.stats["published"] += 1
+
+    def _progress(self, now, final=False):
+        stats = self.stats
+        elapsed = now - self._started
+        rate = stats["records"] / elapsed if elapsed > 0 else 0.0
+        size = self.source.size
+        done = 100.0 if final or not size else 100.0 * self.source.position() / size
+        span = (stats["last_ts"] - stats["first_ts"]) / 1000 if stats["last_ts"] is not None else 0.0
+        print(f"[INFO] 回放{'完成' if final else '进度'}: {done:.1f}%, {stats['records']:,} 条, "
+              f"{stats['devices']} 个子设备, {rate:,.0f} 条/秒, {self.batcher.stats['payloads']:,} 条消息, "
+              f"数据时间跨度 {span:,.0f} s (实际 {span / elapsed if elapsed > 0 else 0:.1f} 倍速), "
+              f"最大落后 {stats['lag_s']:.2f} s")
+        self._last_report = now
+
+    # 回放主循环 (替代定时调度)：按记录时间计算每条的发送时刻，提前到达的等待，
+    # 落后时立即发送并记录最大落后时间；每 BURST 条或等待时让出事件循环
+    async def schedule(self, duration=None):
+        flow, batcher, stats = self.flow, self.batcher, self.stats
+        speed, rebase = self.speed, self.timestamps == 'rebase'
+        self._started = self._last_report = started = time.monotonic()
+        start_ms = int(time.time() * 1000)
+        self.stats["started"] = time.time()
+        deadline = started + duration if duration else None
+        first = None
+        burst = 0
+        for ts, device, values in self.source:
+            if first is None:
+                first = stats["first_ts"] = ts
+            offset = (ts - first) / 1000
+            now = time.monotonic()
+            if speed:
+                offset /= speed
+                due = started + offset
+                if due > now:
+                    burst = 0
+                while due > now and not (deadline and now >= deadline):
+                    # 等待期间按 linger 发出未满的批次
+                    wake = min(due, now + batcher.poll())
+                    if deadline:
+                        wake = min(wake, deadline)
+                    await asyncio.sleep(wake - now)
+                    now = time.monotonic()
+                stats["lag_s"] = max(stats["lag_s"], now - due)
+            if deadline and now >= deadline:
+                break
+            if not flow.ready():
+                await flow.wait()
+                burst = 0
+            elif burst >= BURST:
+                # 最快速度时也要定期让出事件循环处理 PUBACK 等网络读写
+                batcher.poll()
+                await asyncio.sleep(0)
+                burst = 0
+            self._emit(start_ms + int(offset * 1000) if rebase else ts, device, values)
+            stats["records"] += 1
+            stats["last_ts"] = ts
+            burst += 1
+            if self.progress_every and now - self._last_report >= self.progress_every:
+                self._progress(now)
+        batcher.flush()
+        # 等最后几批确认后再返回 (随后会断开连接)，未确认的 QoS1 消息断开后会丢失
+        waited = time.monotonic()
+        while flow.inflight and time.monotonic() - waited < flow.ack_timeout:
+            await asyncio.sleep(0.05)
+        stats["elapsed_s"] = time.monotonic() - started
+        self._progress(time.monotonic(), final=True)
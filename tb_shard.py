@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# tb_shard.py
+#
+# 大规模模拟的多连接分片：子设备按一致性哈希分配到 N 个网关身份 (各自一条 MQTT 连接)，
+# N 个连接再分给 M 个工作进程，每个进程运行自己的 asyncio 事件循环和 paho 客户端。
+# 同样的网关列表下，子设备重启后仍落在同一个连接上。各进程的统计通过队列汇总到父进程。
+
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import queue
+import random
+import time
+
+from tb_batch import BatchPublisher
+from tb_encode import get_encoder
+from tb_flow import RateLimit, percentiles
+from tb_loadgen import MqttLoadGenerator
+from tb_reconnect import ConnectionSupervisor, ReconnectGate, mqtt_client
+
+# 每个进程回传父进程的延迟样本上限，避免队列传输过大
+LATENCY_SAMPLE = 100000
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+# 一致性哈希环，每个节点放置 vnodes 个虚拟节点使分布均匀
+class HashRing:
+    def __init__(self, nodes, vnodes=160):
+        self.nodes = list(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self.keys = [p[0] for p in points]
+        self.owners = [p[1] for p in points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self.keys, _hash(key)) % len(self.keys)
+        return self.owners[index]
+
+
+# 把子设备按一致性哈希分到各网关：{网关名: [子设备]}
+def shard_devices(devices, gateways, vnodes=160):
+    ring = HashRing(gateways, vnodes)
+    shards = {gateway: [] for gateway in gateways}
+    for device in devices:
+        shards[ring.node_for(device)].append(device)
+    return shards
+
+
+# 工作进程：在一个事件循环中运行分到本进程的所有网关连接，定期回报进度
+def _worker(worker_id, shards, options, results):
+    async def report_progress(generators):
+        while True:
+            await asyncio.sleep(1)
+            results.put(("progress", worker_id, {"published": sum(g.stats["published"] for g in generators),
+                                                 "errors": sum(g.stats["errors"] for g in generators)}))
+
+    async def main():
+        generators = []
+        # 全局 (租户) 限额按进程数平分，同一进程内的连接共用一份
+        global_limit = None
+        if options.get("global_rate_limit"):
+            global_limit = RateLimit(options["global_rate_limit"], share=1 / options.get("processes", 1))
+        # 重连并发上限同样按进程数平分；max_connecting 为 0 时不自动重连
+        gate = None
+        if options.get("max_connecting"):
+            gate = ReconnectGate(options["max_connecting"], share=1 / options.get("processes", 1))
+        for k, (gateway, token, sensors) in enumerate(shards):
+            # 压测不使用持久会话：每次运行从干净的会话开始，Broker 不为断开的压测连接保留消息
+            client = mqtt_client(gateway, token, persistent=False)
+            # 合成数据的随机序列按进程和连接区分，同一 seed 下每次压测相同
+            seed = None if options.get("seed") is None else [options["seed"], worker_id, k]
+            generator = MqttLoadGenerator(client, sensors, interval=options["interval"], qos=options["qos"],
+                                          payload_bytes=options["payload_bytes"], ramp_up=options["ramp_up"],
+                                          encoder=get_encoder(options.get("encoding", "json")),
+                                          max_inflight=options.get("max_inflight", 1000),
+                                          rate_limit=options.get("rate_limit"), global_limit=global_limit,
+                                          registration=options.get("registration", "eager"),
+                                          synthetic=options.get("synthetic", False), seed=seed,
+                                          supervisor=ConnectionSupervisor(client, gate) if gate else None)
+            if options["batch_size"]:
+                generator.batcher = BatchPublisher(generator.publish_payload, batch_size=options["batch_size"],
+                                                   encoder=generator.encoder)
+            generators.append(generator)
+        progress = asyncio.create_task(report_progress(generators))
+        runs = await asyncio.gather(*(g.run_load(options["host"], options["port"], options["duration"])
+                                      for g in generators))
+        progress.cancel()
+        return generators, runs
+
+    generators, runs = asyncio.run(main())
+    latencies = [x for g in generators for x in g.latencies]
+    if len(latencies) > LATENCY_SAMPLE:
+        latencies = random.sample(latencies, LATENCY_SAMPLE)
+    connections = [{"gateway": gateway, "sensors": len(sensors), "published": g.stats["published"],
+                    "acked": len(g.latencies), "errors": g.stats["errors"],
+                    "reconnects": g.supervisor.stats["reconnects"] if g.supervisor else 0}
+                   for (gateway, _, sensors), g in zip(shards, generators)]
+    results.put(("done", worker_id, {
+        "published": sum(r[0] for r in runs),
+        "acked": sum(r[1] for r in runs),
+        "errors": sum(r[2] for r in runs),
+        "elapsed": max(r[3] for r in runs),
+        "cpu_percent": runs[0][4],
+        "latencies": latencies,
+        "connections": connections,
+    }))
+
+
+# 启动 M 个工作进程运行分片压测，返回汇总报告
+# gateways: [(网关名/client id, access token 或 None)]
+def run_sharded(sensors, gateways, processes, options):
+    shards = shard_devices(sensors, [g[0] for g in gateways])
+    tokens = dict(gateways)
+    plan = [[] for _ in range(processes)]
+    for i, gateway in enumerate(shards):
+        plan[i % processes].append((gateway, tokens[gateway], shards[gateway]))
+
+    results = multiprocessing.Queue()
+    options = dict(options, processes=sum(1 for p in plan if p))
+    workers = [multiprocessing.Process(target=_worker, args=(i, plan[i], options, results), daemon=True)
+               for i in range(processes) if plan[i]]
+    for w in workers:
+        w.start()
+
+    progress, done = {}, {}
+    started = time.monotonic()
+    while len(done) < len(workers):
+        try:
+            kind, worker_id, data = results.get(timeout=1)
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                break
+            continue
+        if kind == "progress":
+            progress[worker_id] = data
+            published = sum(p["published"] for p in progress.values())
+            errors = sum(p["errors"] for p in progress.values())
+            print(f"[INFO] {len(progress)} 个进程累计发送 {published} 条 "
+                  f"({published / (time.monotonic() - started):.1f} msg/s), 失败 {errors} 条")
+        else:
+            done[worker_id] = data
+    for w in workers:
+        w.join(timeout=5)
+
+    acked = sum(d["acked"] for d in done.values())
+    elapsed = max((d["elapsed"] for d in done.values()), default=0)
+    sent = sum(d["published"] for d in done.values())
+    errors = sum(d["errors"] for d in done.values())
+    report = {
+        "processes": len(workers),
+        "connections": [c for d in done.values() for c in d["connections"]],
+        "sent": sent,
+        "acked": acked,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(acked / elapsed, 1) if elapsed > 0 else 0.0,
+        "error_rate": round(errors / (sent + errors), 6) if sent + errors else 0.0,
+        # 各进程 CPU 之和 (单核百分比)
+        "client_cpu_percent": round(sum(d["cpu_percent"] for d in done.values()), 1),
+        "failed_workers": len(workers) - len(done),
+        "reconnects": sum(c["reconnects"] for d in done.values() for c in d["connections"]),
+    }
+    report.update(percentiles([x for d in done.values() for x in d["latencies"]]))
+    return report
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# tb_shared.py
+#
+# 子设备共享属性 (SHARED_SCOPE) 本地缓存：启动时用一次 entitiesQuery 批量取回，
+# 之后由 MQTT 的 v1/gateway/attributes 推送 (tb_dispatch.GatewayDispatcher) 保持最新，读取只查本地字典，不发 HTTP 请求。
+# 每个子设备的条目带版本号 (每次变化加 1)，调用方可以据此判断配置是否变过。
+# 订阅在线时 (本次连接建立后同步或收到推送的条目) 一直有效；订阅断开期间可能漏掉推送，
+# 条目超过 ttl 秒后在下一次读取时重新从服务端取回，同时过期的条目合并为一次批量查询。
+# entitiesQuery 返回的属性值都是字符串，按 JSON 解析还原数值、布尔和对象，无法解析的保留字符串。
+
+import collections
+import json
+import threading
+import time
+
+import requests
+
+from tb_attrs import SHARED_SCOPE, query_attributes
+from tb_lookup import DeviceIndex
+from tb_log import get_logger
+
+log = get_logger("shared")
+
+# 订阅不在线时条目的有效期 (秒)
+DEFAULT_TTL = 300
+# 刷新失败后继续使用旧值，该秒数后再重试
+RETRY_INTERVAL = 30
+# 需要按名字查找的设备多于该数量时先一次性加载设备索引
+PRELOAD_THRESHOLD = 200
+
+# values: {键: 值}；version: 变化次数；synced: 最近一次与服务端一致的时间 (monotonic)
+Entry = collections.namedtuple('Entry', 'values version synced')
+
+_EMPTY = Entry({}, 0, 0.0)
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+class SharedAttributeCache:
+    # client 为 TBClient (批量取回用)；dispatcher 为 GatewayDispatcher，设置后订阅共享属性推送
+    def __init__(self, client=None, ttl=DEFAULT_TTL, dispatcher=None, index=None):
+        self.client = client
+        self.ttl = ttl
+        self.dispatcher = dispatcher
+        self.devices = index or (DeviceIndex(client) if client else None)
+        # 子设备名 -> Entry；更新时整体替换 Entry，读取不需要加锁
+        self.entries = {}
+        self.ids = {}           # 子设备名 -> 设备 ID
+        self.keys = set()       # 需要取回的键
+        self.listeners = []
+        self.stats = {"hits": 0, "misses": 0, "updates": 0, "refreshes": 0, "queries": 0}
+        self._lock = threading.Lock()
+        if dispatcher:
+            dispatcher.on_attributes(self.update)
+
+    # 属性变化时调用 listener(device, {变化的键: 值})，在推送或取回的线程中执行
+    def listen(self, listener):
+        self.listeners.append(listener)
+
+    def _live(self, entry):
+        subscribed = self.dispatcher.subscribed_at if self.dispatcher else None
+        return subscribed is not None and entry.synced >= subscribed
+
+    def _stale(self, entry, now):
+        return not self._live(entry) and now - entry.synced >= self.ttl
+
+    # 合并新值，返回变化的键值；replace=True 表示 values 为服务端的完整状态，缓存中多出的键删除
+    def _apply(self, device, values, replace=False, deleted=()):
+        with self._lock:
+            entry = self.entries.get(device, _EMPTY)
+            current = dict(entry.values)
+            changed = {k: v for k, v in values.items() if k not in current or current[k] != v}
+            current.update(changed)
+            removed = [k for k in (set(current) - set(values) if replace else deleted) if k in current]
+            for key in removed:
+                del current[key]
+            version = entry.version + 1 if changed or removed else entry.version
+            self.entries[device] = Entry(current, version, time.monotonic())
+            self.keys.update(values)
+        if changed:
+            for listener in self.listeners:
+                listener(device, changed)
+        return changed
+
+    # 批量取回一批子设备的共享属性 (devices 为名字列表或 {名字: 设备 ID})，返回取回的设备数
+    def load(self, devices, keys):
+        self.keys.update(keys)
+        ids = dict(devices) if isinstance(devices, dict) else {}
+        names = [name for name in devices if not ids.get(name)]
+        if len(names) > PRELOAD_THRESHOLD and not self.devices.complete:
+            self.devices.preload()
+        for name in names:
+            device_id = self.devices.get(name)
+            if device_id:
+                ids[name] = device_id
+        self.ids.update(ids)
+        return self._query(list(ids))
+
+    def _query(self, names):
+        by_id = {self.ids[name]: name for name in names}
+        missing = set(by_id)
+        for page in query_attributes(self.client, by_id, self.keys, SHARED_SCOPE):
+            self.stats["queries"] += 1
+            for device_id, latest in page:
+                self._apply(by_id[device_id], {k: _parse(v) for k, (v, _) in latest.items()}, replace=True)
+                missing.discard(device_id)
+        # 服务端已不存在的设备保留为空条目，不再反复查询
+        for device_id in missing:
+            self._apply(by_id[device_id], {}, replace=True)
+        return len(by_id) - len(missing)
+
+    # 重新取回所有过期的条目 (一次批量查询)；失败时保留旧值，RETRY_INTERVAL 秒后再试
+    def refresh(self):
+        now = time.monotonic()
+        names = [name for name, entry in self.entries.items() if name in self.ids and self._stale(entry, now)]
+        if not names or not self.client:
+            return 0
+        self.stats["refreshes"] += 1
+        try:
+            self._query(names)
+        except requests.exceptions.RequestException as e:
+            log.warning("刷新共享属性失败，继续使用本地缓存", error=e)
+            retry = now - self.ttl + RETRY_INTERVAL
+            with self._lock:
+                for name in names:
+                    entry = self.entries[name]
+                    self.entries[name] = entry._replace(synced=max(entry.synced, retry))
+        return len(names)
+
+    # 共享属性推送的处理函数 (GatewayDispatcher.on_attributes)；data 中的 deleted 为被删除的键列表
+    def update(self, device, data):
+        data = dict(data)
+        deleted = data.pop("deleted", None) or ()
+        self.stats["updates"] += 1
+        self._apply(device, data, deleted=deleted)
+
+    # 读取单个共享属性：本地命中直接返回；订阅不在线且条目过期时先批量刷新
+    def get(self, device, key, default=None):
+        entry = self.entries.get(device)
+        if entry is None:
+            self.stats["misses"] += 1
+            return default
+        if self._stale(entry, time.monotonic()) and self.client:
+            self.refresh()
+            entry = self.entries[device]
+        self.stats["hits"] += 1
+        return entry.values.get(key, default)
+
+    # 子设备的全部共享属性和版本号: ({键: 值}, 版本)
+    def snapshot(self, device):
+        entry = self.entries.get(device, _EMPTY)
+        return dict(entry.values), entry.version
+
+    def version(self, device):
+        return self.entries.get(device, _EMPTY).version
+
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# tb_store.py
+#
+# 遥测断网缓存 (store-and-forward)。发送失败的数据写入本地 SQLite (WAL 模式) 队列，
+# 网络恢复后按批量、限速补发。队列总字节数有上限，超出后按策略淘汰最旧或拒绝最新数据。
+
+import sqlite3
+import threading
+import time
+
+import requests
+
+from tb_encode import JsonEncoder
+from tb_log import get_logger
+from tb_reconnect import Backoff
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+log = get_logger("store")
+
+HTTP_CHANNEL = 'http'
+MQTT_CHANNEL = 'mqtt'
+# 死信 (被服务器拒绝、不再补发的数据) 单独存放，不计入待补发条数和缓存容量，超出条数上限时删除最旧的
+DEAD_LETTER_MAX = 1000
+
+# HTTP 发送结果
+SENT, RETRY, REJECTED = 'sent', 'retry', 'rejected'
+# 认证失败：Token 被轮换或吊销，重新获取凭据后可以重试
+AUTH_ERRORS = (401, 403)
+
+
+# 连接错误、超时、5xx、429 和认证失败可以重试；其余 4xx (请求体错误、消息过大) 重试也不会成功
+def retryable(error):
+    response = getattr(error, 'response', None)
+    return (response is None or response.status_code >= 500 or response.status_code == 429
+            or response.status_code in AUTH_ERRORS)
+
+
+class TelemetryStore:
+    def __init__(self, path='telemetry-store.db', max_bytes=64 * 1024 * 1024, eviction=DROP_OLDEST):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.stats = {"stored": 0, "sent": 0, "evicted": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS queue ('
+                        'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, topic TEXT, '
+                        'payload BLOB NOT NULL, created REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS queue_channel ON queue (channel, id)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS dead_letter ('
+                        'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload BLOB NOT NULL, '
+                        'error TEXT, created REAL NOT NULL)')
+        # 早先写在 queue 中的死信 (channel = 'http.dead') 移入 dead_letter
+        self.db.execute("INSERT INTO dead_letter (channel, payload, created) "
+                        "SELECT 'http', payload, created FROM queue WHERE channel = 'http.dead'")
+        self.db.execute("DELETE FROM queue WHERE channel = 'http.dead'")
+        self.dead_letters = self.db.execute('SELECT COUNT(*) FROM dead_letter').fetchone()[0]
+        # 各通道待补发条数和总字节数保存在内存中，避免每次 COUNT(*)
+        self.counts = {}
+        self.bytes = 0
+        for channel, count, size in self.db.execute(
+                'SELECT channel, COUNT(*), SUM(LENGTH(payload)) FROM queue GROUP BY channel'):
+            self.counts[channel] = count
+            self.bytes += size
+
+    # 写入一条待补发数据；channel 区分用途 (如 'http'、'mqtt')，topic 为 MQTT 主题
+    def put(self, channel, payload, topic=None):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        size = len(payload)
+        with self._lock:
+            if self.bytes + size > self.max_bytes:
+                if self.eviction == DROP_NEWEST or size > self.max_bytes:
+                    self.stats["rejected"] += 1
+                    return False
+                self._evict_locked(self.bytes + size - self.max_bytes)
+            self.db.execute('INSERT INTO queue (channel, topic, payload, created) VALUES (?, ?, ?, ?)',
+                            (channel, topic, payload, time.time()))
+            self.counts[channel] = self.counts.get(channel, 0) + 1
+            self.bytes += size
+            self.stats["stored"] += 1
+        return True
+
+    # 淘汰最旧的数据 (不分通道)，直到腾出 need 字节
+    def _evict_locked(self, need):
+        freed = 0
+        last_id = None
+        removed = {}
+        for row_id, channel, size in self.db.execute(
+                'SELECT id, channel, LENGTH(payload) FROM queue ORDER BY id'):
+            freed += size
+            removed[channel] = removed.get(channel, 0) + 1
+            last_id = row_id
+            if freed >= need:
+                break
+        if last_id is not None:
+            self.db.execute('DELETE FROM queue WHERE id <= ?', (last_id,))
+            self._forget_locked(removed, freed)
+            self.stats["evicted"] += sum(removed.values())
+
+    def _forget_locked(self, removed, freed):
+        for channel, count in removed.items():
+            self.counts[channel] -= count
+        self.bytes -= freed
+
+    # 按写入顺序取出某个通道最多 limit 条: [(id, topic, payload)]
+    def peek(self, channel, limit=500):
+        with self._lock:
+            return self.db.execute('SELECT id, topic, payload FROM queue WHERE channel = ? ORDER BY id LIMIT ?',
+                                   (channel, limit)).fetchall()
+
+    # 确认已发送，删除该通道中 id 不大于 last_id 的记录
+    def ack(self, channel, last_id):
+        with self._lock:
+            removed, freed = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM queue WHERE channel = ? AND id <= ?',
+                (channel, last_id)).fetchone()
+            self.db.execute('DELETE FROM queue WHERE channel = ? AND id <= ?', (channel, last_id))
+            self._forget_locked({channel: removed}, freed)
+            self.stats["sent"] += removed
+
+    # 补发一批：send(records) 返回 True 表示整批发送成功，之后才删除；返回发送条数
+    def drain_once(self, channel, send, batch_size=500):
+        records = self.peek(channel, batch_size)
+        if not records or not send(records):
+            return 0
+        self.ack(channel, records[-1][0])
+        return len(records)
+
+    # 持续补发直到通道为空、发送失败或已补发 limit 条；max_rate 限制每秒补发条数，避免恢复时冲垮服务器
+    def drain(self, channel, send, batch_size=500, max_rate=1000, limit=None):
+        total = 0
+        while True:
+            size = batch_size if limit is None else min(batch_size, limit - total)
+            if size <= 0:
+                return total
+            started = time.monotonic()
+            sent = self.drain_once(channel, send, size)
+            total += sent
+            if sent < size:
+                return total
+            pause = sent / max_rate - (time.monotonic() - started) if max_rate else 0
+            if pause > 0:
+                time.sleep(pause)
+
+    # 写入一条死信 (不补发)，保留最近 DEAD_LETTER_MAX 条供排查
+    def dead_letter(self, channel, payload, error=None):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            cursor = self.db.execute('INSERT INTO dead_letter (channel, payload, error, created) VALUES (?, ?, ?, ?)',
+                                     (channel, payload, error, time.time()))
+            removed = self.db.execute('DELETE FROM dead_letter WHERE id <= ?',
+                                      (cursor.lastrowid - DEAD_LETTER_MAX,)).rowcount
+            self.dead_letters += 1 - removed
+
+    # 待补发条数，不指定通道时为全部 (不含死信)
+    def depth(self, channel=None):
+        if channel is None:
+            return sum(self.counts.values())
+        return self.counts.get(channel, 0)
+
+    # 队列深度和字节数，供 tb_metrics 采集
+    def metrics(self):
+        data = {f"storage.depth.{channel}": count for channel, count in self.counts.items()}
+        data.update({"storage.messageCount": self.depth(), "storage.bytes": self.bytes,
+                     "storage.evicted": self.stats["evicted"], "storage.rejected": self.stats["rejected"],
+                     "storage.deadLetters": self.dead_letters})
+        return data
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+# HTTP 遥测发送 + 断网缓存：发送失败的读数 ({ts, values}) 写入队列，
+# 恢复后把积压读数合并成 JSON 数组批量 POST (设备遥测接口支持数组)
+# drain_limit 为每次 send() 顺带补发的最多条数 (默认一批)，积压很多时分摊到后续多次发送中
+# renew 为重新获取设备 Access Token 的函数，认证失败 (401 / 403) 时调用，数据保留在队列中等待重试
+class HttpTelemetrySender:
+    def __init__(self, client, access_token, store, batch_size=500, max_rate=1000, encoder=None, backoff=None,
+                 drain_limit=None, renew=None):
+        self.client = client
+        self.access_token = access_token
+        self.renew = renew
+        self._rejected_by = None
+        self.store = store
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.drain_limit = drain_limit or batch_size
+        self.stats = {"rejected": 0}
+        # HTTP 设备接口只接受 JSON，encoder 为 tb_encode 的 JSON 类编码器
+        self.encoder = encoder or JsonEncoder()
+        if self.encoder.content_type != 'application/json':
+            raise ValueError(f"HTTP 遥测接口不支持 {self.encoder.content_type} 编码")
+        # 连续失败时每次暂停的秒数逐渐加大 (带随机)，发送成功后复位；暂停期间的数据直接写入队列
+        self.backoff = backoff or Backoff()
+        self.retry_at = 0.0
+
+    # 发送一次，返回 SENT、RETRY (已按退避暂停请求) 或 REJECTED (服务器拒绝，不可重试)
+    def _post(self, body):
+        try:
+            self.client.post_telemetry_raw(self.access_token, body)
+        except requests.exceptions.RequestException as e:
+            if not retryable(e):
+                log.error("遥测数据被服务器拒绝，转入死信", status=e.response.status_code, error=e)
+                self._rejected_by = str(e)
+                return REJECTED
+            delay = self.backoff.next()
+            self.retry_at = time.monotonic() + delay
+            log.warning("遥测数据发送失败，暂停请求", retry_s=round(delay, 1), error=e)
+            if e.response is not None and e.response.status_code in AUTH_ERRORS:
+                self._renew()
+            return RETRY
+        self.backoff.reset()
+        return SENT
+
+    def _renew(self):
+        if not self.renew:
+            return
+        try:
+            self.access_token = self.renew() or self.access_token
+        except Exception as e:
+            log.warning("重新获取设备 Access Token 失败", error=e)
+
+    # 服务器拒绝 (不可重试的 4xx) 的数据转入死信表，不阻塞后面的数据
+    def _dead_letter(self, payload):
+        self.store.dead_letter(HTTP_CHANNEL, payload, self._rejected_by)
+        self.stats["rejected"] += 1
+
+    def _send_records(self, records):
+        result = self._post(b'[' + b','.join(r[2] for r in records) + b']')
+        if result != REJECTED:
+            return result == SENT
+        # 整批被拒时逐条重发，只把被拒的记录转入死信；遇到可重试的错误时确认已处理的部分后停止
+        for i, (row_id, _, payload) in enumerate(records):
+            result = self._post(payload) if len(records) > 1 else REJECTED
+            if result == RETRY:
+                if i:
+                    self.store.ack(HTTP_CHANNEL, records[i - 1][0])
+                return False
+            if result == REJECTED:
+                self._dead_letter(payload)
+        return True
+
+    # 发送一条遥测；返回 True 表示已送达，False 表示已写入缓存等待补发 (或被服务器拒绝转入死信)
+    def send(self, values, ts=None):
+        reading = self.encoder.telemetry(values, ts or int(time.time() * 1000))
+        if time.monotonic() < self.retry_at:
+            self.store.put(HTTP_CHANNEL, reading)
+            return False
+        # 有积压时先入队再补发一部分，保证发送顺序
+        if self.store.depth(HTTP_CHANNEL):
+            self.store.put(HTTP_CHANNEL, reading)
+            return self.flush(self.drain_limit)
+        result = self._post(reading)
+        if result == SENT:
+            return True
+        if result == REJECTED:
+            self._dead_letter(reading)
+        else:
+            self.store.put(HTTP_CHANNEL, reading)
+        return False
+
+    # 补发积压数据 (最多 limit 条，None 为全部)，返回队列是否已清空
+    def flush(self, limit=None):
+        sent = self.store.drain(HTTP_CHANNEL, self._send_records, self.batch_size, self.max_rate, limit)
+        if sent:
+            log.info("已补发缓存遥测", sent=sent, remaining=self.store.depth(HTTP_CHANNEL))
+        return self.store.depth(HTTP_CHANNEL) == 0
+
+
+# 从 config.ini 的 [Storage] 段创建缓存队列，未配置时使用默认值
+def store_from_config(config, default_path='telemetry-store.db'):
+    section = config['Storage'] if config.has_section('Storage') else {}
+    return TelemetryStore(section.get('path', default_path),
+                          max_bytes=int(section.get('max_mb', 64)) * 1024 * 1024,
+                          eviction=section.get('eviction', DROP_OLDEST))
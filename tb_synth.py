@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# tb_synth.py
+#
+# 合成传感器数据：用 NumPy 一次向量化计算全部 N 个传感器的下一步状态，代替每个传感器每拍在 Python 中计算的锯齿波。
+# 每个键由 SignalModel 描述，读数 = 基线 + 传感器偏差 + 日变化 + 随机游走 + 突变 + 测量噪声，再截断到量程并按分辨率取整：
+#   日变化:   cosine 为以 peak_hour 为峰值的余弦；office 只在工作时间 (8:00-18:00) 升高 (CO2、TVOC 随人员变化)
+#   随机游走: Ornstein-Uhlenbeck 过程，按时间常数 revert 回归基线；按精确解更新，统计特性与步长无关
+#   突变:     按每小时 spike_rate 次的泊松过程出现 (开窗、做饭、喷雾等)，幅度为指数分布，之后按 spike_decay 指数衰减
+#   丢包:     每一步每个传感器以 dropout 概率整条缺失 (NaN)，模拟 LoRaWAN 上行丢失
+# 每个传感器的基线偏差和日变化相位各不相同。相同的 seed 产生完全相同的序列。
+# NumPy 为可选依赖：未安装时 GatewaySimulator 仍使用 gw_sim.default_values。
+
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 工作时间 (office 日变化)
+OFFICE_START = 8.0
+OFFICE_END = 18.0
+
+
+class SignalModel:
+    # base: 平均值；spread: 各传感器基线偏差的标准差；diurnal: 日变化幅度 (负数表示峰值处最低)；peak_hour: 峰值钟点
+    # walk: 随机游走强度 (每 √秒 的标准差)；revert: 回归基线的时间常数 (秒)；noise: 每次读数的测量噪声标准差
+    # spike_rate: 每小时突变次数；spike: 突变幅度均值；spike_decay: 突变衰减时间常数 (秒)
+    # lo / hi: 量程；decimals: 保留的小数位数 (0 时输出整数)
+    def __init__(self, base, spread=0.0, diurnal=0.0, peak_hour=14.0, shape="cosine", walk=0.0, revert=3600.0,
+                 noise=0.0, spike_rate=0.0, spike=0.0, spike_decay=600.0, lo=None, hi=None, decimals=1):
+        if shape not in ("cosine", "office"):
+            raise ValueError(f"未知的日变化形状: {shape}")
+        self.base = base
+        self.spread = spread
+        self.diurnal = diurnal
+        self.peak_hour = peak_hour
+        self.shape = shape
+        self.walk = walk
+        self.revert = revert
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.spike = spike
+        self.spike_decay = spike_decay
+        self.lo = lo
+        self.hi = hi
+        self.decimals = decimals
+
+
+# AM308 室内环境传感器 (TVOC 为 IAQ 等级 0-5，与 milesight_codec 的 0x087D 格式一致)
+AM308_MODELS = {
+    "temperature": SignalModel(23.0, spread=1.5, diurnal=1.5, peak_hour=15, walk=0.005, revert=1800, noise=0.05,
+                               lo=-20, hi=60, decimals=1),
+    "humidity": SignalModel(45.0, spread=5.0, diurnal=-6.0, peak_hour=15, walk=0.02, revert=3600, noise=0.3,
+                            lo=0, hi=100, decimals=1),
+    "co2": SignalModel(450, spread=30, diurnal=500, peak_hour=13, shape="office", walk=0.5, revert=1800, noise=8,
+                       spike_rate=0.5, spike=300, spike_decay=900, lo=400, hi=5000, decimals=0),
+    "tvoc": SignalModel(1.2, spread=0.1, diurnal=0.5, shape="office", walk=0.002, revert=1800, noise=0.03,
+                        spike_rate=0.3, spike=1.0, spike_decay=600, lo=0, hi=5, decimals=2),
+    "pm2_5": SignalModel(8, spread=3, diurnal=4, peak_hour=19, walk=0.05, revert=3600, noise=1,
+                         spike_rate=0.2, spike=40, spike_decay=1200, lo=0, hi=1000, decimals=0),
+}
+
+
+def _diurnal(shape, hours, peak_hour):
+    if shape == "office":
+        # 上班时段内为半个正弦周期，其余时间为 0
+        x = (hours - OFFICE_START) / (OFFICE_END - OFFICE_START)
+        return np.where((x > 0) & (x < 1), np.sin(np.pi * np.clip(x, 0, 1)), 0.0)
+    return np.cos((hours - peak_hour) * (2 * np.pi / 24))
+
+
+class SyntheticGenerator:
+    # sensors 为传感器数量或名字列表；seed 为整数或整数序列 (多进程时 [seed, 进程号])，None 时每次运行不同
+    # utc_offset 为日变化所用时区相对 UTC 的秒数，默认本机时区
+    def __init__(self, sensors, models=None, seed=None, dropout=0.0, utc_offset=None):
+        if np is None:
+            raise ImportError("合成数据需要 NumPy: pip install numpy")
+        self.names = [f"Sensor{i}" for i in range(sensors)] if isinstance(sensors, int) else list(sensors)
+        self.n = len(self.names)
+        self.models = dict(models or AM308_MODELS)
+        self.keys = list(self.models)
+        self.dropout = dropout
+        self.utc_offset = -time.timezone if utc_offset is None else utc_offset
+        self.rng = np.random.default_rng(seed)
+        n, rng = self.n, self.rng
+        # 每个传感器的日变化相位偏差 (小时) 和各键的基线偏差；游走和突变为随时间演化的状态
+        self.phase = rng.normal(0.0, 0.5, n)
+        self.offsets = {key: rng.normal(0.0, m.spread, n) if m.spread else np.zeros(n)
+                        for key, m in self.models.items()}
+        self.walks = {key: np.zeros(n) for key in self.keys}
+        self.spikes = {key: np.zeros(n) for key in self.keys}
+        # 最近一步的时间和各键的读数 (NaN 为丢包)
+        self.t = None
+        self.columns = {}
+        self.present = np.ones(n, dtype=bool)
+        self.stats = {"steps": 0, "readings": 0, "dropped": 0, "spikes": 0}
+        self._index = None
+        self._rows = None
+        # 每个传感器最近一次取值所用的步序号 (stats["steps"])
+        self._taken = [0] * n
+
+    # 把全部传感器推进到时间 now (秒)，返回 {键: ndarray}
+    def step(self, now=None):
+        now = time.time() if now is None else now
+        dt = 0.0 if self.t is None else max(0.0, now - self.t)
+        n, rng = self.n, self.rng
+        hours = ((now + self.utc_offset) / 3600.0 + self.phase) % 24
+        columns = {}
+        for key, m in self.models.items():
+            walk, spike = self.walks[key], self.spikes[key]
+            if dt and m.walk:
+                decay = np.exp(-dt / m.revert)
+                walk *= decay
+                walk += rng.standard_normal(n) * (m.walk * np.sqrt(m.revert / 2 * (1 - decay * decay)))
+            if m.spike_rate:
+                if dt:
+                    spike *= np.exp(-dt / m.spike_decay)
+                    hits = np.flatnonzero(rng.random(n) < -np.expm1(-m.spike_rate / 3600 * dt))
+                    if hits.size:
+                        spike[hits] += rng.exponential(m.spike, hits.size)
+                        self.stats["spikes"] += hits.size
+            value = m.base + self.offsets[key] + walk
+            if m.spike_rate:
+                value += spike
+            if m.diurnal:
+                value += m.diurnal * _diurnal(m.shape, hours, m.peak_hour)
+            if m.noise:
+                value += rng.standard_normal(n) * m.noise
+            if m.lo is not None or m.hi is not None:
+                np.clip(value, m.lo, m.hi, out=value)
+            columns[key] = np.round(value, m.decimals)
+        if self.dropout:
+            self.present = rng.random(n) >= self.dropout
+            missing = ~self.present
+            for column in columns.values():
+                column[missing] = np.nan
+            self.stats["dropped"] += int(missing.sum())
+        self.t = now
+        self.columns = columns
+        self._rows = None
+        self.stats["steps"] += 1
+        self.stats["readings"] += n
+        return columns
+
+    # 最近一步按传感器排列的读数: [(值, ...)]，整数键为 int
+    def rows(self):
+        if self._rows is None:
+            lists = []
+            for key in self.keys:
+                column = self.columns[key]
+                if self.models[key].decimals == 0:
+                    column = np.nan_to_num(column).astype(np.int64)
+                lists.append(column.tolist())
+            self._rows = list(zip(*lists))
+        return self._rows
+
+    # GatewaySimulator 的 make_values：返回该传感器的读数，丢包时返回 {}
+    # 传感器已取过最近一步时推进全部传感器，每次取值都得到新的一步，与调度提前或推迟无关；
+    # 各传感器按相同间隔取值时每个间隔只计算一步，发送间隔较长的传感器跳过的步不影响统计特性
+    def values(self, sensor_name, now):
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.names)}
+        index = self._index[sensor_name]
+        if self._taken[index] >= self.stats["steps"]:
+            self.step(now)
+        self._taken[index] = self.stats["steps"]
+        if not self.present[index]:
+            return {}
+        return dict(zip(self.keys, self.rows()[index]))
+
+
+# 从 config.ini 的 [Synthetic] 段创建生成器；seed 为空时每次运行不同
+def synthetic_from_config(config, sensors):
+    section = config['Synthetic'] if config.has_section('Synthetic') else {}
+    seed = str(section.get('seed', '')).strip()
+    return SyntheticGenerator(sensors, seed=int(seed) if seed else None, dropout=float(section.get('dropout', 0)))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# tb_tick.py
+#
+# 定时发送的节拍：按绝对截止时间计算每一拍 (start + k * interval)，工作耗时不会累积成漂移；
+# 每个设备按相位偏移分散在整个间隔内，避免同时启动的设备在同一时刻发送 (惊群)。
+# align=True 时对齐到墙上时钟的整间隔 (如每分钟的 :00、:10、:20 ...) 再加上相位偏移。
+# PublishSpread 统计发送时间的分布，峰值/均值越接近 1 越平滑。
+#
+# 相位方式:
+#   spread: 按下标均匀分布 (第 i 个设备偏移 interval * i / N)，分布最均匀
+#   hash:   按设备名哈希，重启或增减设备后偏移不变
+#   none:   不偏移 (全部同时发送)
+
+import collections
+import hashlib
+import math
+import random
+import time
+
+PHASES = ('spread', 'hash', 'none')
+
+
+# 按设备名哈希得到 [0, interval) 内稳定的偏移
+def hash_offset(key, interval):
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * interval
+
+
+def phase_offset(phase, index, count, key, interval):
+    if phase == 'spread':
+        return interval * index / count if count else 0.0
+    if phase == 'hash':
+        return hash_offset(key, interval)
+    if phase == 'none':
+        return 0.0
+    raise ValueError(f"未知的相位方式: {phase}，可选: {', '.join(PHASES)}")
+
+
+# 第一拍的基准时间：align=True 时为下一个整间隔，否则为当前时间
+def first_tick(interval, now, align=False):
+    if align:
+        return math.ceil(now / interval) * interval
+    return now
+
+
+class Ticker:
+    # 阻塞循环使用: while True: ticker.wait(); ...
+    # offset 为相位偏移；jitter 为每拍附加的随机延迟上限 (秒)，不累积到后续节拍
+    def __init__(self, interval, offset=0.0, align=False, jitter=0.0, clock=time.time, sleep=time.sleep):
+        self.interval = interval
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.next = first_tick(interval, clock(), align) + offset
+        self.missed = 0
+
+    # 等到下一拍，返回本拍的计划时间；工作耗时超过一个间隔时跳过错过的节拍，不连续补发
+    def wait(self):
+        now = self.clock()
+        if now > self.next + self.interval:
+            skipped = int((now - self.next) / self.interval)
+            self.missed += skipped
+            self.next += skipped * self.interval
+        due = self.next
+        self.next += self.interval
+        fire = due + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if fire > now:
+            self.sleep(fire - now)
+        return due
+
+
+# 发送时间分布：按 resolution 秒分桶计数，保留最近 window 秒
+class PublishSpread:
+    def __init__(self, resolution=0.1, window=60.0):
+        self.resolution = resolution
+        self.counts = collections.deque(maxlen=max(2, int(window / resolution)))
+        self.slot = None
+
+    def record(self, now, n=1):
+        slot = int(now / self.resolution)
+        if slot != self.slot:
+            if self.slot is not None:
+                self.counts.extend([0] * min(slot - self.slot - 1, self.counts.maxlen))
+            self.counts.append(0)
+            self.slot = slot
+        self.counts[-1] += n
+
+    # peak_to_mean: 最忙的桶与平均值之比；cv: 各桶计数的变异系数 (不含当前未满的桶)
+    def report(self):
+        counts = list(self.counts)[:-1]
+        total = sum(counts)
+        if not total:
+            return {"peak_to_mean": None, "cv": None}
+        mean = total / len(counts)
+        std = math.sqrt(sum((c - mean) ** 2 for c in counts) / len(counts))
+        return {"peak_to_mean": round(max(counts) / mean, 2), "cv": round(std / mean, 3)}
+
+
+# 从 config.ini 的 [Schedule] 段读取发送间隔和节拍参数，返回设备 name 的 Ticker
+def ticker_from_config(config, name, interval=10.0):
+    section = config['Schedule'] if config.has_section('Schedule') else {}
+    interval = float(section.get('interval', interval))
+    phase = section.get('phase', 'hash')
+    align = str(section.get('align', 'false')).lower() in ('1', 'true', 'yes', 'on')
+    return Ticker(interval, offset=phase_offset(phase, 0, 1, name, interval), align=align,
+                  jitter=float(section.get('jitter', 0)))